@@ -0,0 +1,32 @@
+"""Unique pixel coordinates
+
+Revision ID: 006_unique_pixel_coords
+Revises: 005_add_pvp_pixels
+Create Date: 2024-01-20 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '006_unique_pixel_coords'
+down_revision = '005_add_pvp_pixels'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Удаляем дубликаты клеток, оставляя самую свежую запись
+    op.execute("""
+        DELETE FROM pixels p
+        USING pixels newer
+        WHERE p.x = newer.x AND p.y = newer.y AND p.id < newer.id
+    """)
+    
+    # Уникальный индекс по координатам нужен для INSERT ... ON CONFLICT (x, y)
+    op.drop_index('idx_pixel_coords', table_name='pixels')
+    op.create_index('idx_pixel_coords', 'pixels', ['x', 'y'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_pixel_coords', table_name='pixels')
+    op.create_index('idx_pixel_coords', 'pixels', ['x', 'y'], unique=False)
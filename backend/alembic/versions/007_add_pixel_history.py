@@ -0,0 +1,44 @@
+"""Add pixel history
+
+Revision ID: 007_add_pixel_history
+Revises: 006_unique_pixel_coords
+Create Date: 2024-01-21 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007_add_pixel_history'
+down_revision = '006_unique_pixel_coords'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'pixel_history',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('x', sa.Integer(), nullable=False),
+        sa.Column('y', sa.Integer(), nullable=False),
+        sa.Column('color', sa.String(length=7), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_pixel_history_cell_time', 'pixel_history', ['x', 'y', 'created_at'], unique=False)
+    op.create_index('idx_pixel_history_user_time', 'pixel_history', ['user_id', 'created_at'], unique=False)
+    
+    # Текущее состояние холста — начальная точка журнала
+    op.execute("""
+        INSERT INTO pixel_history (x, y, color, user_id, created_at)
+        SELECT x, y, color, user_id, COALESCE(created_at, now())
+        FROM pixels
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_pixel_history_user_time', table_name='pixel_history')
+    op.drop_index('idx_pixel_history_cell_time', table_name='pixel_history')
+    op.drop_table('pixel_history')
@@ -0,0 +1,63 @@
+"""Game lifecycle: archive table, active games index
+
+Revision ID: 008_game_lifecycle
+Revises: 007_add_pixel_history
+Create Date: 2024-01-22 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008_game_lifecycle'
+down_revision = '007_add_pixel_history'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Компактный архив законченных игр
+    op.create_table(
+        'game_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('code', sa.String(length=10), nullable=False),
+        sa.Column('mode', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('player1_id', sa.Integer(), nullable=False),
+        sa.Column('player2_id', sa.Integer(), nullable=True),
+        sa.Column('winner_id', sa.Integer(), nullable=True),
+        sa.Column('level_reached', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_game_archive_player1_id'), 'game_archive', ['player1_id'], unique=False)
+    op.create_index(op.f('ix_game_archive_player2_id'), 'game_archive', ['player2_id'], unique=False)
+    
+    # Результаты должны пережить перенос сессии в архив: внешний ключ с каскадным
+    # удалением заменяется индексом
+    op.drop_constraint('game_results_game_session_id_fkey', 'game_results', type_='foreignkey')
+    op.create_index(op.f('ix_game_results_game_session_id'), 'game_results', ['game_session_id'], unique=False)
+    
+    # Идущие игры — небольшая часть таблицы
+    op.create_index(
+        'ix_game_sessions_active',
+        'game_sessions',
+        [sa.text('COALESCE(updated_at, created_at)')],
+        unique=False,
+        postgresql_where=sa.text("status IN ('waiting', 'in_progress')")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_game_sessions_active', table_name='game_sessions')
+    op.drop_index(op.f('ix_game_results_game_session_id'), table_name='game_results')
+    # Результаты архивных игр не имеют сессии
+    op.execute('DELETE FROM game_results WHERE game_session_id NOT IN (SELECT id FROM game_sessions)')
+    op.create_foreign_key(
+        'game_results_game_session_id_fkey', 'game_results', 'game_sessions',
+        ['game_session_id'], ['id'], ondelete='CASCADE'
+    )
+    op.drop_index(op.f('ix_game_archive_player2_id'), table_name='game_archive')
+    op.drop_index(op.f('ix_game_archive_player1_id'), table_name='game_archive')
+    op.drop_table('game_archive')
@@ -0,0 +1,25 @@
+"""Sequences for game and team codes
+
+Revision ID: 009_code_sequences
+Revises: 008_game_lifecycle
+Create Date: 2024-01-23 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '009_code_sequences'
+down_revision = '008_game_lifecycle'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Номера кодов: 32^6 = 2^30 кодов из 6 символов (см. CodeService)
+    op.execute("CREATE SEQUENCE game_code_seq MINVALUE 0 START 0 MAXVALUE 1073741823")
+    op.execute("CREATE SEQUENCE team_code_seq MINVALUE 0 START 0 MAXVALUE 1073741823")
+
+
+def downgrade() -> None:
+    op.execute("DROP SEQUENCE IF EXISTS team_code_seq")
+    op.execute("DROP SEQUENCE IF EXISTS game_code_seq")
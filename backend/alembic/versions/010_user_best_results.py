@@ -0,0 +1,46 @@
+"""Add user best results
+
+Revision ID: 010_user_best_results
+Revises: 009_code_sequences
+Create Date: 2024-01-24 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010_user_best_results'
+down_revision = '009_code_sequences'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user_best_results',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('max_level', sa.Integer(), nullable=False),
+        sa.Column('first_achieved', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index(
+        'ix_user_best_results_rank',
+        'user_best_results',
+        [sa.text('max_level DESC'), 'first_achieved', 'user_id'],
+        unique=False
+    )
+    
+    # Лучший результат каждого игрока из истории игр
+    op.execute("""
+        INSERT INTO user_best_results (user_id, max_level, first_achieved)
+        SELECT DISTINCT ON (user_id) user_id, level_reached, COALESCE(created_at, now())
+        FROM game_results
+        WHERE level_reached > 0
+        ORDER BY user_id, level_reached DESC, created_at ASC
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_best_results_rank', table_name='user_best_results')
+    op.drop_table('user_best_results')
@@ -0,0 +1,58 @@
+"""Pixels keyed by cell coordinates
+
+Revision ID: 011_pixels_keyed_by_cell
+Revises: 010_user_best_results
+Create Date: 2024-01-25 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '011_pixels_keyed_by_cell'
+down_revision = '010_user_best_results'
+branch_labels = None
+depends_on = None
+
+# Свободное место на странице под новые версии строк: перекраска клетки остаётся
+# HOT-обновлением (без записи в индекс и без переноса строки на другую страницу)
+PIXELS_FILLFACTOR = 70
+
+
+def upgrade() -> None:
+    # Одиночные индексы не нужны: поиск по клетке и диапазонам идёт по (x, y),
+    # выборки по пользователю — через pixel_history; пользователи не удаляются,
+    # поэтому индекс для внешнего ключа user_id тоже не нужен
+    op.drop_index('ix_pixels_id', table_name='pixels')
+    op.drop_index('ix_pixels_x', table_name='pixels')
+    op.drop_index('ix_pixels_y', table_name='pixels')
+    op.drop_index('ix_pixels_user_id', table_name='pixels')
+
+    # Первичный ключ — координаты (уникальный индекс из 006 становится ключом без пересборки)
+    op.drop_constraint('pixels_pkey', 'pixels', type_='primary')
+    op.drop_column('pixels', 'id')
+    op.execute("ALTER TABLE pixels ADD CONSTRAINT pixels_pkey PRIMARY KEY USING INDEX idx_pixel_coords")
+
+    # fillfactor действует на новые страницы — CLUSTER переписывает таблицу сразу
+    # (заодно строки ложатся в порядке (x, y) для выборок фрагментов холста)
+    op.execute(f"ALTER TABLE pixels SET (fillfactor = {PIXELS_FILLFACTOR})")
+    op.execute("CLUSTER pixels USING pixels_pkey")
+    op.execute("ANALYZE pixels")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE pixels RESET (fillfactor)")
+    op.drop_constraint('pixels_pkey', 'pixels', type_='primary')
+    op.create_index('idx_pixel_coords', 'pixels', ['x', 'y'], unique=True)
+
+    op.add_column('pixels', sa.Column('id', sa.Integer(), nullable=True))
+    op.execute("CREATE SEQUENCE pixels_id_seq OWNED BY pixels.id")
+    op.execute("UPDATE pixels SET id = nextval('pixels_id_seq')")
+    op.execute("ALTER TABLE pixels ALTER COLUMN id SET DEFAULT nextval('pixels_id_seq')")
+    op.alter_column('pixels', 'id', nullable=False)
+    op.create_primary_key('pixels_pkey', 'pixels', ['id'])
+
+    op.create_index('ix_pixels_id', 'pixels', ['id'], unique=False)
+    op.create_index('ix_pixels_x', 'pixels', ['x'], unique=False)
+    op.create_index('ix_pixels_y', 'pixels', ['y'], unique=False)
+    op.create_index('ix_pixels_user_id', 'pixels', ['user_id'], unique=False)
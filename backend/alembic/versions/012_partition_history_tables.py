@@ -0,0 +1,165 @@
+"""Partition game results and pixel history by month
+
+Revision ID: 012_partition_history_tables
+Revises: 011_pixels_keyed_by_cell
+Create Date: 2024-01-26 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '012_partition_history_tables'
+down_revision = '011_pixels_keyed_by_cell'
+branch_labels = None
+depends_on = None
+
+# Секции создаются с запасом на столько месяцев вперёд (дальше — PartitionService)
+PREMAKE_MONTHS = 3
+
+# Месячные секции {table}_pYYYY_MM от первого месяца с данными до PREMAKE_MONTHS вперёд.
+# Границы — полночь UTC первого числа (как в PartitionService)
+CREATE_PARTITIONS_SQL = """
+    DO $$
+    DECLARE
+        part_start timestamp := date_trunc('month', COALESCE(
+            (SELECT min(created_at) FROM {source}), now()
+        ) AT TIME ZONE 'UTC');
+        last_start timestamp := date_trunc('month', now() AT TIME ZONE 'UTC') + interval '{premake} months';
+    BEGIN
+        WHILE part_start <= last_start LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                '{table}_p' || to_char(part_start, 'YYYY_MM'),
+                to_char(part_start, 'YYYY-MM-DD') || ' 00:00:00+00',
+                to_char(part_start + interval '1 month', 'YYYY-MM-DD') || ' 00:00:00+00'
+            );
+            part_start := part_start + interval '1 month';
+        END LOOP;
+    END $$
+"""
+
+
+def upgrade() -> None:
+    # Отсоединённые старые секции переносятся сюда (выгрузить и удалить — вручную)
+    op.execute("CREATE SCHEMA IF NOT EXISTS archive")
+
+    # game_results: старая таблица переименовывается, данные копируются в секционированную.
+    # Первичный ключ секционированной таблицы обязан включать ключ секционирования
+    op.rename_table('game_results', 'game_results_old')
+    op.execute("""
+        CREATE TABLE game_results (
+            id integer NOT NULL DEFAULT nextval('game_results_id_seq'),
+            game_session_id integer NOT NULL,
+            user_id integer NOT NULL,
+            level_reached integer NOT NULL,
+            correct_answers integer,
+            errors integer,
+            play_time_seconds integer,
+            created_at timestamptz NOT NULL DEFAULT now()
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute(CREATE_PARTITIONS_SQL.format(
+        table='game_results', source='game_results_old', premake=PREMAKE_MONTHS
+    ))
+    op.execute("""
+        INSERT INTO game_results (id, game_session_id, user_id, level_reached, correct_answers,
+                                  errors, play_time_seconds, created_at)
+        SELECT id, game_session_id, user_id, level_reached, correct_answers,
+               errors, play_time_seconds, COALESCE(created_at, now())
+        FROM game_results_old
+    """)
+    # Последовательность ID переходит к новой таблице, иначе удалится вместе со старой
+    op.execute("ALTER SEQUENCE game_results_id_seq OWNED BY game_results.id")
+    op.drop_table('game_results_old')
+
+    op.create_primary_key('game_results_pkey', 'game_results', ['id', 'created_at'])
+    op.create_foreign_key(
+        'game_results_user_id_fkey', 'game_results', 'users',
+        ['user_id'], ['id'], ondelete='CASCADE'
+    )
+    op.create_index('ix_game_results_game_session_id', 'game_results', ['game_session_id'], unique=False)
+    op.create_index('ix_game_results_user_level', 'game_results', ['user_id', 'level_reached'], unique=False)
+
+    # pixel_history — так же
+    op.rename_table('pixel_history', 'pixel_history_old')
+    op.execute("""
+        CREATE TABLE pixel_history (
+            id bigint NOT NULL DEFAULT nextval('pixel_history_id_seq'),
+            x integer NOT NULL,
+            y integer NOT NULL,
+            color varchar(7),
+            user_id integer NOT NULL,
+            created_at timestamptz NOT NULL DEFAULT now()
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute(CREATE_PARTITIONS_SQL.format(
+        table='pixel_history', source='pixel_history_old', premake=PREMAKE_MONTHS
+    ))
+    op.execute("""
+        INSERT INTO pixel_history (id, x, y, color, user_id, created_at)
+        SELECT id, x, y, color, user_id, created_at
+        FROM pixel_history_old
+    """)
+    op.execute("ALTER SEQUENCE pixel_history_id_seq OWNED BY pixel_history.id")
+    op.drop_table('pixel_history_old')
+
+    op.create_primary_key('pixel_history_pkey', 'pixel_history', ['id', 'created_at'])
+    op.create_foreign_key(
+        'pixel_history_user_id_fkey', 'pixel_history', 'users',
+        ['user_id'], ['id'], ondelete='CASCADE'
+    )
+    op.create_index('idx_pixel_history_cell_time', 'pixel_history', ['x', 'y', 'created_at'], unique=False)
+    op.create_index('idx_pixel_history_user_time', 'pixel_history', ['user_id', 'created_at'], unique=False)
+
+    op.execute("ANALYZE game_results")
+    op.execute("ANALYZE pixel_history")
+
+
+def downgrade() -> None:
+    # Обратно в обычные таблицы (данные отсоединённых секций из схемы archive не возвращаются)
+    op.rename_table('pixel_history', 'pixel_history_partitioned')
+    op.execute("""
+        CREATE TABLE pixel_history (
+            id bigint NOT NULL DEFAULT nextval('pixel_history_id_seq'),
+            x integer NOT NULL,
+            y integer NOT NULL,
+            color varchar(7),
+            user_id integer NOT NULL,
+            created_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    op.execute("INSERT INTO pixel_history SELECT * FROM pixel_history_partitioned")
+    op.execute("ALTER SEQUENCE pixel_history_id_seq OWNED BY pixel_history.id")
+    op.drop_table('pixel_history_partitioned')
+    op.create_primary_key('pixel_history_pkey', 'pixel_history', ['id'])
+    op.create_foreign_key(
+        'pixel_history_user_id_fkey', 'pixel_history', 'users',
+        ['user_id'], ['id'], ondelete='CASCADE'
+    )
+    op.create_index('idx_pixel_history_cell_time', 'pixel_history', ['x', 'y', 'created_at'], unique=False)
+    op.create_index('idx_pixel_history_user_time', 'pixel_history', ['user_id', 'created_at'], unique=False)
+
+    op.rename_table('game_results', 'game_results_partitioned')
+    op.execute("""
+        CREATE TABLE game_results (
+            id integer NOT NULL DEFAULT nextval('game_results_id_seq'),
+            game_session_id integer NOT NULL,
+            user_id integer NOT NULL,
+            level_reached integer NOT NULL,
+            correct_answers integer,
+            errors integer,
+            play_time_seconds integer,
+            created_at timestamptz DEFAULT now()
+        )
+    """)
+    op.execute("INSERT INTO game_results SELECT * FROM game_results_partitioned")
+    op.execute("ALTER SEQUENCE game_results_id_seq OWNED BY game_results.id")
+    op.drop_table('game_results_partitioned')
+    op.create_primary_key('game_results_pkey', 'game_results', ['id'])
+    op.create_foreign_key(
+        'game_results_user_id_fkey', 'game_results', 'users',
+        ['user_id'], ['id'], ondelete='CASCADE'
+    )
+    op.create_index('ix_game_results_id', 'game_results', ['id'], unique=False)
+    op.create_index('ix_game_results_game_session_id', 'game_results', ['game_session_id'], unique=False)
+    op.create_index('ix_game_results_user_level', 'game_results', ['user_id', 'level_reached'], unique=False)
@@ -0,0 +1,80 @@
+"""Compute game and team codes in the database
+
+Revision ID: 013_server_side_codes
+Revises: 012_partition_history_tables
+Create Date: 2024-01-27 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import settings
+
+# revision identifiers, used by Alembic.
+revision = '013_server_side_codes'
+down_revision = '012_partition_history_tables'
+branch_labels = None
+depends_on = None
+
+# Перестановка номера из последовательности (см. CodeService): сеть Фейстеля
+# из 4 раундов на 30 битах (раунд — первые 15 бит HMAC-SHA256 от "{вид}:{раунд}:{половина}"
+# с ключом APP_SECRET_KEY), затем 6 символов алфавита по 5 бит, старшие первыми.
+# Ключ хранится в таблице code_secret и не передаётся в запросах
+PERMUTED_CODE_SQL = """
+    CREATE OR REPLACE FUNCTION permuted_code(seq_value bigint, code_namespace text)
+    RETURNS varchar
+    LANGUAGE plpgsql STABLE STRICT
+    AS $$
+    DECLARE
+        alphabet CONSTANT text := 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789';
+        hmac_key text := (SELECT code_secret.secret_key FROM code_secret);
+        half_mask CONSTANT bigint := 32767;
+        left_half bigint := seq_value >> 15;
+        right_half bigint := seq_value & half_mask;
+        previous_right bigint;
+        digest bytea;
+        permuted bigint;
+        code text := '';
+    BEGIN
+        FOR round_number IN 0..3 LOOP
+            digest := hmac(
+                convert_to(code_namespace || ':' || round_number || ':' || right_half, 'UTF8'),
+                convert_to(hmac_key, 'UTF8'),
+                'sha256'
+            );
+            previous_right := right_half;
+            right_half := left_half # (((get_byte(digest, 0) << 8) | get_byte(digest, 1)) & half_mask);
+            left_half := previous_right;
+        END LOOP;
+
+        permuted := (left_half << 15) | right_half;
+        FOR char_index IN REVERSE 5..0 LOOP
+            code := code || substr(alphabet, ((permuted >> (5 * char_index)) & 31)::int + 1, 1);
+        END LOOP;
+        RETURN code;
+    END;
+    $$
+"""
+
+
+def upgrade() -> None:
+    # hmac() из pgcrypto (доверенное расширение с PostgreSQL 13: хватает прав владельца БД)
+    op.execute("CREATE EXTENSION IF NOT EXISTS pgcrypto")
+
+    # Ключ перестановки — текущий APP_SECRET_KEY: коды, выданные раньше приложением, не меняются
+    op.create_table(
+        'code_secret',
+        sa.Column('id', sa.Boolean(), primary_key=True, server_default=sa.true()),
+        sa.Column('secret_key', sa.Text(), nullable=False),
+        sa.CheckConstraint('id', name='code_secret_single_row'),
+    )
+    op.get_bind().execute(
+        sa.text("INSERT INTO code_secret (secret_key) VALUES (:secret_key)"),
+        {"secret_key": settings.APP_SECRET_KEY}
+    )
+    op.execute(PERMUTED_CODE_SQL)
+
+
+def downgrade() -> None:
+    op.execute("DROP FUNCTION IF EXISTS permuted_code(bigint, text)")
+    op.drop_table('code_secret')
@@ -3,25 +3,44 @@ WebSocket для синхронизации PvP игр
 """
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 from typing import Dict, Set
+import asyncio
 import json
 
 from app.core.database import AsyncSessionLocal
+from app.core.redis import get_redis
+from app.core.scheduler import NODE_ID
 from app.services.game_service import GameService
+from app.services.game_cache_service import GameCacheService
+from app.services.pixel_service import HEX_COLOR_RE
+from app.telegram.auth import get_websocket_user_id
 
 router = APIRouter()
 
-# Словарь активных подключений по game_id
+# Словарь активных подключений этого узла по game_id
 # {game_id: Set[WebSocket]}
 game_connections: Dict[int, Set[WebSocket]] = {}
 
+# Комнаты игр между узлами: канал Redis на игру.
+# Все каналы узла обслуживает одно pub/sub соединение; узел подписан
+# только на игры, к которым у него есть подключения
+GAME_CHANNEL_PREFIX = "game_room:"
 
-async def broadcast_to_game(game_id: int, message: dict, exclude_ws: WebSocket = None):
-    """Отправить сообщение всем игрокам в игре"""
+_room_pubsub = None
+_room_listener_task: asyncio.Task = None
+
+
+def game_channel(game_id: int) -> str:
+    """Канал комнаты игры"""
+    return f"{GAME_CHANNEL_PREFIX}{game_id}"
+
+
+async def send_local(game_id: int, message: dict, exclude_ws: WebSocket = None):
+    """Отправить сообщение подключениям игры на этом узле"""
     if game_id not in game_connections:
         return
     
     disconnected = set()
-    for ws in game_connections[game_id]:
+    for ws in list(game_connections[game_id]):
         if ws == exclude_ws:
             continue
         try:
@@ -30,11 +49,144 @@ async def broadcast_to_game(game_id: int, message: dict, exclude_ws: WebSocket =
             disconnected.add(ws)
     
     # Удаляем отключенные соединения
-    game_connections[game_id].difference_update(disconnected)
+    for ws in disconnected:
+        await remove_connection(game_id, ws)
+
+
+async def listen_rooms():
+    """Разбор сообщений всех комнат узла из общего pub/sub соединения"""
+    while True:
+        try:
+            message = await _room_pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is None or message["type"] != "message":
+                if not _room_pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                continue
+            data = json.loads(message["data"])
+            if data.get("origin") == NODE_ID:
+                continue  # Своим подключениям узел уже отправил сообщение напрямую
+            game_id = int(message["channel"][len(GAME_CHANNEL_PREFIX):])
+            await send_local(game_id, data["message"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Ошибка обработки сообщения комнаты игры: {e}")
+            await asyncio.sleep(0.1)
+
+
+async def add_connection(game_id: int, websocket: WebSocket):
+    """Добавить подключение; первое подключение игры подписывает узел на её канал"""
+    global _room_pubsub, _room_listener_task
+    
+    if _room_pubsub is None:
+        redis = await get_redis()
+        _room_pubsub = redis.pubsub()
     
-    # Если больше нет подключений, удаляем игру
-    if not game_connections[game_id]:
+    if game_id not in game_connections:
+        game_connections[game_id] = set()
+        await _room_pubsub.subscribe(game_channel(game_id))
+    game_connections[game_id].add(websocket)
+    
+    # Слушатель запускается после первой подписки (до неё у pub/sub нет соединения)
+    if _room_listener_task is None or _room_listener_task.done():
+        _room_listener_task = asyncio.create_task(listen_rooms())
+
+
+async def remove_connection(game_id: int, websocket: WebSocket):
+    """Удалить подключение; когда комната пустеет, узел отписывается от канала"""
+    connections = game_connections.get(game_id)
+    if connections is None:
+        return
+    connections.discard(websocket)
+    if not connections:
         del game_connections[game_id]
+        if _room_pubsub is not None:
+            try:
+                await _room_pubsub.unsubscribe(game_channel(game_id))
+            except Exception as e:
+                print(f"Ошибка отписки от комнаты игры {game_id}: {e}")
+
+
+async def broadcast_to_game(game_id: int, message: dict, exclude_ws: WebSocket = None):
+    """
+    Отправить сообщение всем игрокам в игре.
+    Подключениям этого узла — напрямую, остальным узлам — через канал комнаты.
+    """
+    await send_local(game_id, message, exclude_ws)
+    
+    try:
+        redis = await get_redis()
+        await redis.publish(
+            game_channel(game_id),
+            json.dumps({"origin": NODE_ID, "message": message})
+        )
+    except Exception as e:
+        print(f"Ошибка публикации в комнату игры {game_id}: {e}")
+
+
+async def handle_place_pixel(game_id: int, user_id: int, message: dict, websocket: WebSocket):
+    """Применить ход игрока и разослать авторитетный результат"""
+    move_id = message.get("move_id")
+    try:
+        x = int(message["x"])
+        y = int(message["y"])
+        color = message["color"]
+    except (KeyError, TypeError, ValueError):
+        await websocket.send_json({
+            "type": "move_rejected",
+            "move_id": move_id,
+            "error": "Некорректный ход"
+        })
+        return
+    
+    # Тот же формат цвета, что в REST (PixelCreate): цвет рассылается сопернику
+    if not isinstance(color, str) or not HEX_COLOR_RE.fullmatch(color):
+        await websocket.send_json({
+            "type": "move_rejected",
+            "move_id": move_id,
+            "x": x,
+            "y": y,
+            "error": "Некорректный цвет"
+        })
+        return
+    
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await GameService.place_pvp_pixel(db, game_id, user_id, x, y, color)
+    except ValueError as e:
+        await websocket.send_json({
+            "type": "move_rejected",
+            "move_id": move_id,
+            "x": x,
+            "y": y,
+            "error": str(e)
+        })
+        return
+    
+    placed = {
+        "type": "pixel_placed",
+        "user_id": user_id,
+        "x": x,
+        "y": y,
+        "color": color,
+        "timestamp": result["timestamp"],
+        "pixels_placed": result["pixels_placed"],
+        "pixels_remaining": result["pixels_remaining"],
+        "player1_pixels_count": result["player1_pixels_count"],
+        "player2_pixels_count": result["player2_pixels_count"]
+    }
+    # Автору хода — подтверждение с его move_id, сопернику — тот же ход
+    await websocket.send_json({**placed, "move_id": move_id})
+    await broadcast_to_game(game_id, placed, exclude_ws=websocket)
+    
+    if result["game_finished"]:
+        await broadcast_to_game(
+            game_id,
+            {
+                "type": "game_finished",
+                "winner_id": result["winner_id"]
+            }
+        )
 
 
 @router.websocket("/ws/game/{game_id}")
@@ -45,43 +197,29 @@ async def game_websocket_endpoint(
     """
     WebSocket endpoint для синхронизации PvP игры
     game_id - ID игры
-    user_id передаётся как query параметр: ?user_id=123
+    initData Telegram передаётся как query параметр: ?init_data=... (URL-кодированный)
     """
     await websocket.accept()
     
-    # Получаем telegram_id из query параметров
-    query_params = dict(websocket.query_params)
-    telegram_id = int(query_params.get('telegram_id', 0))
-    
-    if not telegram_id:
-        await websocket.close(code=1008, reason="telegram_id не указан")
-        return
-    
-    # Проверяем, что игра существует и пользователь участвует
+    # Проверяем подпись initData, что игра существует и пользователь участвует
+    # (ID пользователя и метаданные игры берутся из кеша, БД — только при промахе)
     async with AsyncSessionLocal() as db:
-        from app.services.user_service import UserService
-        
-        # Получаем пользователя по telegram_id
-        user = await UserService.get_user_by_telegram_id(db, telegram_id)
-        if not user:
-            await websocket.close(code=1008, reason="Пользователь не найден")
+        user_id = await get_websocket_user_id(db, websocket)
+        if not user_id:
+            await websocket.close(code=1008, reason="Ошибка авторизации")
             return
         
-        user_id = user.id
-        
-        game = await GameService.get_game_by_id(db, game_id)
+        game = await GameCacheService.get(db, game_id)
         if not game:
             await websocket.close(code=1008, reason="Игра не найдена")
             return
         
-        if game.player1_id != user_id and game.player2_id != user_id:
+        if game["player1_id"] != user_id and game["player2_id"] != user_id:
             await websocket.close(code=1008, reason="Вы не участвуете в этой игре")
             return
     
     # Добавляем подключение
-    if game_id not in game_connections:
-        game_connections[game_id] = set()
-    game_connections[game_id].add(websocket)
+    await add_connection(game_id, websocket)
     
     # Уведомляем других игроков о подключении
     await broadcast_to_game(
@@ -152,35 +290,10 @@ async def game_websocket_endpoint(
                         exclude_ws=websocket
                     )
                 
-                elif message_type == "pixel_placed":
-                    # Игрок разместил пиксель (для новой механики PvP)
-                    # Отправляем оппоненту информацию о размещенном пикселе
-                    await broadcast_to_game(
-                        game_id,
-                        {
-                            "type": "pixel_placed",
-                            "user_id": user_id,
-                            "x": message.get("x"),
-                            "y": message.get("y"),
-                            "color": message.get("color"),
-                            "timestamp": message.get("timestamp"),
-                            "pixels_placed": message.get("pixels_placed"),
-                            "pixels_remaining": message.get("pixels_remaining")
-                        },
-                        exclude_ws=websocket
-                    )
-                
-                elif message_type == "game_finished":
-                    # Игра завершена (для новой механики PvP)
-                    await broadcast_to_game(
-                        game_id,
-                        {
-                            "type": "game_finished",
-                            "winner_id": message.get("winner_id"),
-                            "user_id": user_id
-                        },
-                        exclude_ws=websocket
-                    )
+                elif message_type == "place_pixel":
+                    # Ход PvP: сервер проверяет и применяет его к состоянию игры,
+                    # ставит серверное время и рассылает результат обоим игрокам
+                    await handle_place_pixel(game_id, user_id, message, websocket)
                 
             except WebSocketDisconnect:
                 break
@@ -194,10 +307,7 @@ async def game_websocket_endpoint(
         print(f"Game WebSocket error: {e}")
     finally:
         # Удаляем подключение
-        if game_id in game_connections:
-            game_connections[game_id].discard(websocket)
-            if not game_connections[game_id]:
-                del game_connections[game_id]
+        await remove_connection(game_id, websocket)
         
         # Уведомляем других игроков об отключении
         await broadcast_to_game(
@@ -0,0 +1,129 @@
+"""
+WebSocket для подбора соперника в PvP
+Клиент подключается один раз и ждёт сообщения match_found — без опроса очереди
+"""
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import Dict, Set
+import asyncio
+import json
+import time
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis import get_redis
+from app.services.game_service import GameService
+from app.telegram.auth import get_websocket_user_id
+
+router = APIRouter()
+
+# Ожидающие пару игроки этого узла
+# {user_id: Set[WebSocket]}
+match_waiters: Dict[int, Set[WebSocket]] = {}
+
+# Подписка узла на канал найденных пар (создаётся один раз)
+_match_subscription_task: asyncio.Task = None
+
+
+async def notify_match(message: dict):
+    """Отправить найденную пару игрокам, которые ждут на этом узле"""
+    for user_id in message.get("user_ids", []):
+        connections = match_waiters.pop(user_id, None)
+        if not connections:
+            continue
+        for ws in connections:
+            try:
+                await ws.send_json({
+                    "type": "match_found",
+                    "game": message["game"],
+                    "current_user_id": user_id
+                })
+                # Подбор завершён — закрываем канал, дальше игра идёт через /ws/game
+                await ws.close()
+            except Exception:
+                pass
+
+
+async def start_match_subscription():
+    """Запустить подписку на канал найденных пар"""
+    global _match_subscription_task
+
+    if _match_subscription_task and not _match_subscription_task.done():
+        return
+
+    redis = await get_redis()
+    pubsub = redis.pubsub()
+    await pubsub.subscribe(settings.REDIS_MATCH_CHANNEL)
+
+    async def listen():
+        async for message in pubsub.listen():
+            if message["type"] == "message":
+                try:
+                    await notify_match(json.loads(message["data"]))
+                except Exception as e:
+                    print(f"Ошибка обработки сообщения о паре: {e}")
+
+    _match_subscription_task = asyncio.create_task(listen())
+
+
+@router.websocket("/ws/matchmaking")
+async def matchmaking_websocket_endpoint(websocket: WebSocket):
+    """
+    WebSocket endpoint для подбора соперника
+    initData Telegram передаётся как query параметр: ?init_data=... (URL-кодированный)
+    При подключении игрок встаёт в очередь; когда пара найдена (на любом узле),
+    сервер присылает {"type": "match_found", "game": {...}, "current_user_id": ...}.
+    Отключение до подбора пары — выход из очереди.
+    """
+    await websocket.accept()
+
+    async with AsyncSessionLocal() as db:
+        user_id = await get_websocket_user_id(db, websocket)
+        if not user_id:
+            await websocket.close(code=1008, reason="Ошибка авторизации")
+            return
+
+        # Регистрируемся до входа в очередь, чтобы не пропустить мгновенную пару
+        await start_match_subscription()
+        match_waiters.setdefault(user_id, set()).add(websocket)
+
+        try:
+            await GameService.join_pvp_queue(db, user_id)
+        except Exception as e:
+            print(f"[MATCHMAKING] Ошибка входа в очередь: {e}")
+            waiters = match_waiters.get(user_id)
+            if waiters is not None:
+                waiters.discard(websocket)
+                if not waiters:
+                    del match_waiters[user_id]
+            await websocket.close(code=1011, reason="Ошибка входа в очередь")
+            return
+
+    deadline = time.monotonic() + GameService.PVP_QUEUE_TTL_SECONDS
+
+    try:
+        while user_id in match_waiters:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Время ожидания в очереди истекло
+                match_waiters.get(user_id, set()).discard(websocket)
+                await websocket.send_json({"type": "queue_timeout"})
+                await websocket.close()
+                break
+            try:
+                data = await asyncio.wait_for(websocket.receive_text(), timeout=remaining)
+                if data == "ping":
+                    await websocket.send_text("pong")
+            except asyncio.TimeoutError:
+                continue
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Matchmaking WebSocket error: {e}")
+    finally:
+        waiters = match_waiters.get(user_id)
+        if waiters is not None:
+            waiters.discard(websocket)
+            if not waiters:
+                # Пара не найдена и других подключений игрока нет — выходим из очереди
+                del match_waiters[user_id]
+                await GameService.leave_pvp_queue(user_id)
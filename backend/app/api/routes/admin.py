@@ -0,0 +1,56 @@
+"""
+Админские API роуты (модерация холста)
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Optional
+
+from app.core.database import get_db
+from app.telegram.auth import get_current_admin
+from app.services.moderation_service import ModerationService
+
+router = APIRouter()
+
+
+class RollbackRequest(BaseModel):
+    # Прямоугольник области (правая и нижняя границы не включаются)
+    x_min: int = Field(..., ge=0)
+    y_min: int = Field(..., ge=0)
+    x_max: int = Field(..., gt=0)
+    y_max: int = Field(..., gt=0)
+    # Необязательная маска внутри прямоугольника: base64 битовой карты, строки сверху вниз
+    mask: Optional[str] = None
+    # Что откатываем: изменения с момента since и/или изменения пользователя user_id
+    since: Optional[datetime] = None
+    user_id: Optional[int] = None
+    # Только посчитать затронутые клетки, ничего не меняя
+    dry_run: bool = False
+
+
+@router.post("/rollback")
+async def rollback_area(
+    request: RollbackRequest,
+    db: AsyncSession = Depends(get_db),
+    admin_user_id: int = Depends(get_current_admin)
+):
+    """
+    Откатить область холста по журналу изменений
+    Прежнее состояние всех клеток считается одним запросом и применяется пакетной записью
+    """
+    try:
+        return await ModerationService.rollback(
+            db,
+            admin_user_id,
+            request.x_min,
+            request.y_min,
+            request.x_max,
+            request.y_max,
+            since=request.since,
+            user_id=request.user_id,
+            mask=request.mask,
+            dry_run=request.dry_run
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
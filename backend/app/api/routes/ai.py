@@ -5,9 +5,6 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
-import base64
-import io
-from PIL import Image
 
 from app.core.database import get_db_read
 from app.core.config import settings
@@ -53,27 +50,15 @@ async def analyze_canvas_area(
                 detail="Область пуста"
             )
         
-        # Создаем изображение из пикселей
-        width = request.x_max - request.x_min
-        height = request.y_max - request.y_min
-        img = Image.new('RGB', (width, height), color='white')
-        
-        pixel_dict = {(p.x, p.y): p.color for p in pixels}
-        for (x, y), color in pixel_dict.items():
-            img_x = x - request.x_min
-            img_y = y - request.y_min
-            if 0 <= img_x < width and 0 <= img_y < height:
-                # Конвертируем HEX в RGB
-                color_rgb = tuple(int(color[i:i+2], 16) for i in (1, 3, 5))
-                img.putpixel((img_x, img_y), color_rgb)
-        
-        # Масштабируем для анализа
-        img = img.resize((request.size, request.size), Image.NEAREST)
-        
-        # Конвертируем в base64
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        img_base64 = base64.b64encode(buffer.getvalue()).decode()
+        # Изображение области в base64 (PNG)
+        img_base64 = AIService.render_canvas_area(
+            pixels,
+            request.x_min,
+            request.y_min,
+            request.x_max - request.x_min,
+            request.y_max - request.y_min,
+            request.size
+        )
         
         # Анализируем через ИИ
         analysis = await AIService.analyze_canvas_area(img_base64)
@@ -10,6 +10,8 @@ from app.core.database import get_db_read
 from app.core.redis import get_redis
 from app.core.config import settings
 from app.services.pixel_service import PixelService
+from app.services.stats_service import StatsService
+from app.services.territory_service import TerritoryService
 from app.schemas.pixel import PixelResponse
 
 router = APIRouter()
@@ -74,19 +76,25 @@ async def get_canvas_size():
 
 
 @router.get("/stats")
-async def get_canvas_stats(db: AsyncSession = Depends(get_db_read)):  # Используем replica для чтения
-    """Получить статистику холста"""
-    from sqlalchemy import func, select
-    from app.models.pixel import Pixel
-    
-    # Подсчет общего количества пикселей
-    result = await db.execute(select(func.count(Pixel.id)))
-    total_pixels = result.scalar() or 0
-    
+async def get_canvas_stats():
+    """
+    Получить статистику холста
+    Читается из инкрементальных счётчиков Redis, без запросов к БД
+    """
+    return await StatsService.get_canvas_stats()
+
+
+@router.get("/territory")
+async def get_territory(
+    block_size: int = Query(20, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db_read)
+):
+    """
+    Территории команд: рейтинг по количеству клеток и уменьшенная карта
+    Считается по массивам холста в Redis, а не SQL-запросом по pixels
+    """
     return {
-        "total_pixels": total_pixels,
-        "canvas_width": settings.CANVAS_WIDTH,
-        "canvas_height": settings.CANVAS_HEIGHT,
-        "canvas_size": settings.CANVAS_WIDTH * settings.CANVAS_HEIGHT,
-        "coverage_percent": round((total_pixels / (settings.CANVAS_WIDTH * settings.CANVAS_HEIGHT)) * 100, 2) if total_pixels > 0 else 0
+        "standings": await TerritoryService.get_standings(db, limit),
+        "heatmap": await TerritoryService.get_heatmap(block_size)
     }
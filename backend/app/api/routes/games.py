@@ -1,7 +1,7 @@
 """
 API endpoints для игры "Повтори пиксели"
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
@@ -9,6 +9,7 @@ from pydantic import BaseModel
 from app.core.database import get_db
 from app.telegram.auth import get_current_user
 from app.services.game_service import GameService
+from app.services.game_cache_service import GameCacheService
 from app.models.game import GameMode, GameStatus
 
 router = APIRouter()
@@ -65,6 +66,32 @@ class LeaderboardEntry(BaseModel):
     first_achieved: str
 
 
+class LeaderboardPageEntry(LeaderboardEntry):
+    rank: int
+
+
+class LeaderboardPageResponse(BaseModel):
+    entries: List[LeaderboardPageEntry]
+    next_cursor: Optional[str] = None  # Курсор следующей страницы (null — страниц больше нет)
+
+
+class LeaderboardAroundResponse(BaseModel):
+    rank: int
+    entries: List[LeaderboardPageEntry]
+
+
+def _page_entry(entry: dict) -> LeaderboardPageEntry:
+    return LeaderboardPageEntry(
+        rank=entry["rank"],
+        user_id=entry["user_id"],
+        telegram_id=entry["telegram_id"],
+        name=entry["name"],
+        username=entry["username"],
+        max_level=entry["max_level"],
+        first_achieved=entry["first_achieved"].isoformat()
+    )
+
+
 @router.post("/create")
 async def create_game(
     request: GameCreateRequest,
@@ -87,7 +114,10 @@ async def create_game(
             "status": game.status.value,
             "current_level": game.current_level,
             "grid_size": game.grid_size,
-            "sequence": game.sequence,
+            "sequence": (
+                GameService.get_sequence(game.id, game.current_level, game.sequence)
+                if game.mode == GameMode.SOLO else None
+            ),
             "player1_id": game.player1_id,
             "player2_id": game.player2_id,
             "pixels_to_place": game.pixels_to_place,
@@ -201,6 +231,65 @@ async def join_game(
     }
 
 
+@router.get("/leaderboard", response_model=List[LeaderboardEntry])
+async def get_leaderboard(
+    limit: int = 10,
+    db: AsyncSession = Depends(get_db)
+):
+    """Получить глобальный лидерборд"""
+    leaderboard = await GameService.get_leaderboard(db, limit)
+    
+    return [
+        LeaderboardEntry(
+            user_id=entry["user_id"],
+            telegram_id=entry["telegram_id"],
+            name=entry["name"],
+            username=entry["username"],
+            max_level=entry["max_level"],
+            first_achieved=entry["first_achieved"].isoformat() if entry["first_achieved"] else ""
+        )
+        for entry in leaderboard
+    ]
+
+
+@router.get("/leaderboard/page", response_model=LeaderboardPageResponse)
+async def get_leaderboard_page(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Лидерборд постранично.
+    Для следующей страницы передайте next_cursor из предыдущего ответа.
+    """
+    try:
+        page = await GameService.get_leaderboard_page(db, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return LeaderboardPageResponse(
+        entries=[_page_entry(entry) for entry in page["entries"]],
+        next_cursor=page["next_cursor"]
+    )
+
+
+@router.get("/leaderboard/me", response_model=Optional[LeaderboardAroundResponse])
+async def get_leaderboard_around_me(
+    radius: int = Query(5, ge=0, le=50),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user)
+):
+    """Место текущего пользователя и соседи выше и ниже (null, если он ещё не играл)"""
+    around = await GameService.get_leaderboard_around(db, current_user_id, radius)
+    if around is None:
+        return None
+    
+    return LeaderboardAroundResponse(
+        rank=around["rank"],
+        entries=[_page_entry(entry) for entry in around["entries"]]
+    )
+
+
 @router.get("/{game_code}", response_model=GameResponse)
 async def get_game(
     game_code: str,
@@ -208,25 +297,28 @@ async def get_game(
     current_user_id: int = Depends(get_current_user)
 ):
     """Получить информацию об игре"""
-    game = await GameService.get_game_by_code(db, game_code)
+    game = await GameCacheService.get_by_code(db, game_code)
     
     if not game:
         raise HTTPException(status_code=404, detail="Игра не найдена")
     
     # Проверяем, что пользователь участвует в игре
-    if game.player1_id != current_user_id and game.player2_id != current_user_id:
+    if game["player1_id"] != current_user_id and game["player2_id"] != current_user_id:
         raise HTTPException(status_code=403, detail="Вы не участвуете в этой игре")
     
     return GameResponse(
-        id=game.id,
-        code=game.code,
-        mode=game.mode.value,
-        status=game.status.value,
-        current_level=game.current_level,
-        grid_size=game.grid_size,
-        sequence=game.sequence,
-        player1_id=game.player1_id,
-        player2_id=game.player2_id
+        id=game["id"],
+        code=game["code"],
+        mode=game["mode"],
+        status=game["status"],
+        current_level=game["current_level"],
+        grid_size=game["grid_size"],
+        sequence=(
+            GameService.get_sequence(game["id"], game["current_level"], game["sequence"])
+            if game["mode"] == GameMode.SOLO.value else None
+        ),
+        player1_id=game["player1_id"],
+        player2_id=game["player2_id"]
     )
 
 
@@ -238,26 +330,30 @@ async def submit_answer(
     current_user_id: int = Depends(get_current_user)
 ):
     """Проверить ответ игрока"""
-    game = await GameService.get_game_by_id(db, game_id)
+    game = await GameCacheService.get(db, game_id)
     
     if not game:
         raise HTTPException(status_code=404, detail="Игра не найдена")
     
-    if game.status != GameStatus.IN_PROGRESS:
+    if game["status"] != GameStatus.IN_PROGRESS.value:
         raise HTTPException(status_code=400, detail="Игра не активна")
     
-    # Проверяем правильность ответа
-    is_correct = GameService.validate_sequence(request.sequence, game.sequence)
+    # Проверяем правильность ответа (последовательность вычисляется, без загрузки из БД)
+    correct_sequence = GameService.get_sequence(game_id, game["current_level"], game["sequence"])
+    is_correct = GameService.validate_sequence(request.sequence, correct_sequence)
     
     if is_correct:
         # Переходим на следующий уровень
-        game = await GameService.next_level(db, game_id)
+        try:
+            next_level = await GameService.next_level(db, game_id, game["current_level"])
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
         return {
             "correct": True,
             "message": "Правильно! Переход на следующий уровень.",
-            "next_level": game.current_level,
-            "grid_size": game.grid_size,  # Размер поля для следующего уровня
-            "sequence": game.sequence  # Новая последовательность для следующего уровня
+            "next_level": next_level["current_level"],
+            "grid_size": next_level["grid_size"],  # Размер поля для следующего уровня
+            "sequence": next_level["sequence"]  # Новая последовательность для следующего уровня
         }
     else:
         # Игра окончена
@@ -265,7 +361,7 @@ async def submit_answer(
         return {
             "correct": False,
             "message": "Неправильно! Игра окончена.",
-            "level_reached": game.current_level - 1
+            "level_reached": game["current_level"] - 1
         }
 
 
@@ -297,27 +393,6 @@ async def finish_game(
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.get("/leaderboard", response_model=List[LeaderboardEntry])
-async def get_leaderboard(
-    limit: int = 10,
-    db: AsyncSession = Depends(get_db)
-):
-    """Получить глобальный лидерборд"""
-    leaderboard = await GameService.get_leaderboard(db, limit)
-    
-    return [
-        LeaderboardEntry(
-            user_id=entry["user_id"],
-            telegram_id=entry["telegram_id"],
-            name=entry["name"],
-            username=entry["username"],
-            max_level=entry["max_level"],
-            first_achieved=entry["first_achieved"].isoformat() if entry["first_achieved"] else ""
-        )
-        for entry in leaderboard
-    ]
-
-
 @router.post("/{game_id}/place-pixel")
 async def place_pixel(
     game_id: int,
@@ -0,0 +1,107 @@
+"""
+API роуты для лидербордов
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from pydantic import BaseModel
+
+from app.core.database import get_db_read
+from app.telegram.auth import get_current_user, get_user_db_read
+from app.services.leaderboard_service import LeaderboardService
+from app.services.team_service import TeamService
+
+router = APIRouter()
+
+
+class LeaderboardRankEntry(BaseModel):
+    rank: int
+    id: int
+    name: str
+    score: int
+    max_level: Optional[int] = None  # Для игры "Повтори пиксели"
+    first_achieved: Optional[str] = None  # Для игры "Повтори пиксели"
+
+
+class LeaderboardResponse(BaseModel):
+    board: str
+    period: str
+    total: int
+    entries: List[LeaderboardRankEntry]
+
+
+def _validate(board: str, period: str):
+    if board not in LeaderboardService.BOARDS:
+        raise HTTPException(status_code=404, detail="Лидерборд не найден")
+    if period not in LeaderboardService.PERIODS:
+        raise HTTPException(status_code=400, detail="Неверный период. Используйте 'all', 'day' или 'week'")
+
+
+def _make_entry(board: str, rank: int, member_id: int, score: float, name: str) -> LeaderboardRankEntry:
+    if board == "memory":
+        level, achieved_at = LeaderboardService.decode_memory_score(score)
+        return LeaderboardRankEntry(
+            rank=rank,
+            id=member_id,
+            name=name,
+            score=level,
+            max_level=level,
+            first_achieved=achieved_at.isoformat()
+        )
+    return LeaderboardRankEntry(rank=rank, id=member_id, name=name, score=int(score))
+
+
+@router.get("/{board}", response_model=LeaderboardResponse)
+async def get_leaderboard(
+    board: str,
+    period: str = Query("all"),
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db_read)
+):
+    """
+    Топ лидерборда
+    board: pixels, teams или memory; period: all, day или week
+    """
+    _validate(board, period)
+
+    top = await LeaderboardService.get_top(board, period, limit, offset)
+    names = await LeaderboardService.get_names(db, board, [member_id for _, member_id, _ in top])
+
+    return LeaderboardResponse(
+        board=board,
+        period=period,
+        total=await LeaderboardService.get_size(board, period),
+        entries=[
+            _make_entry(board, rank, member_id, score, names.get(member_id, "Неизвестно"))
+            for rank, member_id, score in top
+        ]
+    )
+
+
+@router.get("/{board}/me", response_model=Optional[LeaderboardRankEntry])
+async def get_my_rank(
+    board: str,
+    period: str = Query("all"),
+    db: AsyncSession = Depends(get_user_db_read),
+    current_user_id: int = Depends(get_current_user)
+):
+    """
+    Место текущего пользователя (для teams — место его основной команды)
+    Возвращает null, если пользователя нет в лидерборде
+    """
+    _validate(board, period)
+
+    member_id = current_user_id
+    if board == "teams":
+        member_id = await TeamService.get_primary_team_id(db, current_user_id)
+        if member_id is None:
+            return None
+
+    position = await LeaderboardService.get_rank(board, member_id, period)
+    if position is None:
+        return None
+
+    rank, score = position
+    names = await LeaderboardService.get_names(db, board, [member_id])
+    return _make_entry(board, rank, member_id, score, names.get(member_id, "Неизвестно"))
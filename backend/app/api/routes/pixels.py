@@ -6,10 +6,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db, get_db_read
 from app.core.config import settings
-from app.schemas.pixel import PixelCreate, PixelResponse
+from app.schemas.pixel import PixelCreate, PixelResponse, PixelBatchCreate, parse_pixel_batch_binary
 from app.services.pixel_service import PixelService
 from app.services.user_service import UserService
-from app.telegram.auth import get_current_user
+from app.telegram.auth import get_current_user, get_current_admin
+from pydantic import ValidationError
 
 router = APIRouter()
 
@@ -45,6 +46,18 @@ async def place_pixel(
     # Инвалидация кеша
     await PixelService.invalidate_canvas_cache()
     
+    # Обновление массивов холста и счётчиков статистики
+    try:
+        from app.services.stats_service import StatsService
+        from app.services.team_service import TeamService
+        team_id = await TeamService.get_primary_team_id(db, current_user_id)
+        await StatsService.record_placement(
+            pixel.x, pixel.y, pixel.color, current_user_id, team_id
+        )
+    except Exception as e:
+        # Счётчики поправит периодическая сверка
+        print(f"Ошибка обновления статистики: {e}")
+    
     # Публикация обновления через Redis
     from app.core.redis import publish_pixel_update
     await publish_pixel_update(
@@ -74,10 +87,52 @@ async def place_pixel(
                 )
                 break
     
-    print(f"Пиксель успешно размещен: id={pixel.id}, x={pixel.x}, y={pixel.y}, color={pixel.color}")
+    print(f"Пиксель успешно размещен: x={pixel.x}, y={pixel.y}, color={pixel.color}")
     return pixel
 
 
+@router.post("/batch", status_code=status.HTTP_201_CREATED)
+async def place_pixels_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    admin_user_id: int = Depends(get_current_admin)
+):
+    """
+    Пакетное размещение пикселей (трафареты, модерация, восстановление)
+    Тело запроса:
+    - application/json: {"pixels": [[x, y, "#RRGGBB"], ...]}
+    - application/octet-stream: записи по 7 байт — x (u16), y (u16), RGB (3 байта), big-endian
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/octet-stream"):
+            pixels = parse_pixel_batch_binary(body)
+        else:
+            pixels = PixelBatchCreate.model_validate_json(body).pixels
+        pixels = PixelService.validate_batch(pixels)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=e.errors(include_url=False, include_context=False)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    try:
+        placed = await PixelService.apply_batch(
+            db,
+            [(x, y, color, admin_user_id) for x, y, color in pixels],
+            admin_user_id
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при пакетном размещении: {str(e)}"
+        )
+    
+    return {"placed": placed}
+
+
 @router.get("/test")
 async def test_pixel_placement(db: AsyncSession = Depends(get_db)):
     """Тестовый эндпоинт для проверки работы БД"""
@@ -85,7 +140,7 @@ async def test_pixel_placement(db: AsyncSession = Depends(get_db)):
     from app.models.pixel import Pixel
     
     # Подсчет пикселей
-    result = await db.execute(select(func.count(Pixel.id)))
+    result = await db.execute(select(func.count()).select_from(Pixel))
     count = result.scalar() or 0
     
     # Получение нескольких пикселей
@@ -95,7 +150,7 @@ async def test_pixel_placement(db: AsyncSession = Depends(get_db)):
     return {
         "total_pixels": count,
         "sample_pixels": [
-            {"id": p.id, "x": p.x, "y": p.y, "color": p.color}
+            {"x": p.x, "y": p.y, "color": p.color}
             for p in pixels
         ]
     }
@@ -4,17 +4,16 @@ API роуты для работы с пользователями
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db_read
 from app.schemas.user import UserResponse
 from app.services.user_service import UserService
-from app.telegram.auth import get_current_user
+from app.telegram.auth import get_current_user, get_user_db_read
 
 router = APIRouter()
 
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
-    db: AsyncSession = Depends(get_db_read),  # Используем replica для чтения
+    db: AsyncSession = Depends(get_user_db_read),  # Реплика, если нет недавних записей
     current_user_id: int = Depends(get_current_user)
 ):
     """Получить информацию о текущем пользователе"""
@@ -1,18 +1,42 @@
 """
 Настройка подключения к базе данных
-Поддержка master/replica через pgbouncer
+Запись — в основную БД (DATABASE_URL), чтение — в реплику (DATABASE_READ_URL), если она задана
+и не отстаёт; пользователь, только что писавший в БД, читает из основной (read-your-writes)
 """
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy import text
+from typing import Optional
+from uuid import uuid4
+import time
+
 from app.core.config import settings
 
 
+def engine_connect_args() -> dict:
+    """
+    Параметры asyncpg для работы через pgbouncer.
+    Без pgbouncer (или если он поддерживает подготовленные операторы) кеши asyncpg
+    и SQLAlchemy остаются включены: повторный запрос выполняется без повторного PREPARE.
+    Иначе кеши выключаются, а имена операторов делаются уникальными, чтобы
+    оператор, подготовленный на одном соединении сервера, не искался на другом.
+    """
+    if not settings.DB_PGBOUNCER_TRANSACTION_MODE or settings.DB_PGBOUNCER_PREPARED_STATEMENTS:
+        return {}
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
+
+
 # Основной engine
 engine = create_async_engine(
     settings.DATABASE_URL,
     pool_size=settings.DB_POOL_SIZE,
     max_overflow=settings.DB_MAX_OVERFLOW,
     pool_pre_ping=True,
+    connect_args=engine_connect_args(),
     echo=False
 )
 
@@ -23,8 +47,95 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False
 )
 
+# Engine реплики со своим пулом (None — реплики нет, всё читается из основной БД)
+read_engine = create_async_engine(
+    settings.DATABASE_READ_URL,
+    pool_size=settings.DB_READ_POOL_SIZE,
+    max_overflow=settings.DB_READ_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    connect_args=engine_connect_args(),
+    echo=False
+) if settings.DATABASE_READ_URL else None
+
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+) if read_engine is not None else AsyncSessionLocal
+
 Base = declarative_base()
 
+# Отставание реплики (0, если она догнала основную БД или это не реплика)
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# Пользователи, недавно писавшие в БД: user_id -> метка с TTL
+RECENT_WRITE_PREFIX = "db:recent_write:"
+
+# Последнее измеренное отставание реплики в этом процессе
+_replica_lag = {"seconds": 0.0, "checked_at": 0.0}
+
+
+def recent_write_ttl() -> int:
+    """
+    Сколько читать из основной БД после записи.
+    Реплика используется, только пока отставание не больше DB_REPLICA_MAX_LAG_SECONDS,
+    а измеряется оно раз в DB_REPLICA_LAG_CHECK_SECONDS — после этого запись точно видна на реплике.
+    """
+    return settings.DB_REPLICA_MAX_LAG_SECONDS + settings.DB_REPLICA_LAG_CHECK_SECONDS
+
+
+async def replica_available() -> bool:
+    """Можно ли читать из реплики (она задана и отстаёт не больше допустимого)"""
+    if read_engine is None:
+        return False
+
+    now = time.monotonic()
+    if now - _replica_lag["checked_at"] >= settings.DB_REPLICA_LAG_CHECK_SECONDS:
+        # Отметка ставится до запроса, чтобы параллельные запросы не проверяли повторно
+        _replica_lag["checked_at"] = now
+        try:
+            async with read_engine.connect() as conn:
+                lag = (await conn.execute(text(REPLICA_LAG_SQL))).scalar()
+            _replica_lag["seconds"] = float(lag or 0)
+        except Exception as e:
+            print(f"[DB] Реплика недоступна, чтение из основной БД: {e}")
+            _replica_lag["seconds"] = float("inf")
+
+    return _replica_lag["seconds"] <= settings.DB_REPLICA_MAX_LAG_SECONDS
+
+
+async def mark_user_write(user_id: int):
+    """Отметить запись пользователя: следующие чтения его данных идут в основную БД"""
+    if read_engine is None:
+        return
+    from app.core.redis import get_redis
+
+    redis = await get_redis()
+    await redis.setex(f"{RECENT_WRITE_PREFIX}{user_id}", recent_write_ttl(), 1)
+
+
+async def has_recent_write(user_id: int) -> bool:
+    """Писал ли пользователь в БД недавно (его записи могут ещё не дойти до реплики)"""
+    from app.core.redis import get_redis
+
+    redis = await get_redis()
+    return bool(await redis.exists(f"{RECENT_WRITE_PREFIX}{user_id}"))
+
+
+async def read_session_factory(user_id: Optional[int] = None) -> async_sessionmaker:
+    """Фабрика сессий для чтения: реплика или основная БД"""
+    if not await replica_available():
+        return AsyncSessionLocal
+    if user_id is not None and await has_recent_write(user_id):
+        return AsyncSessionLocal
+    return ReadSessionLocal
+
 
 async def get_db():
     """Dependency для получения сессии БД"""
@@ -35,5 +146,21 @@ async def get_db():
             await session.close()
 
 
-# Для обратной совместимости
-get_db_read = get_db
+async def get_db_read():
+    """Dependency для чтения: сессия реплики (или основной БД, если реплика отстаёт)"""
+    session_factory = await read_session_factory()
+    async with session_factory() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+async def get_db_read_for_user(user_id: int):
+    """Сессия для чтения данных пользователя с учётом его недавних записей"""
+    session_factory = await read_session_factory(user_id)
+    async with session_factory() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
@@ -0,0 +1,110 @@
+"""
+Горячие запросы на SQLAlchemy Core
+Операторы собираются один раз при импорте (параметры — bindparam), поэтому каждый вызов
+берёт готовый SQL из кеша компиляции и подготовленный оператор asyncpg.
+Выполняются на соединении сессии без ORM: результат — строки (Row) с доступом
+по атрибутам, без identity map и гидрации объектов. Только для чтения.
+"""
+from sqlalchemy import select, bindparam, and_
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, List, Optional
+
+from app.models.user import User
+from app.models.pixel import Pixel
+from app.models.game import GameSession
+from app.models.team import Team, team_members
+
+
+users = User.__table__
+pixels = Pixel.__table__
+game_sessions = GameSession.__table__
+teams = Team.__table__
+
+# Пользователь (поля UserResponse)
+USER_COLUMNS = (
+    users.c.id,
+    users.c.telegram_id,
+    users.c.username,
+    users.c.first_name,
+    users.c.last_name,
+    users.c.pixels_placed,
+    users.c.created_at,
+    users.c.last_pixel_at,
+)
+
+USER_BY_ID = select(*USER_COLUMNS).where(users.c.id == bindparam("user_id"))
+
+USER_BY_TELEGRAM_ID = select(*USER_COLUMNS).where(users.c.telegram_id == bindparam("telegram_id"))
+
+USER_ID_BY_TELEGRAM_ID = select(users.c.id).where(users.c.telegram_id == bindparam("telegram_id"))
+
+USER_NAMES = select(users.c.id, users.c.first_name, users.c.username).where(
+    users.c.id.in_(bindparam("user_ids", expanding=True))
+)
+
+# Пиксель по координатам (первичный ключ)
+PIXEL_AT = select(
+    pixels.c.x,
+    pixels.c.y,
+    pixels.c.color,
+    pixels.c.user_id,
+    pixels.c.created_at,
+).where(and_(pixels.c.x == bindparam("x"), pixels.c.y == bindparam("y")))
+
+# Метаданные игры (поля GameCacheService.to_meta, без журналов ходов PvP)
+GAME_META_COLUMNS = (
+    game_sessions.c.id,
+    game_sessions.c.code,
+    game_sessions.c.mode,
+    game_sessions.c.status,
+    game_sessions.c.current_level,
+    game_sessions.c.grid_size,
+    game_sessions.c.sequence,
+    game_sessions.c.player1_id,
+    game_sessions.c.player2_id,
+    game_sessions.c.pixels_to_place,
+    game_sessions.c.winner_id,
+)
+
+GAME_META_BY_ID = select(*GAME_META_COLUMNS).where(game_sessions.c.id == bindparam("game_id"))
+
+GAME_META_BY_CODE = select(*GAME_META_COLUMNS).where(game_sessions.c.code == bindparam("code"))
+
+# Основная команда игрока — первая, в которую он вступил
+PRIMARY_TEAM_ID = (
+    select(team_members.c.team_id)
+    .where(team_members.c.user_id == bindparam("user_id"))
+    .order_by(team_members.c.joined_at, team_members.c.team_id)
+    .limit(1)
+)
+
+TEAM_MEMBERSHIP = select(team_members.c.is_owner).where(and_(
+    team_members.c.user_id == bindparam("user_id"),
+    team_members.c.team_id == bindparam("team_id"),
+))
+
+TEAM_NAMES = select(teams.c.id, teams.c.name).where(
+    teams.c.id.in_(bindparam("team_ids", expanding=True))
+)
+
+
+async def fetch_one(db: AsyncSession, statement, **params) -> Optional[Row]:
+    """Первая строка результата (None, если строк нет)"""
+    connection = await db.connection()
+    result = await connection.execute(statement, params)
+    return result.first()
+
+
+async def fetch_scalar(db: AsyncSession, statement, **params) -> Optional[Any]:
+    """Первое значение первой строки (None, если строк нет)"""
+    connection = await db.connection()
+    result = await connection.execute(statement, params)
+    return result.scalar()
+
+
+async def fetch_all(db: AsyncSession, statement, **params) -> List[Row]:
+    """Все строки результата"""
+    connection = await db.connection()
+    result = await connection.execute(statement, params)
+    return list(result.all())
@@ -3,32 +3,41 @@ Redis клиент и pub/sub для синхронизации
 """
 import json
 import redis.asyncio as redis
-from typing import Optional, Callable, Awaitable
+from typing import Optional, Callable, Awaitable, Dict
+from redis.commands.core import AsyncScript
 from app.core.config import settings
 
 
 redis_client: Optional[redis.Redis] = None
+# Клиент без decode_responses для бинарных массивов холста
+redis_binary_client: Optional[redis.Redis] = None
 pubsub: Optional[redis.client.PubSub] = None
 
+# Зарегистрированные Lua-скрипты (по тексту скрипта)
+_scripts: Dict[str, AsyncScript] = {}
+
 
 async def init_redis():
     """Инициализация Redis подключения"""
-    global redis_client, pubsub
+    global redis_client, redis_binary_client, pubsub
     redis_client = redis.from_url(
         settings.REDIS_URL,
         encoding="utf-8",
         decode_responses=True
     )
+    redis_binary_client = redis.from_url(settings.REDIS_URL)
     pubsub = redis_client.pubsub()
 
 
 async def close_redis():
     """Закрытие Redis подключения"""
-    global redis_client, pubsub
     if pubsub:
         await pubsub.close()
     if redis_client:
         await redis_client.close()
+    if redis_binary_client:
+        await redis_binary_client.close()
+    _scripts.clear()
 
 
 async def get_redis() -> redis.Redis:
@@ -38,6 +47,27 @@ async def get_redis() -> redis.Redis:
     return redis_client
 
 
+async def get_redis_binary() -> redis.Redis:
+    """Получить Redis клиент для бинарных данных (без декодирования ответов)"""
+    if redis_binary_client is None:
+        raise RuntimeError("Redis не инициализирован")
+    return redis_binary_client
+
+
+async def get_script(source: str) -> AsyncScript:
+    """
+    Получить Lua-скрипт, зарегистрированный в Redis.
+    Скрипт вызывается через EVALSHA, при отсутствии в кеше Redis
+    загружается автоматически.
+    """
+    script = _scripts.get(source)
+    if script is None:
+        client = await get_redis()
+        script = client.register_script(source)
+        _scripts[source] = script
+    return script
+
+
 async def publish_pixel_update(x: int, y: int, color: str, user_id: int):
     """Опубликовать обновление пикселя через pub/sub"""
     if redis_client is None:
@@ -59,6 +89,46 @@ async def publish_pixel_update(x: int, y: int, color: str, user_id: int):
     )
 
 
+async def publish_pixel_batch(pixels: list, user_id: int):
+    """
+    Опубликовать пакет пикселей одним сообщением
+    pixels: [[x, y, color], ...]
+    """
+    if redis_client is None:
+        return
+    
+    from datetime import datetime
+    
+    message = {
+        "type": "pixels_batch",
+        "pixels": pixels,
+        "user_id": user_id,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    
+    await redis_client.publish(
+        settings.REDIS_PUBSUB_CHANNEL,
+        json.dumps(message, separators=(",", ":"))
+    )
+
+
+async def publish_match_found(user_ids: list, game: dict):
+    """Опубликовать найденную пару PvP для всех узлов"""
+    if redis_client is None:
+        return
+    
+    message = {
+        "type": "match_found",
+        "user_ids": user_ids,
+        "game": game
+    }
+    
+    await redis_client.publish(
+        settings.REDIS_MATCH_CHANNEL,
+        json.dumps(message)
+    )
+
+
 async def subscribe_to_updates(
     callback: Callable[[dict], Awaitable[None]]
 ):
@@ -0,0 +1,96 @@
+"""
+Периодические фоновые задачи
+Каждая задача выполняется одним узлом кластера за интервал (блокировка в Redis)
+"""
+import asyncio
+import os
+import socket
+from typing import Callable, Awaitable, List
+
+from app.core.redis import get_redis, get_script
+
+
+# Идентификатор узла (для отладки владельца блокировки)
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Продлить блокировку, только если она принадлежит этому узлу
+RENEW_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Запущенные задачи текущего процесса
+_tasks: List[asyncio.Task] = []
+
+
+async def run_periodic(
+    name: str,
+    interval_seconds: int,
+    job: Callable[[], Awaitable[None]]
+):
+    """
+    Выполнять job каждые interval_seconds секунд.
+    Блокировка живёт весь интервал, поэтому за интервал задачу
+    выполняет только один узел, даже если запущено несколько реплик.
+    Пока задача выполняется, блокировка продлевается: задача дольше интервала
+    не запускается второй копией на другом узле.
+    """
+    lock_key = f"scheduler:lock:{name}"
+    lock_ttl = max(1, interval_seconds)
+
+    while True:
+        try:
+            redis = await get_redis()
+            acquired = await redis.set(lock_key, NODE_ID, nx=True, ex=lock_ttl)
+            if acquired:
+                keeper = asyncio.create_task(keep_lock(lock_key, lock_ttl))
+                try:
+                    await job()
+                finally:
+                    keeper.cancel()
+                    await asyncio.gather(keeper, return_exceptions=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[SCHEDULER] Ошибка задачи {name}: {e}")
+
+        await asyncio.sleep(interval_seconds)
+
+
+async def keep_lock(lock_key: str, ttl: int):
+    """Продлевать блокировку задачи на ttl секунд, пока задача выполняется"""
+    renew = await get_script(RENEW_LOCK_LUA)
+    while True:
+        await asyncio.sleep(max(ttl / 3, 0.5))
+        try:
+            await renew(keys=[lock_key], args=[NODE_ID, ttl])
+        except Exception as e:
+            # Следующая попытка — через треть TTL, блокировка ещё жива
+            print(f"[SCHEDULER] Не удалось продлить блокировку {lock_key}: {e}")
+
+
+def start_periodic(
+    name: str,
+    interval_seconds: int,
+    job: Callable[[], Awaitable[None]]
+) -> asyncio.Task:
+    """Запустить периодическую задачу в фоне"""
+    task = asyncio.create_task(run_periodic(name, interval_seconds, job))
+    _tasks.append(task)
+    return task
+
+
+async def stop_all():
+    """Остановить все периодические задачи процесса"""
+    for task in _tasks:
+        task.cancel()
+    for task in _tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"[SCHEDULER] Ошибка при остановке задачи: {e}")
+    _tasks.clear()
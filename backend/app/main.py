@@ -7,14 +7,19 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from contextlib import asynccontextmanager
-import asyncio
 
 from app.core.config import settings
 from app.core.redis import init_redis, close_redis
+from app.core import scheduler
+from app.services.stats_service import StatsService
+from app.services.pvp_state_service import PvpStateService
+from app.services.game_lifecycle_service import GameLifecycleService
+from app.services.partition_service import PartitionService
 from app.api.routes import api_router
 from app.api.websocket import router as websocket_router
 from app.api.game_websocket import router as game_websocket_router
-from app.telegram.bot import setup_bot
+from app.api.matchmaking_websocket import router as matchmaking_websocket_router
+from app.telegram.runner import router as telegram_webhook_router, start_bot, stop_bot
 
 
 @asynccontextmanager
@@ -23,32 +28,45 @@ async def lifespan(app: FastAPI):
     # Инициализация при старте
     await init_redis()
     
-    # Запуск Telegram бота
-    bot_application = setup_bot()
-    bot_task = None
-    if bot_application:
-        # Инициализируем и запускаем бота в фоне через polling
-        await bot_application.initialize()
-        await bot_application.start()
-        
-        # Запускаем polling в отдельной задаче
-        async def run_bot():
-            await bot_application.updater.start_polling()
-        
-        bot_task = asyncio.create_task(run_bot())
-        print("✅ Telegram бот запущен")
+    # Периодическая сверка счётчиков статистики с БД
+    scheduler.start_periodic(
+        "stats_reconcile",
+        settings.STATS_RECONCILE_INTERVAL_SECONDS,
+        StatsService.run_reconciliation
+    )
+    
+    # Периодическая запись идущих PvP игр из Redis в БД
+    scheduler.start_periodic(
+        "pvp_state_flush",
+        settings.PVP_STATE_FLUSH_INTERVAL_SECONDS,
+        PvpStateService.run_flush
+    )
+    
+    # Очистка брошенных и архивация законченных игр
+    scheduler.start_periodic(
+        "game_reaper",
+        settings.GAME_REAPER_INTERVAL_SECONDS,
+        GameLifecycleService.run_reaper
+    )
+    
+    # Месячные секции game_results и pixel_history: создание заранее и отсоединение старых
+    scheduler.start_periodic(
+        "partition_maintenance",
+        settings.PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+        PartitionService.run_maintenance
+    )
+    
+    # Бот по умолчанию работает отдельным процессом (app.telegram.runner),
+    # иначе каждый воркер API запускал бы свой polling
+    if settings.TELEGRAM_BOT_IN_API:
+        await start_bot()
     
     yield
     
     # Очистка при остановке
-    if bot_application:
-        await bot_application.updater.stop()
-        await bot_application.stop()
-        await bot_application.shutdown()
-        if bot_task:
-            bot_task.cancel()
-        print("🛑 Telegram бот остановлен")
+    await stop_bot()
     
+    await scheduler.stop_all()
     await close_redis()
 
 
@@ -81,6 +99,8 @@ app.add_middleware(
 app.include_router(api_router, prefix="/api")
 app.include_router(websocket_router)
 app.include_router(game_websocket_router)
+app.include_router(matchmaking_websocket_router)
+app.include_router(telegram_webhook_router)
 
 
 @app.get("/")
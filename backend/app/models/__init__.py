@@ -1,6 +1,6 @@
-from app.models.pixel import Pixel
+from app.models.pixel import Pixel, PixelHistory
 from app.models.user import User
 from app.models.team import Team, team_members
-from app.models.game import GameSession, GameResult, GameMode, GameStatus
+from app.models.game import GameSession, GameResult, GameArchive, UserBestResult, GameMode, GameStatus
 
-__all__ = ["Pixel", "User", "Team", "team_members", "GameSession", "GameResult", "GameMode", "GameStatus"]
+__all__ = ["Pixel", "PixelHistory", "User", "Team", "team_members", "GameSession", "GameResult", "GameArchive", "UserBestResult", "GameMode", "GameStatus"]
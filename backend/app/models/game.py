@@ -1,7 +1,7 @@
 """
 Модели для игры "Повтори пиксели"
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, JSON, Enum as SQLEnum, TypeDecorator
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, JSON, Enum as SQLEnum, TypeDecorator, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -105,15 +105,34 @@ class GameSession(Base):
     # Relationships
     player1 = relationship("User", foreign_keys=[player1_id], backref="games_as_player1")
     player2 = relationship("User", foreign_keys=[player2_id], backref="games_as_player2")
-    results = relationship("GameResult", back_populates="game_session", cascade="all, delete-orphan")
+    # Результаты переживают сессию (законченные сессии переносятся в game_archive)
+    results = relationship(
+        "GameResult",
+        primaryjoin="GameSession.id == foreign(GameResult.game_session_id)",
+        viewonly=True
+    )
+    
+    __table_args__ = (
+        # Идущие игры (очистка брошенных читает только их)
+        Index(
+            "ix_game_sessions_active",
+            text("COALESCE(updated_at, created_at)"),
+            postgresql_where=text("status IN ('waiting', 'in_progress')")
+        ),
+    )
 
 
 class GameResult(Base):
-    """Результат игры для игрока"""
+    """
+    Результат игры для игрока.
+    Секционирован по месяцам created_at (миграция 012, секции создаёт PartitionService).
+    """
     __tablename__ = "game_results"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
     
-    id = Column(Integer, primary_key=True, index=True)
-    game_session_id = Column(Integer, ForeignKey('game_sessions.id', ondelete='CASCADE'), nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Без внешнего ключа: сессия может быть перенесена в game_archive
+    game_session_id = Column(Integer, nullable=False, index=True)
     user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     
     # Достигнутый уровень
@@ -128,9 +147,44 @@ class GameResult(Base):
     # Время игры (в секундах)
     play_time_seconds = Column(Integer, nullable=True)
     
-    # Время создания
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Время создания (ключ секционирования входит в первичный ключ)
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     
     # Relationships
-    game_session = relationship("GameSession", back_populates="results")
+    game_session = relationship(
+        "GameSession",
+        primaryjoin="GameSession.id == foreign(GameResult.game_session_id)",
+        viewonly=True
+    )
     user = relationship("User", backref="game_results")
+
+
+class GameArchive(Base):
+    """Законченная игра в компактном виде (без полей хода игры)"""
+    __tablename__ = "game_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # ID из game_sessions
+    code = Column(String(10), nullable=False)
+    mode = Column(EnumType(GameMode), nullable=False)
+    status = Column(EnumType(GameStatus), nullable=False)
+    player1_id = Column(Integer, nullable=False, index=True)
+    player2_id = Column(Integer, nullable=True, index=True)
+    winner_id = Column(Integer, nullable=True)
+    level_reached = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class UserBestResult(Base):
+    """Лучший результат игрока в игре "Повтори пиксели" (обновляется при завершении игры)"""
+    __tablename__ = "user_best_results"
+    
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    max_level = Column(Integer, nullable=False)
+    # Когда максимальный уровень был достигнут впервые (при равенстве выше тот, кто раньше)
+    first_achieved = Column(DateTime(timezone=True), nullable=False)
+    
+    __table_args__ = (
+        # Порядок лидерборда: постраничный вывод по ключу — просмотр индекса
+        Index("ix_user_best_results_rank", max_level.desc(), "first_achieved", "user_id"),
+    )
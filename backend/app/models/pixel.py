@@ -1,22 +1,47 @@
 """
 Модель пикселя
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from app.core.database import Base
 
 
 class Pixel(Base):
+    """
+    Текущее состояние клетки: одна строка на клетку, ключ — координаты.
+    Кроме первичного ключа индексов нет, а таблица создана с fillfactor < 100
+    (миграция 011): перекраска меняет только неиндексируемые поля, и PostgreSQL
+    обновляет строку на той же странице (HOT) без записи в индексы.
+    Выборки по пользователю идут через pixel_history.
+    """
     __tablename__ = "pixels"
     
-    id = Column(Integer, primary_key=True, index=True)
-    x = Column(Integer, nullable=False, index=True)
-    y = Column(Integer, nullable=False, index=True)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
     color = Column(String(7), nullable=False)  # HEX цвет
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class PixelHistory(Base):
+    """
+    Журнал изменений клеток (для отката областей).
+    Секционирован по месяцам created_at (миграция 012, секции создаёт PartitionService).
+    """
+    __tablename__ = "pixel_history"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    x = Column(Integer, nullable=False)
+    y = Column(Integer, nullable=False)
+    color = Column(String(7), nullable=True)  # NULL — клетка очищена
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Ключ секционирования входит в первичный ключ
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
     
-    # Составной индекс для быстрого поиска по координатам
     __table_args__ = (
-        Index("idx_pixel_coords", "x", "y"),
+        # Последнее состояние клетки до момента времени
+        Index("idx_pixel_history_cell_time", "x", "y", "created_at"),
+        # Изменения пользователя (откат по пользователю)
+        Index("idx_pixel_history_user_time", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
@@ -1,4 +1,4 @@
-from app.schemas.pixel import PixelCreate, PixelResponse, PixelUpdate
+from app.schemas.pixel import PixelCreate, PixelResponse, PixelUpdate, PixelBatchCreate
 from app.schemas.user import UserResponse, UserCreate
 
-__all__ = ["PixelCreate", "PixelResponse", "PixelUpdate", "UserResponse", "UserCreate"]
+__all__ = ["PixelCreate", "PixelResponse", "PixelUpdate", "PixelBatchCreate", "UserResponse", "UserCreate"]
@@ -3,7 +3,13 @@
 """
 from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Tuple
+import struct
+
+
+# Бинарный формат пакета пикселей: записи по 7 байт, big-endian —
+# x (u16), y (u16), цвет RGB (3 байта)
+PIXEL_BATCH_RECORD = struct.Struct(">HH3s")
 
 
 class PixelCreate(BaseModel):
@@ -21,12 +27,26 @@ class PixelCreate(BaseModel):
         return v
 
 
+class PixelBatchCreate(BaseModel):
+    """Пакет пикселей в компактном виде: [[x, y, "#RRGGBB"], ...]"""
+    pixels: List[Tuple[int, int, str]] = Field(..., min_length=1, description="Список [x, y, цвет]")
+
+
+def parse_pixel_batch_binary(data: bytes) -> List[Tuple[int, int, str]]:
+    """Разобрать бинарный пакет пикселей"""
+    if not data or len(data) % PIXEL_BATCH_RECORD.size:
+        raise ValueError(f"Размер пакета должен быть кратен {PIXEL_BATCH_RECORD.size} байтам")
+    return [
+        (x, y, f"#{rgb.hex().upper()}")
+        for x, y, rgb in PIXEL_BATCH_RECORD.iter_unpack(data)
+    ]
+
+
 class PixelUpdate(BaseModel):
     color: str = Field(..., pattern="^#[0-9A-Fa-f]{6}$", description="HEX цвет")
 
 
 class PixelResponse(BaseModel):
-    id: int
     x: int
     y: int
     color: str
@@ -2,7 +2,10 @@
 Сервис для работы с ИИ
 """
 import os
+import io
+import base64
 import httpx
+from PIL import Image
 from typing import List, Dict
 from app.core.config import settings
 
@@ -13,16 +16,42 @@ class AIService:
     # OpenAI API (можно заменить на другой провайдер)
     @staticmethod
     def get_openai_key():
-        from app.core.config import settings
         return settings.OPENAI_API_KEY
     
     @staticmethod
     def get_use_local_ai():
-        from app.core.config import settings
         return settings.USE_LOCAL_AI
     
     OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
     
+    @staticmethod
+    def render_canvas_area(
+        pixels: list,
+        x_min: int,
+        y_min: int,
+        width: int,
+        height: int,
+        size: int
+    ) -> str:
+        """Изображение области холста для анализа: PNG size x size в base64"""
+        img = Image.new('RGB', (width, height), color='white')
+        
+        pixel_dict = {(p.x, p.y): p.color for p in pixels}
+        for (x, y), color in pixel_dict.items():
+            img_x = x - x_min
+            img_y = y - y_min
+            if 0 <= img_x < width and 0 <= img_y < height:
+                # Конвертируем HEX в RGB
+                color_rgb = tuple(int(color[i:i+2], 16) for i in (1, 3, 5))
+                img.putpixel((img_x, img_y), color_rgb)
+        
+        # Масштабируем для анализа
+        img = img.resize((size, size), Image.NEAREST)
+        
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+        return base64.b64encode(buffer.getvalue()).decode()
+    
     @staticmethod
     async def analyze_canvas_area(image_base64: str) -> Dict:
         """
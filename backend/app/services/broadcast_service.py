@@ -0,0 +1,391 @@
+"""
+Рассылки сообщений всем пользователям бота
+Получатели читаются страницами по возрастанию ID (сессия БД не держится во время отправки),
+отправка идёт пулом воркеров через общий ограничитель скорости с учётом RetryAfter,
+прогресс хранится в Redis — прерванную рассылку можно продолжить с последней страницы
+"""
+from sqlalchemy import select
+from telegram import Bot
+from telegram.error import RetryAfter, Forbidden, BadRequest, NetworkError, TelegramError
+from typing import Optional, List, Tuple, Set
+import asyncio
+import time
+
+from app.models.user import User
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis import get_redis, get_script
+from app.core.scheduler import NODE_ID
+from app.services.stats_service import StatsService
+
+
+# Продлить блокировку, только если она принадлежит этому узлу (1 — продлена)
+RENEW_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Снять блокировку, только если она принадлежит этому узлу
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Завершить рассылку: хранить состояние FINISHED_TTL и снять отметку активной,
+# если она всё ещё указывает на эту рассылку
+# KEYS: 1 состояние рассылки, 2 ACTIVE_KEY; ARGV: 1 ID рассылки, 2 FINISHED_TTL
+FINISH_JOB_LUA = """
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    redis.call('DEL', KEYS[2])
+end
+return 1
+"""
+
+# Остановить рассылку. Если её никто не выполняет (нет блокировки — например,
+# бот упал), она завершается сразу: иначе ACTIVE_KEY не снял бы никто.
+# Так же снимается ACTIVE_KEY, оставшийся от уже остановленной рассылки
+# KEYS: 1 состояние рассылки, 2 блокировка, 3 ACTIVE_KEY; ARGV: 1 ID рассылки, 2 FINISHED_TTL
+# Возвращает 0 — рассылка не выполнялась, 1 — её остановит выполняющий узел, 2 — завершена сразу
+CANCEL_JOB_LUA = """
+local running = redis.call('HGET', KEYS[1], 'status') == 'running'
+if running then
+    redis.call('HSET', KEYS[1], 'status', 'cancelled')
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return running and 1 or 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if redis.call('GET', KEYS[3]) == ARGV[1] then
+    redis.call('DEL', KEYS[3])
+end
+return running and 2 or 0
+"""
+
+
+class TokenBucket:
+    """Ограничитель скорости: rate отправок в секунду с запасом capacity"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Дождаться разрешения на одну отправку (в порядке очереди)"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Остановить все отправки на seconds секунд (ответ RetryAfter от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+class BroadcastService:
+    """Сервис для рассылок"""
+
+    KEY_PREFIX = "broadcast:"  # broadcast:{id} -> hash состояния рассылки
+    SEQ_KEY = "broadcast:seq"
+    ACTIVE_KEY = "broadcast:active"  # ID незавершённой рассылки (одна за раз)
+    LOCK_PREFIX = "broadcast:lock:"  # Узел, который сейчас выполняет рассылку
+
+    PAGE_SIZE = 500
+    LOCK_TTL = 60
+    LOCK_RENEW_INTERVAL_SECONDS = 15  # Заметно меньше LOCK_TTL: пауза RetryAfter не даёт блокировке истечь
+    PROGRESS_INTERVAL_SECONDS = 10
+    MAX_NETWORK_RETRIES = 3
+    FINISHED_TTL = 7 * 24 * 60 * 60
+
+    # Задачи рассылок текущего процесса (чтобы их не собрал GC)
+    _tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    async def create(text: str, admin_chat_id: int) -> int:
+        """
+        Создать рассылку.
+        Выбрасывает ValueError, если предыдущая рассылка ещё не завершена.
+        """
+        redis = await get_redis()
+        job_id = await redis.incr(BroadcastService.SEQ_KEY)
+        if not await redis.set(BroadcastService.ACTIVE_KEY, job_id, nx=True):
+            active = await redis.get(BroadcastService.ACTIVE_KEY)
+            raise ValueError(f"Рассылка #{active} ещё не завершена")
+
+        total = (await StatsService.get_canvas_stats())["total_users"]
+        await redis.hset(f"{BroadcastService.KEY_PREFIX}{job_id}", mapping={
+            "text": text,
+            "admin_chat_id": admin_chat_id,
+            "status": "running",
+            "last_user_id": 0,
+            "total": total,
+            "sent": 0,
+            "blocked": 0,
+            "failed": 0,
+            "progress_message_id": 0,
+            "created_at": int(time.time()),
+        })
+        return job_id
+
+    @staticmethod
+    async def get(job_id: int) -> Optional[dict]:
+        """Состояние рассылки"""
+        redis = await get_redis()
+        job = await redis.hgetall(f"{BroadcastService.KEY_PREFIX}{job_id}")
+        if not job:
+            return None
+        for field in ("admin_chat_id", "last_user_id", "total", "sent", "blocked",
+                      "failed", "progress_message_id", "created_at"):
+            job[field] = int(job.get(field) or 0)
+        job["id"] = int(job_id)
+        return job
+
+    @staticmethod
+    async def get_active() -> Optional[dict]:
+        """Незавершённая рассылка (если есть)"""
+        redis = await get_redis()
+        job_id = await redis.get(BroadcastService.ACTIVE_KEY)
+        if not job_id:
+            return None
+        return await BroadcastService.get(int(job_id))
+
+    @staticmethod
+    async def cancel(job_id: int) -> bool:
+        """
+        Остановить рассылку (воркеры завершат текущую страницу).
+        Рассылка без выполняющего узла завершается сразу.
+        """
+        script = await get_script(CANCEL_JOB_LUA)
+        result = await script(
+            keys=[
+                f"{BroadcastService.KEY_PREFIX}{job_id}",
+                f"{BroadcastService.LOCK_PREFIX}{job_id}",
+                BroadcastService.ACTIVE_KEY,
+            ],
+            args=[job_id, BroadcastService.FINISHED_TTL]
+        )
+        return result != 0
+
+    @staticmethod
+    def start(bot: Bot, job_id: int) -> asyncio.Task:
+        """Запустить рассылку в фоне"""
+        task = asyncio.create_task(BroadcastService.run(bot, job_id))
+        BroadcastService._tasks.add(task)
+        task.add_done_callback(BroadcastService._tasks.discard)
+        return task
+
+    @staticmethod
+    async def resume(bot: Bot) -> Optional[int]:
+        """Продолжить прерванную рассылку (при старте бота). Возвращает её ID."""
+        job = await BroadcastService.get_active()
+        if not job or job["status"] != "running":
+            return None
+        BroadcastService.start(bot, job["id"])
+        return job["id"]
+
+    @staticmethod
+    async def _fetch_page(after_user_id: int) -> List[Tuple[int, int]]:
+        """Следующая страница получателей: (user_id, telegram_id) с ID больше after_user_id"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(User.id, User.telegram_id)
+                .where(User.id > after_user_id)
+                .order_by(User.id)
+                .limit(BroadcastService.PAGE_SIZE)
+            )
+            return [(row.id, row.telegram_id) for row in result]
+
+    @staticmethod
+    async def _send(bot: Bot, bucket: TokenBucket, chat_id: int, text: str) -> str:
+        """Отправить одно сообщение. Возвращает "sent", "blocked" или "failed"."""
+        network_errors = 0
+        while True:
+            await bucket.acquire()
+            try:
+                await bot.send_message(chat_id=chat_id, text=text)
+                return "sent"
+            except RetryAfter as e:
+                # Telegram просит подождать — приостанавливаем все воркеры
+                bucket.pause(float(e.retry_after))
+            except Forbidden:
+                # Пользователь заблокировал бота
+                return "blocked"
+            except BadRequest as e:
+                print(f"[BROADCAST] Не удалось отправить {chat_id}: {e}")
+                return "failed"
+            except NetworkError as e:
+                network_errors += 1
+                if network_errors > BroadcastService.MAX_NETWORK_RETRIES:
+                    print(f"[BROADCAST] Не удалось отправить {chat_id}: {e}")
+                    return "failed"
+                await asyncio.sleep(network_errors)
+            except TelegramError as e:
+                print(f"[BROADCAST] Не удалось отправить {chat_id}: {e}")
+                return "failed"
+
+    @staticmethod
+    def format_progress(job: dict) -> str:
+        """Текст отчёта о рассылке для админа"""
+        done = job["sent"] + job["blocked"] + job["failed"]
+        titles = {
+            "running": "📤 Рассылка",
+            "done": "✅ Рассылка завершена",
+            "cancelled": "⏹ Рассылка остановлена",
+        }
+        message = f"{titles.get(job['status'], 'Рассылка')} #{job['id']}\n\n"
+        if job["total"]:
+            message += f"Обработано: {done} из ~{job['total']} ({min(done / job['total'], 1) * 100:.0f}%)\n"
+        else:
+            message += f"Обработано: {done}\n"
+        message += f"Отправлено: {job['sent']}\n"
+        message += f"Заблокировали бота: {job['blocked']}\n"
+        message += f"Ошибок: {job['failed']}"
+        return message
+
+    @staticmethod
+    async def _report(bot: Bot, job_id: int):
+        """Обновить сообщение с прогрессом у админа"""
+        job = await BroadcastService.get(job_id)
+        text = BroadcastService.format_progress(job)
+        try:
+            if job["progress_message_id"]:
+                await bot.edit_message_text(
+                    chat_id=job["admin_chat_id"],
+                    message_id=job["progress_message_id"],
+                    text=text
+                )
+            else:
+                message = await bot.send_message(chat_id=job["admin_chat_id"], text=text)
+                redis = await get_redis()
+                await redis.hset(
+                    f"{BroadcastService.KEY_PREFIX}{job_id}", "progress_message_id", message.message_id
+                )
+        except TelegramError as e:
+            # Например, "message is not modified" — отчёт не критичен
+            print(f"[BROADCAST] Не удалось обновить прогресс: {e}")
+
+    @staticmethod
+    async def _keep_lock(lock_key: str, lost: asyncio.Event):
+        """Продлевать блокировку рассылки, пока она выполняется; lost — блокировка потеряна"""
+        renew = await get_script(RENEW_LOCK_LUA)
+        while True:
+            await asyncio.sleep(BroadcastService.LOCK_RENEW_INTERVAL_SECONDS)
+            try:
+                renewed = await renew(keys=[lock_key], args=[NODE_ID, BroadcastService.LOCK_TTL])
+            except Exception as e:
+                # Ошибка Redis — пробуем снова; блокировка живёт ещё LOCK_TTL
+                print(f"[BROADCAST] Не удалось продлить блокировку {lock_key}: {e}")
+                continue
+            if not renewed:
+                lost.set()
+                return
+
+    @staticmethod
+    async def run(bot: Bot, job_id: int):
+        """
+        Выполнить рассылку с сохранённой позиции.
+        Позиция сохраняется после каждой страницы, поэтому после перезапуска
+        повторно могут получить сообщение не больше PAGE_SIZE пользователей.
+        """
+        redis = await get_redis()
+        key = f"{BroadcastService.KEY_PREFIX}{job_id}"
+        lock_key = f"{BroadcastService.LOCK_PREFIX}{job_id}"
+        if not await redis.set(lock_key, NODE_ID, nx=True, ex=BroadcastService.LOCK_TTL):
+            # Рассылку уже выполняет другой узел
+            return
+
+        job = await BroadcastService.get(job_id)
+        bucket = TokenBucket(settings.BROADCAST_RATE_PER_SECOND, settings.BROADCAST_WORKERS)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=BroadcastService.PAGE_SIZE)
+        counts = {"sent": 0, "blocked": 0, "failed": 0}
+
+        async def worker():
+            while True:
+                chat_id = await queue.get()
+                try:
+                    outcome = await BroadcastService._send(bot, bucket, chat_id, job["text"])
+                    counts[outcome] += 1
+                except Exception as e:
+                    counts["failed"] += 1
+                    print(f"[BROADCAST] Ошибка отправки {chat_id}: {e}")
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(settings.BROADCAST_WORKERS)]
+        lock_lost = asyncio.Event()
+        lock_keeper = asyncio.create_task(BroadcastService._keep_lock(lock_key, lock_lost))
+        last_user_id = job["last_user_id"]
+        last_report = 0.0
+        status = "running"
+
+        try:
+            await BroadcastService._report(bot, job_id)
+            while True:
+                status = await redis.hget(key, "status")
+                if status != "running":
+                    break
+
+                page = await BroadcastService._fetch_page(last_user_id)
+                if not page:
+                    status = "done"
+                    break
+
+                for _, telegram_id in page:
+                    if lock_lost.is_set():
+                        break
+                    await queue.put(telegram_id)
+                if lock_lost.is_set():
+                    # Рассылку продолжает другой узел — не отправляем одно и то же дважды
+                    print(f"[BROADCAST] Рассылка #{job_id}: блокировка потеряна, остановка")
+                    break
+                await queue.join()
+                last_user_id = page[-1][0]
+
+                # Счётчики и позиция сохраняются вместе — после перезапуска они согласованы
+                async with redis.pipeline(transaction=True) as pipe:
+                    for field, value in counts.items():
+                        pipe.hincrby(key, field, value)
+                    pipe.hset(key, "last_user_id", last_user_id)
+                    await pipe.execute()
+                counts = {field: 0 for field in counts}
+
+                if time.monotonic() - last_report >= BroadcastService.PROGRESS_INTERVAL_SECONDS:
+                    last_report = time.monotonic()
+                    await BroadcastService._report(bot, job_id)
+
+            if status == "done":
+                await redis.hset(key, "status", "done")
+            if status in ("done", "cancelled"):
+                finish = await get_script(FINISH_JOB_LUA)
+                await finish(
+                    keys=[key, BroadcastService.ACTIVE_KEY],
+                    args=[job_id, BroadcastService.FINISHED_TTL]
+                )
+                await BroadcastService._report(bot, job_id)
+                print(f"[BROADCAST] Рассылка #{job_id}: {status}")
+        except Exception as e:
+            # Рассылка остаётся в статусе running и продолжится через /resume_broadcast
+            print(f"[BROADCAST] Ошибка рассылки #{job_id}: {e}")
+        finally:
+            for task in [*workers, lock_keeper]:
+                task.cancel()
+            await asyncio.gather(*workers, lock_keeper, return_exceptions=True)
+            release = await get_script(RELEASE_LOCK_LUA)
+            await release(keys=[lock_key], args=[NODE_ID])
@@ -0,0 +1,363 @@
+"""
+Хранилище холста в Redis: плотные массивы цветов, владельцев и команд-владельцев клеток
+Каждая клетка — u32 по смещению y * CANVAS_WIDTH + x (порядок байт big-endian, как в BITFIELD)
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional, List, Tuple, Dict
+
+from app.models.pixel import Pixel
+from app.models.team import team_members
+from app.core.config import settings
+from app.core.redis import get_redis_binary, get_script
+from app.services.leaderboard_service import LeaderboardService
+
+
+# Размещение: (x, y, color, user_id, team_id); team_id = 0, если игрок без команды,
+# color = None — клетка очищается
+Placement = Tuple[int, int, Optional[str], int, int]
+
+
+# Применение пачки размещений к массивам холста, счётчикам и лидербордам.
+# KEYS: 1 цвета, 2 владельцы, 3 заполнено клеток, 4 гистограмма цветов,
+#       5 лидерборд игроков, 6 лидерборд команд, 7 счётчик минуты, 8 HLL активных за день,
+#       9/10 лидерборд игроков за день/неделю, 11/12 лидерборд команд за день/неделю,
+#       13 команды-владельцы клеток, 14 количество клеток по командам,
+#       15 количество клеток по игрокам,
+#       далее (если учитываются игроки) по 2 ключа на размещение: статистика и цвета игрока
+# ARGV: 1 TTL счётчика минуты, 2 TTL HLL дня, 3 TTL дневных, 4 TTL недельных лидербордов,
+#       5 учитывать ли размещения в лидербордах и активности ('1'/'0'),
+#       6 номер текущего дня (UTC),
+#       далее по 4 значения на размещение: индекс клетки, код цвета, user_id, team_id
+# Ключи лежат в разных слотах: скрипт рассчитан на один узел Redis (не Cluster)
+APPLY_PLACEMENTS_LUA = """
+local track_players = ARGV[5] == '1'
+local today = tonumber(ARGV[6])
+local placed = 0
+for i = 7, #ARGV, 4 do
+    local offset = '#' .. ARGV[i]
+    local code = tonumber(ARGV[i + 1])
+    local user_id = ARGV[i + 2]
+    local team_id = ARGV[i + 3]
+
+    local old = redis.call('BITFIELD', KEYS[1], 'SET', 'u32', offset, code)[1]
+    local old_owner = redis.call('BITFIELD', KEYS[2], 'SET', 'u32', offset, user_id)[1]
+
+    -- Клетки во владении игроков (владелец — автор последнего пикселя)
+    local owner_changed = tostring(old_owner) ~= user_id
+    if old ~= 0 and (owner_changed or code == 0) then
+        if redis.call('ZINCRBY', KEYS[15], -1, old_owner) + 0 <= 0 then
+            redis.call('ZREM', KEYS[15], old_owner)
+        end
+    end
+    if code ~= 0 and (owner_changed or old == 0) then
+        redis.call('ZINCRBY', KEYS[15], 1, user_id)
+    end
+
+    local old_team = redis.call('BITFIELD', KEYS[13], 'SET', 'u32', offset, team_id)[1]
+    if tostring(old_team) ~= team_id then
+        if old_team ~= 0 and redis.call('ZINCRBY', KEYS[14], -1, old_team) + 0 <= 0 then
+            redis.call('ZREM', KEYS[14], old_team)
+        end
+        if team_id ~= '0' then
+            redis.call('ZINCRBY', KEYS[14], 1, team_id)
+        end
+    end
+
+    if old == 0 then
+        if code ~= 0 then
+            redis.call('INCR', KEYS[3])
+        end
+    else
+        local old_color = string.format('#%06X', old - 16777216)
+        if redis.call('HINCRBY', KEYS[4], old_color, -1) <= 0 then
+            redis.call('HDEL', KEYS[4], old_color)
+        end
+        if code == 0 then
+            redis.call('DECR', KEYS[3])
+        end
+    end
+    if code ~= 0 then
+        redis.call('HINCRBY', KEYS[4], string.format('#%06X', code - 16777216), 1)
+    end
+
+    if track_players then
+        redis.call('ZINCRBY', KEYS[5], 1, user_id)
+        redis.call('ZINCRBY', KEYS[9], 1, user_id)
+        redis.call('ZINCRBY', KEYS[10], 1, user_id)
+        if team_id ~= '0' then
+            redis.call('ZINCRBY', KEYS[6], 1, team_id)
+            redis.call('ZINCRBY', KEYS[11], 1, team_id)
+            redis.call('ZINCRBY', KEYS[12], 1, team_id)
+        end
+        redis.call('PFADD', KEYS[8], user_id)
+
+        -- Личная статистика: любимый цвет и серия дней с размещениями
+        local stats_key = KEYS[16 + placed * 2]
+        local colors_key = KEYS[17 + placed * 2]
+        local stats = redis.call('HMGET', stats_key, 'fav_count', 'last_day', 'streak', 'best_streak')
+        if code ~= 0 then
+            local color = string.format('#%06X', code - 16777216)
+            local count = redis.call('HINCRBY', colors_key, color, 1)
+            if count > tonumber(stats[1] or '0') then
+                redis.call('HSET', stats_key, 'fav_color', color, 'fav_count', count)
+            end
+        end
+        local last_day = tonumber(stats[2] or '-1')
+        if last_day ~= today then
+            local streak = 1
+            if last_day == today - 1 then
+                streak = tonumber(stats[3] or '0') + 1
+            end
+            redis.call('HSET', stats_key, 'last_day', today, 'streak', streak)
+            if streak > tonumber(stats[4] or '0') then
+                redis.call('HSET', stats_key, 'best_streak', streak)
+            end
+        end
+    end
+    placed = placed + 1
+end
+
+if placed > 0 then
+    redis.call('INCRBY', KEYS[7], placed)
+    redis.call('EXPIRE', KEYS[7], ARGV[1])
+    redis.call('EXPIRE', KEYS[8], ARGV[2])
+    for k = 9, 12 do
+        redis.call('EXPIRE', KEYS[k], k % 2 == 1 and ARGV[3] or ARGV[4])
+    end
+end
+return placed
+"""
+
+
+class CanvasStore:
+    """Плотное представление холста в Redis"""
+
+    COLORS_KEY = "canvas:colors"  # u32 на клетку: 0 — пусто, иначе COLOR_FLAG | RGB
+    OWNERS_KEY = "canvas:owners"  # u32 на клетку: ID пользователя, поставившего пиксель
+    TEAMS_KEY = "canvas:teams"  # u32 на клетку: ID основной команды автора пикселя (0 — без команды)
+    TERRITORY_KEY = "canvas:territory"  # sorted set: количество клеток у каждой команды
+    OWNED_KEY = "canvas:owned"  # sorted set: количество клеток у каждого игрока
+
+    CELL_BYTES = 4
+    COLOR_FLAG = 1 << 24  # Отличает чёрный цвет (#000000) от пустой клетки
+
+    # Максимум размещений в одном вызове скрипта, чтобы не блокировать Redis надолго
+    APPLY_CHUNK_SIZE = 5000
+
+    # Ключи счётчиков статистики, которые обновляются вместе с массивами
+    FILLED_KEY = "stats:filled"
+    COLORS_HISTOGRAM_KEY = "stats:colors"
+    MINUTE_KEY_PREFIX = "stats:placements:"
+    ACTIVE_DAY_KEY_PREFIX = "stats:active:"
+    # Личная статистика игрока (hash): fav_color, fav_count, last_day, streak, best_streak
+    USER_STATS_PREFIX = "stats:user:"
+    # Количество пикселей игрока по цветам (hash), для выбора любимого цвета
+    USER_COLORS_PREFIX = "stats:user_colors:"
+
+    MINUTE_KEY_TTL = 2 * 60 * 60  # 2 часа
+    ACTIVE_DAY_KEY_TTL = 35 * 24 * 60 * 60  # 35 дней
+
+    @staticmethod
+    def cell_index(x: int, y: int) -> int:
+        """Индекс клетки в массиве холста"""
+        return y * settings.CANVAS_WIDTH + x
+
+    @staticmethod
+    def cells_count() -> int:
+        """Количество клеток холста"""
+        return settings.CANVAS_WIDTH * settings.CANVAS_HEIGHT
+
+    @staticmethod
+    def encode_color(color: str) -> int:
+        """HEX цвет (#RRGGBB) -> код клетки"""
+        return CanvasStore.COLOR_FLAG | int(color[1:7], 16)
+
+    @staticmethod
+    def decode_color(code: int) -> Optional[str]:
+        """Код клетки -> HEX цвет (None для пустой клетки)"""
+        if code == 0:
+            return None
+        return f"#{code & 0xFFFFFF:06X}"
+
+    @staticmethod
+    def day_number(moment: Optional[datetime] = None) -> int:
+        """Номер дня (UTC) от начала эпохи — для подсчёта серий"""
+        moment = moment or datetime.now(timezone.utc)
+        return int(moment.timestamp()) // 86400
+
+    @staticmethod
+    def minute_key(moment: Optional[datetime] = None) -> str:
+        """Ключ счётчика размещений за минуту"""
+        moment = moment or datetime.now(timezone.utc)
+        return f"{CanvasStore.MINUTE_KEY_PREFIX}{int(moment.timestamp()) // 60}"
+
+    @staticmethod
+    def active_day_key(moment: Optional[datetime] = None) -> str:
+        """Ключ HyperLogLog активных пользователей за день (UTC)"""
+        moment = moment or datetime.now(timezone.utc)
+        return f"{CanvasStore.ACTIVE_DAY_KEY_PREFIX}{moment.strftime('%Y%m%d')}"
+
+    @staticmethod
+    async def apply_placements(
+        placements: List[Placement],
+        track_players: bool = True
+    ) -> int:
+        """
+        Записать размещения в массивы холста и обновить счётчики.
+        Каждая пачка применяется атомарно одним вызовом Lua-скрипта.
+        track_players=False — админские операции: лидерборды и активность не меняются.
+        """
+        if not placements:
+            return 0
+
+        script = await get_script(APPLY_PLACEMENTS_LUA)
+        base_keys = [
+            CanvasStore.COLORS_KEY,
+            CanvasStore.OWNERS_KEY,
+            CanvasStore.FILLED_KEY,
+            CanvasStore.COLORS_HISTOGRAM_KEY,
+            LeaderboardService.PIXELS_KEY,
+            LeaderboardService.TEAMS_KEY,
+            CanvasStore.minute_key(),
+            CanvasStore.active_day_key(),
+            LeaderboardService.board_key("pixels", "day"),
+            LeaderboardService.board_key("pixels", "week"),
+            LeaderboardService.board_key("teams", "day"),
+            LeaderboardService.board_key("teams", "week"),
+            CanvasStore.TEAMS_KEY,
+            CanvasStore.TERRITORY_KEY,
+            CanvasStore.OWNED_KEY,
+        ]
+
+        applied = 0
+        for start in range(0, len(placements), CanvasStore.APPLY_CHUNK_SIZE):
+            chunk = placements[start:start + CanvasStore.APPLY_CHUNK_SIZE]
+            keys = list(base_keys)
+            if track_players:
+                for _, _, _, user_id, _ in chunk:
+                    keys.extend((
+                        f"{CanvasStore.USER_STATS_PREFIX}{user_id}",
+                        f"{CanvasStore.USER_COLORS_PREFIX}{user_id}"
+                    ))
+            args = [
+                CanvasStore.MINUTE_KEY_TTL,
+                CanvasStore.ACTIVE_DAY_KEY_TTL,
+                LeaderboardService.DAY_KEY_TTL,
+                LeaderboardService.WEEK_KEY_TTL,
+                1 if track_players else 0,
+                CanvasStore.day_number(),
+            ]
+            for x, y, color, user_id, team_id in chunk:
+                args.extend((
+                    CanvasStore.cell_index(x, y),
+                    CanvasStore.encode_color(color) if color else 0,
+                    user_id,
+                    team_id or 0
+                ))
+            applied += await script(keys=keys, args=args)
+
+        return applied
+
+    @staticmethod
+    async def read_array(key: str) -> bytes:
+        """Прочитать массив холста целиком (недостающий хвост дополняется нулями)"""
+        redis = await get_redis_binary()
+        data = await redis.get(key) or b""
+        size = CanvasStore.cells_count() * CanvasStore.CELL_BYTES
+        return data[:size].ljust(size, b"\x00")
+
+    @staticmethod
+    async def read_colors() -> bytes:
+        """Прочитать массив цветов целиком"""
+        return await CanvasStore.read_array(CanvasStore.COLORS_KEY)
+
+    @staticmethod
+    async def read_teams() -> bytes:
+        """Прочитать массив команд-владельцев целиком"""
+        return await CanvasStore.read_array(CanvasStore.TEAMS_KEY)
+
+    @staticmethod
+    async def is_loaded() -> bool:
+        """Есть ли массивы холста в Redis"""
+        redis = await get_redis_binary()
+        keys = (CanvasStore.COLORS_KEY, CanvasStore.OWNERS_KEY, CanvasStore.TEAMS_KEY)
+        return await redis.exists(*keys) == len(keys)
+
+    @staticmethod
+    async def rebuild_from_db(db: AsyncSession) -> Tuple[int, Dict[str, int]]:
+        """
+        Пересобрать массивы холста, территории команд и клетки игроков из таблицы pixels.
+        Возвращает (количество заполненных клеток, гистограмму цветов).
+        Размещения, пришедшие во время пересборки, могут потеряться —
+        их поправит следующая сверка.
+        """
+        # Основная команда каждого игрока — первая, в которую он вступил
+        primary_teams: Dict[int, int] = {}
+        memberships = await db.execute(
+            select(team_members.c.user_id, team_members.c.team_id)
+            .order_by(team_members.c.joined_at, team_members.c.team_id)
+        )
+        for user_id, team_id in memberships.all():
+            primary_teams.setdefault(user_id, team_id)
+
+        cell_bytes = CanvasStore.CELL_BYTES
+        size = CanvasStore.cells_count() * cell_bytes
+        colors = bytearray(size)
+        owners = bytearray(size)
+        teams = bytearray(size)
+        histogram: Counter = Counter()
+        territory: Counter = Counter()
+        owned: Counter = Counter()
+        filled = 0
+
+        result = await db.stream(
+            select(Pixel.x, Pixel.y, Pixel.color, Pixel.user_id)
+        )
+        async for x, y, color, user_id in result:
+            if not (0 <= x < settings.CANVAS_WIDTH and 0 <= y < settings.CANVAS_HEIGHT):
+                continue
+            offset = CanvasStore.cell_index(x, y) * cell_bytes
+            previous = int.from_bytes(colors[offset:offset + cell_bytes], "big")
+            if previous == 0:
+                filled += 1
+            else:
+                histogram[CanvasStore.decode_color(previous)] -= 1
+                territory[int.from_bytes(teams[offset:offset + cell_bytes], "big")] -= 1
+                owned[int.from_bytes(owners[offset:offset + cell_bytes], "big")] -= 1
+            code = CanvasStore.encode_color(color)
+            team_id = primary_teams.get(user_id, 0)
+            colors[offset:offset + cell_bytes] = code.to_bytes(cell_bytes, "big")
+            owners[offset:offset + cell_bytes] = user_id.to_bytes(cell_bytes, "big")
+            teams[offset:offset + cell_bytes] = team_id.to_bytes(cell_bytes, "big")
+            histogram[CanvasStore.decode_color(code)] += 1
+            territory[team_id] += 1
+            owned[user_id] += 1
+
+        territory_scores = {
+            str(team_id): count
+            for team_id, count in territory.items()
+            if team_id != 0 and count > 0
+        }
+        owned_scores = {
+            str(user_id): count
+            for user_id, count in owned.items()
+            if count > 0
+        }
+
+        redis = await get_redis_binary()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(CanvasStore.COLORS_KEY, bytes(colors))
+            pipe.set(CanvasStore.OWNERS_KEY, bytes(owners))
+            pipe.set(CanvasStore.TEAMS_KEY, bytes(teams))
+            pipe.delete(CanvasStore.TERRITORY_KEY)
+            if territory_scores:
+                pipe.zadd(CanvasStore.TERRITORY_KEY, territory_scores)
+            pipe.delete(CanvasStore.OWNED_KEY)
+            if owned_scores:
+                pipe.zadd(CanvasStore.OWNED_KEY, owned_scores)
+            await pipe.execute()
+
+        return filled, {color: count for color, count in histogram.items() if count > 0}
@@ -0,0 +1,33 @@
+"""
+Выдача кодов игр и команд без проверки уникальности
+Код — номер из последовательности Postgres, переставленный сетью Фейстеля
+(биекция на 30 битах) и записанный 6 символами алфавита из 32 символов.
+Разные номера дают разные коды, а соседние номера — непохожие коды.
+Код вычисляется в самом INSERT функцией permuted_code (миграция 013);
+алфавит — заглавные буквы и цифры без похожих символов (0, O, I, 1),
+ключ перестановки хранится в БД (таблица code_secret).
+"""
+from sqlalchemy import Sequence, func
+from sqlalchemy.sql.elements import ColumnElement
+
+
+class CodeService:
+    """Сервис для выдачи уникальных кодов"""
+
+    # Последовательности номеров по видам кодов (миграция 009)
+    SEQUENCES = {
+        "game": "game_code_seq",
+        "team": "team_code_seq",
+    }
+
+    @staticmethod
+    def next_code(namespace: str) -> ColumnElement:
+        """
+        Новый код ("game" или "team") — SQL-выражение для значения столбца code.
+        Номер берётся из последовательности в том же INSERT, отдельного запроса нет;
+        код доступен после flush/refresh объекта.
+        """
+        return func.permuted_code(
+            Sequence(CodeService.SEQUENCES[namespace]).next_value(),
+            namespace
+        )
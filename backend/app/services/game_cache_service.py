@@ -0,0 +1,96 @@
+"""
+Кеш метаданных игр в Redis (read-through)
+Игроки, статус, уровень и размер поля читаются без запроса к БД;
+кеш сбрасывается при каждом изменении игры
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.engine import Row
+from typing import Optional, Union
+import json
+
+from app.models.game import GameSession
+from app.core.redis import get_redis
+from app.core import queries
+
+
+class GameCacheService:
+    """Сервис для кеша метаданных игр"""
+
+    META_PREFIX = "game:meta:"  # game_id -> JSON метаданных
+    CODE_PREFIX = "game:code:"  # код -> game_id (код игры не меняется)
+    CACHE_TTL = 10 * 60  # 10 минут
+
+    @staticmethod
+    def to_meta(game: Union[GameSession, Row]) -> dict:
+        """Метаданные игры для кеша (из объекта GameSession или строки queries.GAME_META_*)"""
+        return {
+            "id": game.id,
+            "code": game.code,
+            "mode": game.mode.value,
+            "status": game.status.value,
+            "current_level": game.current_level,
+            "grid_size": game.grid_size,
+            "sequence": game.sequence,
+            "player1_id": game.player1_id,
+            "player2_id": game.player2_id,
+            "pixels_to_place": game.pixels_to_place,
+            "winner_id": game.winner_id
+        }
+
+    @staticmethod
+    async def store(game: Union[GameSession, Row]) -> dict:
+        """Положить метаданные игры в кеш"""
+        meta = GameCacheService.to_meta(game)
+        redis = await get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.setex(f"{GameCacheService.META_PREFIX}{game.id}", GameCacheService.CACHE_TTL, json.dumps(meta))
+            pipe.setex(f"{GameCacheService.CODE_PREFIX}{game.code}", GameCacheService.CACHE_TTL, game.id)
+            await pipe.execute()
+        return meta
+
+    @staticmethod
+    async def get(db: AsyncSession, game_id: int) -> Optional[dict]:
+        """Метаданные игры по ID"""
+        redis = await get_redis()
+        cached = await redis.get(f"{GameCacheService.META_PREFIX}{game_id}")
+        if cached:
+            return json.loads(cached)
+
+        game = await queries.fetch_one(db, queries.GAME_META_BY_ID, game_id=game_id)
+        if game is None:
+            return None
+        return await GameCacheService.store(game)
+
+    @staticmethod
+    async def get_by_code(db: AsyncSession, game_code: str) -> Optional[dict]:
+        """Метаданные игры по коду"""
+        game_code = game_code.upper()
+        redis = await get_redis()
+        game_id = await redis.get(f"{GameCacheService.CODE_PREFIX}{game_code}")
+        if game_id:
+            return await GameCacheService.get(db, int(game_id))
+
+        game = await queries.fetch_one(db, queries.GAME_META_BY_CODE, code=game_code)
+        if game is None:
+            return None
+        return await GameCacheService.store(game)
+
+    @staticmethod
+    async def patch(game_id: int, **fields):
+        """Обновить поля закешированной игры (если она в кеше), не обращаясь к БД"""
+        key = f"{GameCacheService.META_PREFIX}{game_id}"
+        redis = await get_redis()
+        cached = await redis.get(key)
+        if not cached:
+            return
+        meta = json.loads(cached)
+        meta.update(fields)
+        await redis.set(key, json.dumps(meta), xx=True, keepttl=True)
+
+    @staticmethod
+    async def invalidate(*game_ids: int):
+        """Сбросить кеш игр после изменения"""
+        if not game_ids:
+            return
+        redis = await get_redis()
+        await redis.delete(*[f"{GameCacheService.META_PREFIX}{game_id}" for game_id in game_ids])
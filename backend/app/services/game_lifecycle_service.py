@@ -0,0 +1,130 @@
+"""
+Жизненный цикл игровых сессий
+Брошенные игры отменяются пакетами, законченные переносятся в компактный архив,
+состояние игр в Redis удаляется вместе с ними
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, and_, or_, func, text
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from app.models.game import GameSession, GameStatus
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.game_cache_service import GameCacheService
+from app.services.pvp_state_service import PvpStateService
+
+
+# Перенос законченных сессий в архив одним запросом (DELETE ... RETURNING -> INSERT).
+# Если ID уже есть в архиве, запись архива заменяется: удалённая сессия не теряется
+ARCHIVE_SQL = """
+    WITH moved AS (
+        DELETE FROM game_sessions
+        WHERE id IN (
+            SELECT id FROM game_sessions
+            WHERE status IN ('finished', 'cancelled')
+              AND COALESCE(finished_at, created_at) < :cutoff
+            ORDER BY id
+            LIMIT :batch
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, code, mode, status, player1_id, player2_id, winner_id,
+                  current_level, created_at, finished_at
+    )
+    INSERT INTO game_archive (id, code, mode, status, player1_id, player2_id, winner_id,
+                              level_reached, created_at, finished_at)
+    SELECT id, code, mode, status, player1_id, player2_id, winner_id,
+           current_level, created_at, finished_at
+    FROM moved
+    ON CONFLICT (id) DO UPDATE
+    SET code = EXCLUDED.code,
+        mode = EXCLUDED.mode,
+        status = EXCLUDED.status,
+        player1_id = EXCLUDED.player1_id,
+        player2_id = EXCLUDED.player2_id,
+        winner_id = EXCLUDED.winner_id,
+        level_reached = EXCLUDED.level_reached,
+        created_at = EXCLUDED.created_at,
+        finished_at = EXCLUDED.finished_at
+"""
+
+
+class GameLifecycleService:
+    """Сервис для очистки и архивации игровых сессий"""
+
+    BATCH_SIZE = 1000
+    MAX_BATCHES = 20  # Пакетов за один запуск (остальное — в следующий)
+
+    @staticmethod
+    async def expire_abandoned(db: AsyncSession) -> List[int]:
+        """
+        Отменить брошенные игры: ожидающие соперника дольше GAME_WAITING_TTL_MINUTES
+        и идущие без изменений дольше GAME_IDLE_TTL_MINUTES.
+        Возвращает ID отменённых игр.
+        """
+        now = datetime.now(timezone.utc)
+        last_activity = func.coalesce(GameSession.updated_at, GameSession.created_at)
+        expired = []
+
+        for _ in range(GameLifecycleService.MAX_BATCHES):
+            stale = (
+                select(GameSession.id)
+                .where(or_(
+                    and_(
+                        GameSession.status == GameStatus.WAITING,
+                        last_activity < now - timedelta(minutes=settings.GAME_WAITING_TTL_MINUTES)
+                    ),
+                    and_(
+                        GameSession.status == GameStatus.IN_PROGRESS,
+                        last_activity < now - timedelta(minutes=settings.GAME_IDLE_TTL_MINUTES)
+                    )
+                ))
+                .limit(GameLifecycleService.BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            result = await db.execute(
+                update(GameSession)
+                .where(GameSession.id.in_(stale))
+                .values(status=GameStatus.CANCELLED, finished_at=now)
+                .returning(GameSession.id)
+                .execution_options(synchronize_session=False)
+            )
+            batch = list(result.scalars().all())
+            await db.commit()
+
+            if batch:
+                await PvpStateService.drop(*batch)
+                await GameCacheService.invalidate(*batch)
+                expired.extend(batch)
+            if len(batch) < GameLifecycleService.BATCH_SIZE:
+                break
+
+        return expired
+
+    @staticmethod
+    async def archive_finished(db: AsyncSession) -> int:
+        """Перенести законченные игры старше GAME_ARCHIVE_AFTER_DAYS в game_archive"""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.GAME_ARCHIVE_AFTER_DAYS)
+        archived = 0
+
+        for _ in range(GameLifecycleService.MAX_BATCHES):
+            result = await db.execute(
+                text(ARCHIVE_SQL),
+                {"cutoff": cutoff, "batch": GameLifecycleService.BATCH_SIZE}
+            )
+            await db.commit()
+            archived += result.rowcount
+            if result.rowcount < GameLifecycleService.BATCH_SIZE:
+                break
+
+        return archived
+
+    @staticmethod
+    async def run_reaper():
+        """Периодическая очистка игр (для планировщика)"""
+        async with AsyncSessionLocal() as db:
+            expired = await GameLifecycleService.expire_abandoned(db)
+            archived = await GameLifecycleService.archive_finished(db)
+        if expired or archived:
+            print(f"[GAMES] Отменено брошенных игр: {len(expired)}, перенесено в архив: {archived}")
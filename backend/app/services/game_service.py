@@ -2,17 +2,93 @@
 Сервис для игры "Повтори пиксели"
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
+from sqlalchemy import select, func, update, and_, or_, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import Optional, List, Tuple
-import secrets
-import string
-import random
+from datetime import datetime, timezone
+import hashlib
+import hmac
 import time
-import json
 
-from app.models.game import GameSession, GameResult, GameMode, GameStatus
+from app.models.game import GameSession, GameResult, GameMode, GameStatus, UserBestResult
 from app.models.user import User
-from app.core.redis import get_redis
+from app.core.config import settings
+from app.core.redis import get_redis, get_script, publish_match_found
+from app.services.leaderboard_service import LeaderboardService
+from app.services.pvp_state_service import PvpStateService
+from app.services.game_cache_service import GameCacheService
+from app.services.code_service import CodeService
+
+
+# Вход в очередь PvP: атомарный подбор пары.
+# Все ключи, которые скрипт может изменить, передаются в KEYS (очередь прежней корзины
+# игрока заранее неизвестна, поэтому передаются очереди всех корзин).
+# KEYS: 1 hash корзин ожидающих, 2.. очереди корзин 0..PVP_MAX_BUCKET (корзина b — KEYS[b + 2])
+# ARGV: 1 user_id, 2 текущее время (мс), 3 время ожидания (мс), 4 корзина игрока,
+#       5.. корзины для поиска соперника (сначала своя, затем соседние)
+# Возвращает {соперник, его корзина, его время входа} или false, если игрок поставлен в очередь
+PVP_JOIN_LUA = """
+local user = ARGV[1]
+local now = tonumber(ARGV[2])
+local deadline = now - tonumber(ARGV[3])
+
+local function queue(bucket)
+    return KEYS[tonumber(bucket) + 2]
+end
+
+-- Игрок уже ждёт в другой корзине (изменился уровень) — убираем оттуда
+local previous = redis.call('HGET', KEYS[1], user)
+if previous and previous ~= ARGV[4] and queue(previous) then
+    redis.call('ZREM', queue(previous), user)
+end
+
+for i = 5, #ARGV do
+    local bucket = ARGV[i]
+    local key = queue(bucket)
+
+    -- Просроченные ожидания удаляются порциями
+    local stale = redis.call('ZRANGEBYSCORE', key, '-inf', deadline, 'LIMIT', 0, 100)
+    for _, member in ipairs(stale) do
+        redis.call('ZREM', key, member)
+        if redis.call('HGET', KEYS[1], member) == bucket then
+            redis.call('HDEL', KEYS[1], member)
+        end
+    end
+
+    -- Самый давний ожидающий, кроме самого игрока
+    local candidates = redis.call('ZRANGE', key, 0, 1, 'WITHSCORES')
+    for j = 1, #candidates, 2 do
+        local opponent = candidates[j]
+        if opponent ~= user then
+            redis.call('ZREM', key, opponent)
+            redis.call('HDEL', KEYS[1], opponent)
+            redis.call('ZREM', queue(ARGV[4]), user)
+            redis.call('HDEL', KEYS[1], user)
+            return {opponent, bucket, candidates[j + 1]}
+        end
+    end
+end
+
+-- Пары нет: встаём в очередь, сохраняя место при повторном входе
+redis.call('ZADD', queue(ARGV[4]), 'NX', now, user)
+redis.call('HSET', KEYS[1], user, ARGV[4])
+return false
+"""
+
+# Выход из очереди PvP
+# KEYS: 1 hash корзин, 2.. очереди корзин 0..PVP_MAX_BUCKET; ARGV: 1 user_id
+PVP_LEAVE_LUA = """
+local bucket = redis.call('HGET', KEYS[1], ARGV[1])
+if not bucket then
+    return 0
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+local key = KEYS[tonumber(bucket) + 2]
+if not key then
+    return 0
+end
+return redis.call('ZREM', key, ARGV[1])
+"""
 
 
 class GameService:
@@ -24,7 +100,13 @@ class GameService:
     # Уровни 21+: поле 5x5
     
     # Настройки для PvP режима
-    PVP_QUEUE_KEY = "pvp_queue"  # Ключ Redis для очереди ожидания
+    # Ключи очереди с общим hash tag {pvp_queue}: в Redis Cluster они в одном слоте,
+    # и скрипты подбора пары могут работать с ними атомарно
+    PVP_QUEUE_PREFIX = "{pvp_queue}:"  # Очереди ожидания по корзинам (sorted set: user_id -> время входа, мс)
+    PVP_QUEUE_USERS_KEY = "{pvp_queue}:users"  # Корзина каждого ожидающего игрока (hash)
+    PVP_QUEUE_TTL_SECONDS = 300  # Время ожидания в очереди для каждого игрока
+    PVP_BUCKET_LEVELS = 5  # Ширина корзины подбора (по лучшему уровню в игре на память)
+    PVP_MAX_BUCKET = 10
     PVP_GRID_SIZE = 10  # Размер поля для PvP (10x10)
     PVP_PIXELS_TO_PLACE = 5  # Количество пикселей для размещения
     
@@ -39,14 +121,7 @@ class GameService:
             return 5
     
     @staticmethod
-    def generate_game_code(length: int = 6) -> str:
-        """Генерация уникального кода игры"""
-        alphabet = string.ascii_uppercase + string.digits
-        alphabet = alphabet.replace('0', '').replace('O', '').replace('I', '').replace('1', '')
-        return ''.join(secrets.choice(alphabet) for _ in range(length))
-    
-    @staticmethod
-    def generate_sequence(level: int) -> List[dict]:
+    def generate_sequence(game_id: int, level: int) -> List[dict]:
         """
         Генерация последовательности для уровня
         level - количество ячеек в последовательности
@@ -54,16 +129,33 @@ class GameService:
         - Уровни 1-10: поле 3x3
         - Уровни 11-20: поле 4x4
         - Уровни 21+: поле 5x5
+        Последовательность детерминирована: ячейки берутся из HMAC-SHA256
+        (секрет приложения, game_id, level), поэтому её не нужно хранить —
+        сервер восстанавливает любой уровень без обращения к БД.
         Возвращает список координат: [{"x": 0, "y": 0}, {"x": 1, "y": 1}, ...]
         """
         grid_size = GameService.get_grid_size(level)
+        cells = grid_size * grid_size
+        key = settings.APP_SECRET_KEY.encode()
+        
+        stream = b""
+        block = 0
+        while len(stream) < level * 2:
+            stream += hmac.new(key, f"{game_id}:{level}:{block}".encode(), hashlib.sha256).digest()
+            block += 1
+        
         sequence = []
-        for _ in range(level):
-            x = random.randint(0, grid_size - 1)
-            y = random.randint(0, grid_size - 1)
-            sequence.append({"x": x, "y": y})
+        for i in range(level):
+            # 2 байта на ячейку: смещение от взятия по модулю пренебрежимо мало
+            cell = int.from_bytes(stream[i * 2:i * 2 + 2], "big") % cells
+            sequence.append({"x": cell % grid_size, "y": cell // grid_size})
         return sequence
     
+    @staticmethod
+    def get_sequence(game_id: int, level: int, stored: Optional[List[dict]] = None) -> List[dict]:
+        """Последовательность текущего уровня (сохранённая — у игр, начатых до вычисляемых последовательностей)"""
+        return stored or GameService.generate_sequence(game_id, level)
+    
     @staticmethod
     def validate_sequence(user_sequence: List[dict], correct_sequence: List[dict]) -> bool:
         """Проверка правильности последовательности"""
@@ -83,29 +175,14 @@ class GameService:
         user_id: int
     ) -> GameSession:
         """Создать одиночную игру"""
-        # Генерируем уникальный код
-        max_attempts = 10
-        for _ in range(max_attempts):
-            code = GameService.generate_game_code()
-            result = await db.execute(
-                select(GameSession).where(GameSession.code == code)
-            )
-            if result.scalar_one_or_none() is None:
-                break
-        else:
-            raise ValueError("Не удалось сгенерировать уникальный код игры")
-        
-        # Генерируем последовательность для первого уровня
-        sequence = GameService.generate_sequence(1)
-        
+        # Последовательность не хранится: она вычисляется из ID игры и уровня
         game = GameSession(
-            code=code,
+            code=CodeService.next_code("game"),  # Уникален по построению, вычисляется в INSERT
             mode=GameMode.SOLO,
             status=GameStatus.IN_PROGRESS,
             player1_id=user_id,
             current_level=1,
-            grid_size=GameService.get_grid_size(1),
-            sequence=sequence
+            grid_size=GameService.get_grid_size(1)
         )
         
         db.add(game)
@@ -113,6 +190,59 @@ class GameService:
         await db.refresh(game)
         return game
     
+    @staticmethod
+    def game_to_dict(game: GameSession) -> dict:
+        """Состояние игры для ответа клиенту"""
+        return {
+            "id": game.id,
+            "code": game.code,
+            "mode": game.mode.value,
+            "status": game.status.value,
+            "current_level": game.current_level,
+            "grid_size": game.grid_size,
+            "sequence": game.sequence,
+            "player1_id": game.player1_id,
+            "player2_id": game.player2_id,
+            "pixels_to_place": game.pixels_to_place,
+            "player1_pixels": game.player1_pixels,
+            "player2_pixels": game.player2_pixels,
+            "winner_id": game.winner_id
+        }
+    
+    @staticmethod
+    async def start_pvp_state(game: GameSession):
+        """Создать состояние начавшейся PvP игры в Redis (при ошибке оно загрузится при первом ходе)"""
+        try:
+            await PvpStateService.load(game)
+        except Exception as e:
+            print(f"[PVP] Ошибка создания состояния игры {game.id}: {e}")
+    
+    @staticmethod
+    def get_pvp_bucket(level: int) -> int:
+        """Корзина подбора соперника по лучшему уровню в игре на память"""
+        return min(level // GameService.PVP_BUCKET_LEVELS, GameService.PVP_MAX_BUCKET)
+    
+    @staticmethod
+    async def get_user_pvp_bucket(user_id: int) -> int:
+        """Корзина игрока (лучший уровень берётся из лидерборда, O(1))"""
+        position = await LeaderboardService.get_rank("memory", user_id)
+        if position is None:
+            return 0
+        level, _ = LeaderboardService.decode_memory_score(position[1])
+        return GameService.get_pvp_bucket(level)
+    
+    @staticmethod
+    def pvp_queue_key(bucket: int) -> str:
+        """Ключ очереди корзины"""
+        return f"{GameService.PVP_QUEUE_PREFIX}{bucket}"
+    
+    @staticmethod
+    def pvp_script_keys() -> List[str]:
+        """KEYS скриптов очереди: hash корзин и очереди всех корзин"""
+        return [GameService.PVP_QUEUE_USERS_KEY] + [
+            GameService.pvp_queue_key(b) for b in range(GameService.PVP_MAX_BUCKET + 1)
+        ]
+    
     @staticmethod
     async def join_pvp_queue(
         db: AsyncSession,
@@ -120,97 +250,95 @@ class GameService:
     ) -> Optional[GameSession]:
         """
         Войти в очередь ожидания для PvP игры.
-        Если есть другой игрок в очереди, создаёт игру автоматически.
-        Иначе добавляет пользователя в очередь.
+        Подбор пары выполняется атомарно Lua-скриптом: если в корзине игрока
+        (или соседней) есть другой игрок, оба снимаются с очереди и создаётся игра.
+        Иначе пользователь добавляется в очередь.
         """
         try:
             redis = await get_redis()
+            script = await get_script(PVP_JOIN_LUA)
         except Exception as e:
             print(f"Ошибка подключения к Redis: {e}")
             raise ValueError(f"Ошибка подключения к Redis: {e}")
         
+        bucket = await GameService.get_user_pvp_bucket(user_id)
+        neighbours = [
+            b for b in (bucket - 1, bucket + 1)
+            if 0 <= b <= GameService.PVP_MAX_BUCKET
+        ]
+        
         try:
-            # Проверяем, есть ли кто-то в очереди
-            queue_data = await redis.lpop(GameService.PVP_QUEUE_KEY)
-            print(f"[QUEUE] Пользователь {user_id} входит в очередь. Найдено в очереди: {queue_data}")
-        
-            if queue_data:
-                # Нашли пару! Создаём игру
-                try:
-                    waiting_user_id = int(json.loads(queue_data))
-                except (json.JSONDecodeError, ValueError):
-                    waiting_user_id = int(queue_data)
-            
-                # Проверяем, что это не тот же пользователь
-                if waiting_user_id == user_id:
-                    # Возвращаем обратно в очередь и ждём другого
-                    await redis.rpush(GameService.PVP_QUEUE_KEY, json.dumps(user_id))
-                    return None
-                
-                # Создаём игру с двумя игроками
-                code = GameService.generate_game_code()
-                max_attempts = 10
-                for _ in range(max_attempts):
-                    result = await db.execute(
-                        select(GameSession).where(GameSession.code == code)
-                    )
-                    if result.scalar_one_or_none() is None:
-                        break
-                    code = GameService.generate_game_code()
-                else:
-                    raise ValueError("Не удалось сгенерировать уникальный код игры")
-                
-                game = GameSession(
-                    code=code,
-                    mode=GameMode.PVP,
-                    status=GameStatus.IN_PROGRESS,
-                    player1_id=waiting_user_id,
-                    player2_id=user_id,
-                    grid_size=GameService.PVP_GRID_SIZE,
-                    pixels_to_place=GameService.PVP_PIXELS_TO_PLACE,
-                    player1_pixels=[],
-                    player2_pixels=[]
-                )
-                
-                db.add(game)
-                await db.commit()
-                await db.refresh(game)
-                print(f"[QUEUE] Создана игра {game.id} для игроков {waiting_user_id} и {user_id}")
-                return game
-            else:
-                # Нет никого в очереди, добавляем себя
-                await redis.rpush(GameService.PVP_QUEUE_KEY, json.dumps(user_id))
-                # Устанавливаем TTL 5 минут для очереди
-                await redis.expire(GameService.PVP_QUEUE_KEY, 300)
-                print(f"[QUEUE] Пользователь {user_id} добавлен в очередь. Ожидание соперника...")
-                return None
+            matched = await script(keys=GameService.pvp_script_keys(), args=[
+                user_id,
+                int(time.time() * 1000),
+                GameService.PVP_QUEUE_TTL_SECONDS * 1000,
+                bucket,
+                bucket,
+                *neighbours
+            ])
         except Exception as e:
             print(f"[QUEUE] Ошибка при работе с очередью: {e}")
             import traceback
             traceback.print_exc()
             raise
+        
+        if not matched:
+            print(f"[QUEUE] Пользователь {user_id} добавлен в очередь (корзина {bucket}). Ожидание соперника...")
+            return None
+        
+        waiting_user_id, waiting_bucket, enqueued_at = int(matched[0]), int(matched[1]), matched[2]
+        
+        try:
+            # Создаём игру с двумя игроками
+            game = GameSession(
+                code=CodeService.next_code("game"),  # Уникален по построению, вычисляется в INSERT
+                mode=GameMode.PVP,
+                status=GameStatus.IN_PROGRESS,
+                player1_id=waiting_user_id,
+                player2_id=user_id,
+                grid_size=GameService.PVP_GRID_SIZE,
+                pixels_to_place=GameService.PVP_PIXELS_TO_PLACE,
+                player1_pixels=[],
+                player2_pixels=[]
+            )
+            
+            db.add(game)
+            await db.commit()
+            await db.refresh(game)
+        except Exception:
+            # Возвращаем соперника в очередь на его прежнее место
+            await db.rollback()
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.zadd(GameService.pvp_queue_key(waiting_bucket), {str(waiting_user_id): enqueued_at}, nx=True)
+                pipe.hset(GameService.PVP_QUEUE_USERS_KEY, str(waiting_user_id), waiting_bucket)
+                await pipe.execute()
+            raise
+        
+        print(f"[QUEUE] Создана игра {game.id} для игроков {waiting_user_id} и {user_id}")
+        await GameService.start_pvp_state(game)
+        
+        # Уведомляем ожидающих игроков на всех узлах
+        try:
+            await publish_match_found(
+                [waiting_user_id, user_id],
+                GameService.game_to_dict(game)
+            )
+        except Exception as e:
+            print(f"[QUEUE] Ошибка публикации найденной пары: {e}")
+        
+        return game
     
     @staticmethod
     async def leave_pvp_queue(user_id: int):
-        """Покинуть очередь ожидания"""
+        """Покинуть очередь ожидания (O(log N))"""
         try:
-            redis = await get_redis()
-            # Удаляем пользователя из очереди
-            queue_items = await redis.lrange(GameService.PVP_QUEUE_KEY, 0, -1)
-            print(f"[QUEUE] Пользователь {user_id} покидает очередь. Текущая очередь: {queue_items}")
-            for item in queue_items:
-                try:
-                    item_user_id = int(json.loads(item))
-                except (json.JSONDecodeError, ValueError):
-                    try:
-                        item_user_id = int(item)
-                    except (ValueError, TypeError):
-                        continue
-                
-                if item_user_id == user_id:
-                    await redis.lrem(GameService.PVP_QUEUE_KEY, 1, item)
-                    print(f"[QUEUE] Пользователь {user_id} удалён из очереди")
-                    break
+            script = await get_script(PVP_LEAVE_LUA)
+            removed = await script(
+                keys=GameService.pvp_script_keys(),
+                args=[user_id]
+            )
+            if removed:
+                print(f"[QUEUE] Пользователь {user_id} удалён из очереди")
         except Exception as e:
             print(f"[QUEUE] Ошибка при выходе из очереди: {e}")
             import traceback
@@ -222,20 +350,8 @@ class GameService:
         user_id: int
     ) -> GameSession:
         """Создать PvP игру по коду (для приглашения друзей)"""
-        # Генерируем уникальный код
-        max_attempts = 10
-        for _ in range(max_attempts):
-            code = GameService.generate_game_code()
-            result = await db.execute(
-                select(GameSession).where(GameSession.code == code)
-            )
-            if result.scalar_one_or_none() is None:
-                break
-        else:
-            raise ValueError("Не удалось сгенерировать уникальный код игры")
-        
         game = GameSession(
-            code=code,
+            code=CodeService.next_code("game"),  # Уникален по построению, вычисляется в INSERT
             mode=GameMode.PVP,
             status=GameStatus.WAITING,
             player1_id=user_id,
@@ -283,6 +399,8 @@ class GameService:
         
         await db.commit()
         await db.refresh(game)
+        await GameCacheService.invalidate(game.id)
+        await GameService.start_pvp_state(game)
         return game
     
     @staticmethod
@@ -310,20 +428,35 @@ class GameService:
     @staticmethod
     async def next_level(
         db: AsyncSession,
-        game_id: int
-    ) -> GameSession:
-        """Переход на следующий уровень"""
-        game = await GameService.get_game_by_id(db, game_id)
-        if not game:
-            raise ValueError("Игра не найдена")
-        
-        game.current_level += 1
-        game.grid_size = GameService.get_grid_size(game.current_level)
-        game.sequence = GameService.generate_sequence(game.current_level)
-        
+        game_id: int,
+        current_level: int
+    ) -> dict:
+        """
+        Переход на следующий уровень одним UPDATE.
+        Условие по текущему уровню не даёт перейти дважды при повторной отправке ответа.
+        """
+        level = current_level + 1
+        grid_size = GameService.get_grid_size(level)
+        result = await db.execute(
+            update(GameSession)
+            .where(
+                GameSession.id == game_id,
+                GameSession.status == GameStatus.IN_PROGRESS,
+                GameSession.current_level == current_level
+            )
+            .values(current_level=level, grid_size=grid_size, sequence=None)
+        )
         await db.commit()
-        await db.refresh(game)
-        return game
+        if result.rowcount == 0:
+            await GameCacheService.invalidate(game_id)
+            raise ValueError("Уровень уже пройден или игра не активна")
+        
+        await GameCacheService.patch(game_id, current_level=level, grid_size=grid_size, sequence=None)
+        return {
+            "current_level": level,
+            "grid_size": grid_size,
+            "sequence": GameService.generate_sequence(game_id, level)
+        }
     
     @staticmethod
     async def finish_game(
@@ -336,12 +469,12 @@ class GameService:
         play_time_seconds: Optional[int] = None
     ) -> GameResult:
         """Завершить игру и сохранить результат"""
-        game = await GameService.get_game_by_id(db, game_id)
+        game = await GameCacheService.get(db, game_id)
         if not game:
             raise ValueError("Игра не найдена")
         
         # Проверяем, что пользователь участвует в игре
-        if game.player1_id != user_id and game.player2_id != user_id:
+        if game["player1_id"] != user_id and game["player2_id"] != user_id:
             raise ValueError("Пользователь не участвует в этой игре")
         
         # Создаём результат
@@ -357,20 +490,32 @@ class GameService:
         db.add(result)
         
         # Если это PvP и оба игрока завершили, закрываем игру
-        if game.mode == GameMode.PVP:
-            existing_results = await db.execute(
-                select(GameResult).where(GameResult.game_session_id == game_id)
-            )
-            results_count = len(list(existing_results.scalars().all()))
+        game_closed = False
+        if game["mode"] == GameMode.PVP.value:
+            results_count = (await db.execute(
+                select(func.count()).select_from(GameResult).where(GameResult.game_session_id == game_id)
+            )).scalar()
             
             # Если уже есть результат от другого игрока, закрываем игру
             if results_count > 0:
-                game.status = GameStatus.FINISHED
                 from datetime import datetime, timezone
-                game.finished_at = datetime.now(timezone.utc)
+                await db.execute(
+                    update(GameSession)
+                    .where(GameSession.id == game_id)
+                    .values(status=GameStatus.FINISHED, finished_at=datetime.now(timezone.utc))
+                )
+                game_closed = True
+        
+        await GameService.record_best_result(db, user_id, level_reached)
         
         await db.commit()
         await db.refresh(result)
+        if game_closed:
+            await GameCacheService.invalidate(game_id)
+        
+        await LeaderboardService.record_memory_result(
+            user_id, level_reached, result.created_at
+        )
         return result
     
     @staticmethod
@@ -378,45 +523,226 @@ class GameService:
         db: AsyncSession,
         limit: int = 10
     ) -> List[dict]:
-        """Получить глобальный лидерборд"""
-        # Получаем лучшие результаты (максимальный уровень для каждого пользователя)
-        subquery = (
-            select(
-                GameResult.user_id,
-                func.max(GameResult.level_reached).label('max_level'),
-                func.min(GameResult.created_at).label('first_achieved')
-            )
-            .group_by(GameResult.user_id)
-            .subquery()
-        )
-        
-        result = await db.execute(
-            select(
-                User.id,
-                User.telegram_id,
-                User.first_name,
-                User.username,
-                subquery.c.max_level,
-                subquery.c.first_achieved
+        """
+        Получить глобальный лидерборд.
+        Топ читается из sorted set Redis, данные игроков — одним запросом по ID.
+        """
+        top = await LeaderboardService.get_top("memory", "all", limit)
+        user_ids = [user_id for _, user_id, _ in top]
+        users = {}
+        if user_ids:
+            result = await db.execute(
+                select(User.id, User.telegram_id, User.first_name, User.username)
+                .where(User.id.in_(user_ids))
             )
-            .join(subquery, User.id == subquery.c.user_id)
-            .order_by(desc(subquery.c.max_level), subquery.c.first_achieved)
-            .limit(limit)
-        )
+            users = {row.id: row for row in result.all()}
         
         leaderboard = []
-        for row in result.all():
+        for _, user_id, score in top:
+            row = users.get(user_id)
+            if row is None:
+                continue
+            max_level, first_achieved = LeaderboardService.decode_memory_score(score)
             leaderboard.append({
                 "user_id": row.id,
                 "telegram_id": row.telegram_id,
                 "name": row.first_name or row.username or "Неизвестно",
                 "username": row.username,
-                "max_level": row.max_level,
-                "first_achieved": row.first_achieved
+                "max_level": max_level,
+                "first_achieved": first_achieved
             })
         
         return leaderboard
     
+    @staticmethod
+    async def record_best_result(
+        db: AsyncSession,
+        user_id: int,
+        level_reached: int
+    ):
+        """
+        Обновить лучший результат игрока (в текущей транзакции).
+        Время достижения меняется, только если уровень стал выше.
+        """
+        if level_reached <= 0:
+            return
+        
+        statement = pg_insert(UserBestResult).values(
+            user_id=user_id,
+            max_level=level_reached,
+            first_achieved=datetime.now(timezone.utc)
+        )
+        await db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[UserBestResult.user_id],
+                set_={
+                    "max_level": func.greatest(UserBestResult.max_level, statement.excluded.max_level),
+                    "first_achieved": case(
+                        (statement.excluded.max_level > UserBestResult.max_level, statement.excluded.first_achieved),
+                        else_=UserBestResult.first_achieved
+                    )
+                }
+            )
+        )
+    
+    @staticmethod
+    def encode_leaderboard_cursor(rank: int, max_level: int, first_achieved: datetime, user_id: int) -> str:
+        """Курсор страницы: позиция последней записи страницы"""
+        return f"{rank}_{max_level}_{int(first_achieved.timestamp() * 1_000_000)}_{user_id}"
+    
+    @staticmethod
+    def decode_leaderboard_cursor(cursor: str) -> Tuple[int, int, datetime, int]:
+        """Курсор -> (место, уровень, время достижения, user_id)"""
+        try:
+            rank, max_level, micros, user_id = (int(part) for part in cursor.split("_"))
+        except ValueError:
+            raise ValueError("Некорректный курсор")
+        return rank, max_level, datetime.fromtimestamp(micros / 1_000_000, tz=timezone.utc), user_id
+    
+    @staticmethod
+    def _leaderboard_after(max_level: int, first_achieved: datetime, user_id: int):
+        """
+        Записи лидерборда ниже указанной (порядок индекса ix_user_best_results_rank).
+        Условие на max_level вынесено отдельно: по одной цепочке OR планировщик
+        не строит диапазон индекса и читает его с начала.
+        """
+        return and_(UserBestResult.max_level <= max_level, or_(
+            UserBestResult.max_level < max_level,
+            and_(
+                UserBestResult.max_level == max_level,
+                or_(
+                    UserBestResult.first_achieved > first_achieved,
+                    and_(UserBestResult.first_achieved == first_achieved, UserBestResult.user_id > user_id)
+                )
+            )
+        ))
+    
+    @staticmethod
+    def _leaderboard_before(max_level: int, first_achieved: datetime, user_id: int):
+        """Записи лидерборда выше указанной (с диапазоном индекса, как в _leaderboard_after)"""
+        return and_(UserBestResult.max_level >= max_level, or_(
+            UserBestResult.max_level > max_level,
+            and_(
+                UserBestResult.max_level == max_level,
+                or_(
+                    UserBestResult.first_achieved < first_achieved,
+                    and_(UserBestResult.first_achieved == first_achieved, UserBestResult.user_id < user_id)
+                )
+            )
+        ))
+    
+    @staticmethod
+    def _leaderboard_query():
+        """Записи лидерборда с данными игроков"""
+        return (
+            select(
+                UserBestResult.user_id,
+                UserBestResult.max_level,
+                UserBestResult.first_achieved,
+                User.telegram_id,
+                User.first_name,
+                User.username
+            )
+            .join(User, User.id == UserBestResult.user_id)
+        )
+    
+    @staticmethod
+    def _leaderboard_entry(rank: int, row) -> dict:
+        return {
+            "rank": rank,
+            "user_id": row.user_id,
+            "telegram_id": row.telegram_id,
+            "name": row.first_name or row.username or "Неизвестно",
+            "username": row.username,
+            "max_level": row.max_level,
+            "first_achieved": row.first_achieved
+        }
+    
+    @staticmethod
+    async def get_leaderboard_page(
+        db: AsyncSession,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> dict:
+        """
+        Страница лидерборда с пагинацией по ключу (без OFFSET):
+        следующая страница начинается сразу после записи из курсора.
+        """
+        query = GameService._leaderboard_query()
+        rank = 0
+        if cursor:
+            rank, max_level, first_achieved, user_id = GameService.decode_leaderboard_cursor(cursor)
+            query = query.where(GameService._leaderboard_after(max_level, first_achieved, user_id))
+        
+        result = await db.execute(
+            query
+            .order_by(UserBestResult.max_level.desc(), UserBestResult.first_achieved, UserBestResult.user_id)
+            .limit(limit)
+        )
+        rows = result.all()
+        
+        entries = [GameService._leaderboard_entry(rank + i + 1, row) for i, row in enumerate(rows)]
+        next_cursor = None
+        if len(rows) == limit:
+            last = rows[-1]
+            next_cursor = GameService.encode_leaderboard_cursor(
+                rank + len(rows), last.max_level, last.first_achieved, last.user_id
+            )
+        return {"entries": entries, "next_cursor": next_cursor}
+    
+    @staticmethod
+    async def get_leaderboard_around(
+        db: AsyncSession,
+        user_id: int,
+        radius: int = 5
+    ) -> Optional[dict]:
+        """Место игрока и по radius соседей выше и ниже (None, если игрок ещё не играл)"""
+        result = await db.execute(
+            GameService._leaderboard_query().where(UserBestResult.user_id == user_id)
+        )
+        me = result.one_or_none()
+        if me is None:
+            return None
+        
+        key = (me.max_level, me.first_achieved, me.user_id)
+        # Место — из sorted set лидерборда (ZREVRANK, O(log N)), а не подсчётом всех,
+        # кто выше (O(место)). Игроки с тем же уровнем, достигнутым в ту же секунду,
+        # в Redis упорядочены по ID иначе, чем в БД, — место может сдвинуться на несколько позиций
+        position = await LeaderboardService.get_rank("memory", user_id)
+        if position is not None:
+            rank = position[0]
+        else:
+            # В лидерборде Redis игрока ещё нет (до пересборки) — считаем по БД
+            ahead = await db.execute(
+                select(func.count()).select_from(UserBestResult).where(GameService._leaderboard_before(*key))
+            )
+            rank = ahead.scalar_one() + 1
+        
+        above = await db.execute(
+            GameService._leaderboard_query()
+            .where(GameService._leaderboard_before(*key))
+            .order_by(UserBestResult.max_level, UserBestResult.first_achieved.desc(), UserBestResult.user_id.desc())
+            .limit(radius)
+        )
+        above_rows = list(reversed(above.all()))
+        if len(above_rows) < radius:
+            rank = len(above_rows) + 1  # Выше меньше radius игроков — место известно точно
+        rank = max(rank, len(above_rows) + 1)
+        below = await db.execute(
+            GameService._leaderboard_query()
+            .where(GameService._leaderboard_after(*key))
+            .order_by(UserBestResult.max_level.desc(), UserBestResult.first_achieved, UserBestResult.user_id)
+            .limit(radius)
+        )
+        below_rows = below.all()
+        
+        first_rank = rank - len(above_rows)
+        rows = above_rows + [me] + list(below_rows)
+        return {
+            "rank": rank,
+            "entries": [GameService._leaderboard_entry(first_rank + i, row) for i, row in enumerate(rows)]
+        }
+    
     @staticmethod
     async def place_pvp_pixel(
         db: AsyncSession,
@@ -428,86 +754,39 @@ class GameService:
     ) -> dict:
         """
         Разместить пиксель в PvP игре.
+        Ход применяется к состоянию игры в Redis одним вызовом скрипта;
+        законченная игра записывается в БД.
         Возвращает информацию о состоянии игры.
         """
-        game = await GameService.get_game_by_id(db, game_id)
-        if not game:
-            raise ValueError("Игра не найдена")
-        
-        if game.mode != GameMode.PVP:
-            raise ValueError("Это не PvP игра")
-        
-        if game.status != GameStatus.IN_PROGRESS:
-            raise ValueError("Игра не активна")
-        
-        # Определяем, какой игрок делает ход
-        is_player1 = game.player1_id == user_id
-        is_player2 = game.player2_id == user_id
-        
-        if not (is_player1 or is_player2):
-            raise ValueError("Вы не участвуете в этой игре")
-        
-        # Проверяем границы поля
-        if x < 0 or x >= game.grid_size or y < 0 or y >= game.grid_size:
-            raise ValueError(f"Координаты вне границ поля (0-{game.grid_size-1})")
-        
-        # Получаем список пикселей текущего игрока
-        player_pixels = game.player1_pixels if is_player1 else game.player2_pixels
-        if player_pixels is None:
-            player_pixels = []
+        result = await PvpStateService.place_pixel(game_id, user_id, x, y, color)
         
-        # Проверяем, не превышен ли лимит пикселей
-        if len(player_pixels) >= game.pixels_to_place:
-            raise ValueError("Достигнут лимит пикселей для этого уровня")
-        
-        # Проверяем, не занята ли уже эта клетка
-        for pixel in player_pixels:
-            if pixel.get("x") == x and pixel.get("y") == y:
-                raise ValueError("Эта клетка уже занята")
-        
-        # Добавляем пиксель
-        pixel_data = {
-            "x": x,
-            "y": y,
-            "color": color,
-            "timestamp": time.time()
-        }
-        player_pixels.append(pixel_data)
-        
-        # Обновляем список пикселей в игре
-        if is_player1:
-            game.player1_pixels = player_pixels
-        else:
-            game.player2_pixels = player_pixels
-        
-        # Проверяем, завершена ли игра (оба игрока поставили все пиксели)
-        player1_done = len(game.player1_pixels or []) >= game.pixels_to_place
-        player2_done = len(game.player2_pixels or []) >= game.pixels_to_place
-        
-        if player1_done and player2_done:
-            # Оба игрока завершили - определяем победителя (кто быстрее)
-            player1_time = game.player1_pixels[-1]["timestamp"] if game.player1_pixels else float('inf')
-            player2_time = game.player2_pixels[-1]["timestamp"] if game.player2_pixels else float('inf')
+        if result is None:
+            # Состояния в Redis нет (игра началась до перезапуска или вытеснена) — загружаем из БД
+            game = await GameService.get_game_by_id(db, game_id)
+            if not game:
+                raise ValueError("Игра не найдена")
+            
+            if game.mode != GameMode.PVP:
+                raise ValueError("Это не PvP игра")
             
-            if player1_time < player2_time:
-                game.winner_id = game.player1_id
-            elif player2_time < player1_time:
-                game.winner_id = game.player2_id
-            # Если равны - ничья, winner_id остаётся None
+            if game.status != GameStatus.IN_PROGRESS:
+                raise ValueError("Игра не активна")
             
-            game.status = GameStatus.FINISHED
-            from datetime import datetime, timezone
-            game.finished_at = datetime.now(timezone.utc)
+            await PvpStateService.load(game)
+            result = await PvpStateService.place_pixel(game_id, user_id, x, y, color)
+            if result is None:
+                raise ValueError("Игра не найдена")
         
-        await db.commit()
-        await db.refresh(game)
+        if result["game_finished"]:
+            await PvpStateService.persist(db, game_id)
         
         return {
-            "game_id": game.id,
-            "pixels_placed": len(player_pixels),
-            "pixels_remaining": game.pixels_to_place - len(player_pixels),
-            "game_finished": game.status == GameStatus.FINISHED,
-            "winner_id": game.winner_id,
-            "player1_pixels_count": len(game.player1_pixels or []),
-            "player2_pixels_count": len(game.player2_pixels or [])
-        }
\ No newline at end of file
+            "game_id": game_id,
+            "pixels_placed": result["pixels_placed"],
+            "pixels_remaining": result["pixels_remaining"],
+            "game_finished": result["game_finished"],
+            "winner_id": result["winner_id"],
+            "player1_pixels_count": result["player1_pixels_count"],
+            "player2_pixels_count": result["player2_pixels_count"],
+            "timestamp": result["timestamp"]  # Серверное время хода
+        }
@@ -0,0 +1,177 @@
+"""
+Сервис лидербордов на sorted set Redis
+Лидерборды обновляются при записи, чтение топа и места игрока — O(log N)
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from datetime import datetime, timezone
+from typing import Optional, List, Tuple
+
+from app.models.game import UserBestResult
+from app.core.redis import get_redis
+from app.core import queries
+
+
+class LeaderboardService:
+    """Сервис для работы с лидербордами"""
+
+    # Пиксели по игрокам и по командам (основная команда игрока)
+    PIXELS_KEY = "lb:pixels"
+    TEAMS_KEY = "lb:teams"
+    # Игра "Повтори пиксели": максимальный уровень с приоритетом раннего достижения
+    MEMORY_KEY = "lb:memory"
+
+    BOARDS = ("pixels", "teams", "memory")
+    PERIODS = ("all", "day", "week")
+
+    DAY_KEY_TTL = 2 * 24 * 60 * 60  # 2 дня
+    WEEK_KEY_TTL = 15 * 24 * 60 * 60  # 15 дней
+
+    # Счёт памяти: level * MEMORY_LEVEL_FACTOR + (MEMORY_TIME_MAX - unix time).
+    # При равном уровне выше тот, кто достиг его раньше; укладывается в 53 бита double
+    MEMORY_LEVEL_FACTOR = 10 ** 10
+    MEMORY_TIME_MAX = 10 ** 10 - 1
+
+    @staticmethod
+    def board_key(board: str, period: str = "all", moment: Optional[datetime] = None) -> str:
+        """Ключ лидерборда за период (all — за всё время, day/week — календарные UTC)"""
+        base = {
+            "pixels": LeaderboardService.PIXELS_KEY,
+            "teams": LeaderboardService.TEAMS_KEY,
+            "memory": LeaderboardService.MEMORY_KEY,
+        }[board]
+        if period == "all":
+            return base
+        moment = moment or datetime.now(timezone.utc)
+        if period == "day":
+            return f"{base}:day:{moment.strftime('%Y%m%d')}"
+        if period == "week":
+            year, week, _ = moment.isocalendar()
+            return f"{base}:week:{year}W{week:02d}"
+        raise ValueError(f"Неизвестный период: {period}")
+
+    @staticmethod
+    def encode_memory_score(level: int, achieved_at: datetime) -> float:
+        """Закодировать уровень и время достижения в счёт sorted set"""
+        return float(
+            level * LeaderboardService.MEMORY_LEVEL_FACTOR
+            + (LeaderboardService.MEMORY_TIME_MAX - int(achieved_at.timestamp()))
+        )
+
+    @staticmethod
+    def decode_memory_score(score: float) -> Tuple[int, datetime]:
+        """Счёт sorted set -> (уровень, время первого достижения)"""
+        score = int(score)
+        level = score // LeaderboardService.MEMORY_LEVEL_FACTOR
+        timestamp = LeaderboardService.MEMORY_TIME_MAX - score % LeaderboardService.MEMORY_LEVEL_FACTOR
+        return level, datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+    @staticmethod
+    async def record_memory_result(
+        user_id: int,
+        level_reached: int,
+        achieved_at: Optional[datetime] = None
+    ):
+        """Учесть результат игры: счёт обновляется, только если он лучше текущего"""
+        if level_reached <= 0:
+            return
+        achieved_at = achieved_at or datetime.now(timezone.utc)
+        score = LeaderboardService.encode_memory_score(level_reached, achieved_at)
+
+        redis = await get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(LeaderboardService.MEMORY_KEY, {str(user_id): score}, gt=True)
+            for period, ttl in (
+                ("day", LeaderboardService.DAY_KEY_TTL),
+                ("week", LeaderboardService.WEEK_KEY_TTL),
+            ):
+                key = LeaderboardService.board_key("memory", period, achieved_at)
+                pipe.zadd(key, {str(user_id): score}, gt=True)
+                pipe.expire(key, ttl)
+            await pipe.execute()
+
+    @staticmethod
+    async def get_top(
+        board: str,
+        period: str = "all",
+        limit: int = 10,
+        offset: int = 0
+    ) -> List[Tuple[int, int, float]]:
+        """Топ лидерборда: [(место, id, счёт), ...]"""
+        redis = await get_redis()
+        entries = await redis.zrevrange(
+            LeaderboardService.board_key(board, period),
+            offset,
+            offset + limit - 1,
+            withscores=True
+        )
+        return [
+            (offset + position + 1, int(member), score)
+            for position, (member, score) in enumerate(entries)
+        ]
+
+    @staticmethod
+    async def get_rank(
+        board: str,
+        member_id: int,
+        period: str = "all"
+    ) -> Optional[Tuple[int, float]]:
+        """Место и счёт участника (None, если его нет в лидерборде)"""
+        key = LeaderboardService.board_key(board, period)
+        redis = await get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.zrevrank(key, str(member_id))
+            pipe.zscore(key, str(member_id))
+            rank, score = await pipe.execute()
+        if rank is None:
+            return None
+        return rank + 1, score
+
+    @staticmethod
+    async def get_size(board: str, period: str = "all") -> int:
+        """Количество участников лидерборда"""
+        redis = await get_redis()
+        return await redis.zcard(LeaderboardService.board_key(board, period))
+
+    @staticmethod
+    async def get_names(
+        db: AsyncSession,
+        board: str,
+        ids: List[int]
+    ) -> dict:
+        """Имена участников по ID одним запросом по первичному ключу"""
+        if not ids:
+            return {}
+        if board == "teams":
+            rows = await queries.fetch_all(db, queries.TEAM_NAMES, team_ids=ids)
+            return {row.id: row.name for row in rows}
+        rows = await queries.fetch_all(db, queries.USER_NAMES, user_ids=ids)
+        return {
+            row.id: row.first_name or row.username or "Неизвестно"
+            for row in rows
+        }
+
+    @staticmethod
+    async def rebuild_memory(db: AsyncSession):
+        """Пересобрать лидерборд игры за всё время из user_best_results"""
+        result = await db.execute(
+            select(
+                UserBestResult.user_id,
+                UserBestResult.max_level,
+                UserBestResult.first_achieved
+            )
+        )
+        scores = {
+            str(row.user_id): LeaderboardService.encode_memory_score(
+                row.max_level, row.first_achieved or datetime.now(timezone.utc)
+            )
+            for row in result.all()
+            if row.max_level and row.max_level > 0
+        }
+
+        redis = await get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(LeaderboardService.MEMORY_KEY)
+            if scores:
+                pipe.zadd(LeaderboardService.MEMORY_KEY, scores)
+            await pipe.execute()
@@ -0,0 +1,157 @@
+"""
+Сервис модерации: откат областей холста по журналу изменений
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text
+from datetime import datetime
+from typing import Optional, List, Tuple
+import base64
+
+from app.core.config import settings
+from app.services.pixel_service import PixelService
+from app.services.partition_service import PartitionService
+
+
+# Состояние клеток до "плохих" изменений одним запросом.
+# Затронуты клетки области, чьё текущее состояние — плохое изменение;
+# для каждой берётся последняя запись журнала, которая плохой не является
+# (индекс idx_pixel_history_cell_time). NULL — клетку нужно очистить.
+ROLLBACK_SQL = """
+    SELECT p.x, p.y, prior.color, prior.user_id
+    FROM pixels p
+    LEFT JOIN LATERAL (
+        SELECT h.color, h.user_id
+        FROM pixel_history h
+        WHERE h.x = p.x AND h.y = p.y AND NOT ({bad_history})
+        ORDER BY h.created_at DESC, h.id DESC
+        LIMIT 1
+    ) prior ON true
+    WHERE p.x >= :x_min AND p.x < :x_max
+      AND p.y >= :y_min AND p.y < :y_max
+      AND {bad_current}
+"""
+
+
+class ModerationService:
+    """Сервис для модерации холста"""
+
+    @staticmethod
+    def decode_mask(mask: str, width: int, height: int) -> bytes:
+        """
+        Маска области: base64 битовой карты width x height,
+        строки сверху вниз, старший бит байта — левая клетка.
+        """
+        try:
+            data = base64.b64decode(mask, validate=True)
+        except ValueError:
+            raise ValueError("Маска должна быть в base64")
+        if len(data) * 8 < width * height:
+            raise ValueError(f"Маска слишком короткая: нужно {width * height} бит")
+        return data
+
+    @staticmethod
+    def in_mask(mask: bytes, index: int) -> bool:
+        """Входит ли клетка с индексом в маску"""
+        return bool(mask[index >> 3] & (0x80 >> (index & 7)))
+
+    @staticmethod
+    async def compute_rollback(
+        db: AsyncSession,
+        x_min: int,
+        y_min: int,
+        x_max: int,
+        y_max: int,
+        since: Optional[datetime] = None,
+        user_id: Optional[int] = None,
+        mask: Optional[str] = None
+    ) -> List[Tuple[int, int, Optional[str], Optional[int]]]:
+        """
+        Рассчитать прежнее состояние клеток области: [(x, y, color, user_id), ...].
+        since — откатить изменения, сделанные начиная с этого момента;
+        user_id — откатить изменения пользователя; оба условия — изменения пользователя с момента.
+        color=None — клетку нужно очистить.
+        """
+        if since is None and user_id is None:
+            raise ValueError("Укажите время (since) и/или пользователя (user_id)")
+        if since is not None:
+            # Журнал старше срока хранения отсоединён (PartitionService)
+            oldest = PartitionService.add_months(
+                PartitionService.current_month(), -settings.PIXEL_HISTORY_RETENTION_MONTHS
+            )
+            if since.date() < oldest:
+                raise ValueError(f"Журнал изменений хранится только с {oldest.isoformat()}")
+
+        x_min = max(x_min, 0)
+        y_min = max(y_min, 0)
+        x_max = min(x_max, settings.CANVAS_WIDTH)
+        y_max = min(y_max, settings.CANVAS_HEIGHT)
+        if x_min >= x_max or y_min >= y_max:
+            raise ValueError("Пустая область")
+
+        conditions = []
+        params = {"x_min": x_min, "y_min": y_min, "x_max": x_max, "y_max": y_max}
+        if since is not None:
+            conditions.append("{t}.created_at >= :since")
+            params["since"] = since
+        if user_id is not None:
+            conditions.append("{t}.user_id = :user_id")
+            params["user_id"] = user_id
+        bad = " AND ".join(conditions)
+
+        result = await db.execute(
+            text(ROLLBACK_SQL.format(
+                bad_history=bad.format(t="h"),
+                bad_current=bad.format(t="p")
+            )),
+            params
+        )
+        cells = [tuple(row) for row in result.all()]
+
+        if mask is not None:
+            width = x_max - x_min
+            bits = ModerationService.decode_mask(mask, width, y_max - y_min)
+            cells = [
+                cell for cell in cells
+                if ModerationService.in_mask(bits, (cell[1] - y_min) * width + (cell[0] - x_min))
+            ]
+
+        return cells
+
+    @staticmethod
+    async def rollback(
+        db: AsyncSession,
+        admin_user_id: int,
+        x_min: int,
+        y_min: int,
+        x_max: int,
+        y_max: int,
+        since: Optional[datetime] = None,
+        user_id: Optional[int] = None,
+        mask: Optional[str] = None,
+        dry_run: bool = False
+    ) -> dict:
+        """Откатить область через пакетную запись пикселей"""
+        cells = await ModerationService.compute_rollback(
+            db, x_min, y_min, x_max, y_max, since, user_id, mask
+        )
+        restored = sum(1 for _, _, color, _ in cells if color is not None)
+
+        if not dry_run and cells:
+            await PixelService.apply_batch(
+                db,
+                [
+                    (x, y, color, prior_user_id if color is not None else admin_user_id)
+                    for x, y, color, prior_user_id in cells
+                ],
+                admin_user_id,
+                assign_teams=True
+            )
+
+        print(f"[MODERATION] Откат области ({x_min},{y_min})-({x_max},{y_max}): "
+              f"восстановлено {restored}, очищено {len(cells) - restored}, dry_run={dry_run}")
+        return {
+            "affected": len(cells),
+            "restored": restored,
+            "cleared": len(cells) - restored,
+            "dry_run": dry_run
+        }
@@ -0,0 +1,155 @@
+"""
+Секционирование журналов по месяцам
+game_results и pixel_history секционированы по created_at (миграция 012): запросы
+с условием по времени читают только нужные секции, а старые данные уходят целыми
+секциями без DELETE и VACUUM. Периодическая задача заранее создаёт секции на ближайшие
+месяцы и отсоединяет секции старше срока хранения — они переносятся в схему archive,
+откуда их можно выгрузить (pg_dump -t 'archive.*') и удалить.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text
+from datetime import date, datetime, timezone
+from typing import List
+import re
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+
+# Схема для отсоединённых секций (создаётся миграцией 012)
+ARCHIVE_SCHEMA = "archive"
+
+# Секции таблицы в основной схеме
+LIST_PARTITIONS_SQL = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = :table
+      AND parent.relnamespace = to_regnamespace(current_schema())
+"""
+
+# Последнее состояние каждой клетки в секции переносится на её верхнюю границу:
+# после отсоединения секции откат областей по-прежнему находит прежний цвет клетки
+CARRY_FORWARD_HISTORY_SQL = """
+    INSERT INTO pixel_history (x, y, color, user_id, created_at)
+    SELECT DISTINCT ON (x, y) x, y, color, user_id, CAST(:boundary AS timestamptz)
+    FROM {partition}
+    ORDER BY x, y, created_at DESC, id DESC
+"""
+
+
+class PartitionService:
+    """Сервис для обслуживания месячных секций"""
+
+    @staticmethod
+    def retention_months(table: str) -> int:
+        """Сколько месяцев данных таблицы хранится (текущий месяц не считается)"""
+        return {
+            "game_results": settings.GAME_RESULTS_RETENTION_MONTHS,
+            "pixel_history": settings.PIXEL_HISTORY_RETENTION_MONTHS,
+        }[table]
+
+    @staticmethod
+    def add_months(month: date, months: int) -> date:
+        """Первое число месяца через months месяцев"""
+        index = month.year * 12 + month.month - 1 + months
+        return date(index // 12, index % 12 + 1, 1)
+
+    @staticmethod
+    def current_month() -> date:
+        """Первое число текущего месяца (UTC)"""
+        return datetime.now(timezone.utc).date().replace(day=1)
+
+    @staticmethod
+    def partition_name(table: str, month: date) -> str:
+        """Имя секции месяца: game_results_p2024_01"""
+        return f"{table}_p{month:%Y_%m}"
+
+    @staticmethod
+    def bound(month: date) -> str:
+        """Граница секции — полночь UTC первого числа месяца"""
+        return f"{month.isoformat()} 00:00:00+00"
+
+    @staticmethod
+    async def list_partitions(db: AsyncSession, table: str) -> List[date]:
+        """Месяцы подключённых секций таблицы (по возрастанию)"""
+        result = await db.execute(text(LIST_PARTITIONS_SQL), {"table": table})
+        pattern = re.compile(rf"^{table}_p(\d{{4}})_(\d{{2}})$")
+        months = []
+        for (name,) in result.all():
+            match = pattern.match(name)
+            if match:
+                months.append(date(int(match.group(1)), int(match.group(2)), 1))
+        return sorted(months)
+
+    @staticmethod
+    async def create_partition(db: AsyncSession, table: str, month: date):
+        """Создать секцию месяца (если её ещё нет)"""
+        # DDL не принимает параметры; имена и границы формируются из дат, а не из ввода
+        await db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {PartitionService.partition_name(table, month)} "
+            f"PARTITION OF {table} FOR VALUES "
+            f"FROM ('{PartitionService.bound(month)}') "
+            f"TO ('{PartitionService.bound(PartitionService.add_months(month, 1))}')"
+        ))
+
+    @staticmethod
+    async def detach_partition(db: AsyncSession, table: str, month: date):
+        """Отсоединить секцию месяца и перенести её в схему archive"""
+        name = PartitionService.partition_name(table, month)
+        if table == "pixel_history":
+            await db.execute(
+                text(CARRY_FORWARD_HISTORY_SQL.format(partition=name)),
+                {"boundary": PartitionService.bound(PartitionService.add_months(month, 1))}
+            )
+        # Обычный DETACH берёт короткую эксклюзивную блокировку родительской таблицы;
+        # DETACH ... CONCURRENTLY нельзя выполнить внутри транзакции
+        await db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        await db.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+
+    @staticmethod
+    async def maintain(db: AsyncSession, table: str) -> dict:
+        """
+        Создать секции до PARTITION_PREMAKE_MONTHS месяцев вперёд
+        и отсоединить секции старше срока хранения.
+        Каждая секция — отдельная транзакция.
+        """
+        current = PartitionService.current_month()
+        existing = set(await PartitionService.list_partitions(db, table))
+
+        created = []
+        for offset in range(settings.PARTITION_PREMAKE_MONTHS + 1):
+            month = PartitionService.add_months(current, offset)
+            if month not in existing:
+                await PartitionService.create_partition(db, table, month)
+                await db.commit()
+                created.append(month)
+
+        # Старые секции — по порядку: перенесённые состояния клеток попадают в следующую
+        oldest_kept = PartitionService.add_months(current, -PartitionService.retention_months(table))
+        detached = []
+        for month in sorted(existing):
+            if month >= oldest_kept:
+                break
+            await PartitionService.detach_partition(db, table, month)
+            await db.commit()
+            detached.append(month)
+
+        return {"created": created, "detached": detached}
+
+    @staticmethod
+    async def run_maintenance():
+        """Периодическое обслуживание секций (для планировщика)"""
+        async with AsyncSessionLocal() as db:
+            for table in ("game_results", "pixel_history"):
+                try:
+                    changes = await PartitionService.maintain(db, table)
+                except Exception as e:
+                    await db.rollback()
+                    print(f"[PARTITIONS] Ошибка обслуживания {table}: {e}")
+                    continue
+                if changes["created"] or changes["detached"]:
+                    print(
+                        f"[PARTITIONS] {table}: создано {len(changes['created'])}, "
+                        f"отсоединено {len(changes['detached'])}"
+                    )
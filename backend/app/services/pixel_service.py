@@ -2,15 +2,75 @@
 Сервис для работы с пикселями
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, text
+from sqlalchemy.engine import Row
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Tuple
+import re
 
 from app.models.pixel import Pixel
 from app.models.user import User
 from app.schemas.pixel import PixelCreate
 from app.core.config import settings
-from app.core.redis import get_redis
+from app.core.redis import get_redis, publish_pixel_batch
+from app.core.database import mark_user_write
+from app.core import queries
+
+
+# Пакетный upsert: массивы разворачиваются через unnest, запрос один при любом размере пакета
+BATCH_UPSERT_SQL = text("""
+    INSERT INTO pixels (x, y, color, user_id, created_at)
+    SELECT x, y, color, user_id, now()
+    FROM unnest(
+        CAST(:xs AS integer[]),
+        CAST(:ys AS integer[]),
+        CAST(:colors AS varchar[]),
+        CAST(:user_ids AS integer[])
+    ) AS batch(x, y, color, user_id)
+    ON CONFLICT (x, y) DO UPDATE
+    SET color = EXCLUDED.color,
+        user_id = EXCLUDED.user_id,
+        created_at = EXCLUDED.created_at
+""")
+
+# Размещение одного пикселя: upsert и запись в журнал одним запросом.
+# Одновременные размещения в пустую клетку не конфликтуют по первичному ключу (x, y)
+PIXEL_UPSERT_SQL = text("""
+    WITH placed AS (
+        INSERT INTO pixels (x, y, color, user_id, created_at)
+        VALUES (:x, :y, :color, :user_id, now())
+        ON CONFLICT (x, y) DO UPDATE
+        SET color = EXCLUDED.color,
+            user_id = EXCLUDED.user_id,
+            created_at = EXCLUDED.created_at
+        RETURNING x, y, color, user_id, created_at
+    ), logged AS (
+        INSERT INTO pixel_history (x, y, color, user_id, created_at)
+        SELECT x, y, color, user_id, created_at FROM placed
+    )
+    SELECT x, y, color, user_id, created_at FROM placed
+""")
+
+# Очистка клеток пакетом
+BATCH_CLEAR_SQL = text("""
+    DELETE FROM pixels p
+    USING unnest(CAST(:xs AS integer[]), CAST(:ys AS integer[])) AS batch(x, y)
+    WHERE p.x = batch.x AND p.y = batch.y
+""")
+
+# Журнал изменений пакетом (NULL в color — клетка очищена)
+BATCH_HISTORY_SQL = text("""
+    INSERT INTO pixel_history (x, y, color, user_id, created_at)
+    SELECT x, y, color, user_id, now()
+    FROM unnest(
+        CAST(:xs AS integer[]),
+        CAST(:ys AS integer[]),
+        CAST(:colors AS varchar[]),
+        CAST(:user_ids AS integer[])
+    ) AS batch(x, y, color, user_id)
+""")
+
+HEX_COLOR_RE = re.compile(r"#[0-9A-Fa-f]{6}")
 
 
 class PixelService:
@@ -21,41 +81,27 @@ class PixelService:
         db: AsyncSession,
         x: int,
         y: int
-    ) -> Optional[Pixel]:
-        """Получить пиксель по координатам"""
-        result = await db.execute(
-            select(Pixel).where(and_(Pixel.x == x, Pixel.y == y))
-        )
-        return result.scalar_one_or_none()
+    ) -> Optional[Row]:
+        """Получить пиксель по координатам (строка с полями Pixel, только для чтения)"""
+        return await queries.fetch_one(db, queries.PIXEL_AT, x=x, y=y)
     
     @staticmethod
     async def create_or_update_pixel(
         db: AsyncSession,
         pixel_data: PixelCreate,
         user_id: int
-    ) -> Pixel:
-        """Создать или обновить пиксель"""
+    ) -> Row:
+        """Создать или обновить пиксель (строка с полями Pixel)"""
         try:
-            # Проверяем существующий пиксель
-            existing = await PixelService.get_pixel(db, pixel_data.x, pixel_data.y)
-            
-            if existing:
-                existing.color = pixel_data.color
-                existing.user_id = user_id
-                existing.created_at = datetime.now(timezone.utc)
-                pixel = existing
-            else:
-                pixel = Pixel(
-                    x=pixel_data.x,
-                    y=pixel_data.y,
-                    color=pixel_data.color,
-                    user_id=user_id
-                )
-                db.add(pixel)
-            
+            result = await db.execute(PIXEL_UPSERT_SQL, {
+                "x": pixel_data.x,
+                "y": pixel_data.y,
+                "color": pixel_data.color,
+                "user_id": user_id
+            })
+            pixel = result.one()
             await db.commit()
-            await db.refresh(pixel)
-            print(f"Пиксель успешно создан/обновлен: id={pixel.id}, x={pixel.x}, y={pixel.y}, color={pixel.color}")
+            print(f"Пиксель успешно создан/обновлен: x={pixel.x}, y={pixel.y}, color={pixel.color}")
             return pixel
         except Exception as e:
             await db.rollback()
@@ -105,14 +151,23 @@ class PixelService:
             user.pixels_placed += 1
             user.last_pixel_at = datetime.now(timezone.utc)
             await db.commit()
+            await mark_user_write(user_id)
     
     @staticmethod
     async def get_pixels_count(
         db: AsyncSession
     ) -> int:
-        """Получить общее количество пикселей на холсте"""
+        """
+        Получить общее количество пикселей на холсте.
+        Читается из счётчика Redis; к БД обращаемся, только пока счётчик не заполнен сверкой.
+        """
+        from app.services.stats_service import StatsService
+        filled = await StatsService.get_filled_count()
+        if filled is not None:
+            return filled
+        
         from sqlalchemy import func
-        result = await db.execute(select(func.count(Pixel.id)))
+        result = await db.execute(select(func.count()).select_from(Pixel))
         return result.scalar() or 0
     
     @staticmethod
@@ -151,3 +206,96 @@ class PixelService:
             )
         )
         return list(result.scalars().all())
+    
+    @staticmethod
+    def validate_batch(
+        pixels: List[Tuple[int, int, str]]
+    ) -> List[Tuple[int, int, str]]:
+        """
+        Проверить пакет пикселей целиком: границы по min/max колонок,
+        цвета — одним проходом регулярного выражения.
+        Возвращает пакет без повторов клеток (побеждает последняя запись), цвета в верхнем регистре.
+        """
+        if len(pixels) > settings.MAX_BATCH_PIXELS:
+            raise ValueError(f"Слишком много пикселей в пакете (максимум {settings.MAX_BATCH_PIXELS})")
+        
+        xs, ys, colors = zip(*pixels)
+        if min(xs) < 0 or max(xs) >= settings.CANVAS_WIDTH:
+            raise ValueError(f"Координата X вне холста (0-{settings.CANVAS_WIDTH - 1})")
+        if min(ys) < 0 or max(ys) >= settings.CANVAS_HEIGHT:
+            raise ValueError(f"Координата Y вне холста (0-{settings.CANVAS_HEIGHT - 1})")
+        invalid = next((c for c in colors if not HEX_COLOR_RE.fullmatch(c)), None)
+        if invalid is not None:
+            raise ValueError(f"Неверный HEX цвет: {invalid}")
+        
+        cells = {(x, y): color.upper() for x, y, color in pixels}
+        return [(x, y, color) for (x, y), color in cells.items()]
+    
+    @staticmethod
+    async def apply_batch(
+        db: AsyncSession,
+        pixels: List[Tuple[int, int, Optional[str], int]],
+        author_id: int,
+        assign_teams: bool = False
+    ) -> int:
+        """
+        Записать пакет пикселей [(x, y, color, user_id), ...], color=None очищает клетку:
+        один upsert и одна очистка в БД, одно обновление массивов холста, одно сообщение клиентам.
+        Пакет должен быть уже проверен и без повторов клеток.
+        assign_teams=False — клетки пакета не принадлежат ни одной команде (трафареты администратора
+        не меняют счёт команд); True — клетки переходят к основным командам авторов (откат модерации).
+        """
+        if not pixels:
+            return 0
+        
+        painted = [pixel for pixel in pixels if pixel[2] is not None]
+        cleared = [pixel for pixel in pixels if pixel[2] is None]
+        
+        try:
+            if painted:
+                xs, ys, colors, user_ids = (list(column) for column in zip(*painted))
+                await db.execute(BATCH_UPSERT_SQL, {
+                    "xs": xs,
+                    "ys": ys,
+                    "colors": colors,
+                    "user_ids": user_ids
+                })
+            if cleared:
+                await db.execute(BATCH_CLEAR_SQL, {
+                    "xs": [x for x, _, _, _ in cleared],
+                    "ys": [y for _, y, _, _ in cleared]
+                })
+            await db.execute(BATCH_HISTORY_SQL, {
+                "xs": [x for x, _, _, _ in pixels],
+                "ys": [y for _, y, _, _ in pixels],
+                "colors": [color for _, _, color, _ in pixels],
+                "user_ids": [user_id if color is not None else author_id for _, _, color, user_id in pixels]
+            })
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            print(f"Ошибка пакетной записи пикселей: {e}")
+            raise
+        
+        await PixelService.invalidate_canvas_cache()
+        
+        # Массивы холста: при assign_teams клетки переходят к командам авторов пикселей
+        from app.services.team_service import TeamService
+        from app.services.canvas_store import CanvasStore
+        primary_teams = {}
+        if assign_teams and painted:
+            primary_teams = await TeamService.get_primary_team_ids(
+                db, list({user_id for _, _, _, user_id in painted})
+            )
+        await CanvasStore.apply_placements(
+            [
+                (x, y, color, user_id if color is not None else 0, primary_teams.get(user_id, 0) if color is not None else 0)
+                for x, y, color, user_id in pixels
+            ],
+            track_players=False
+        )
+        
+        await publish_pixel_batch([[x, y, color] for x, y, color, _ in pixels], author_id)
+        
+        print(f"Пакет пикселей записан: {len(painted)} шт., очищено: {len(cleared)}, автор user_id={author_id}")
+        return len(pixels)
@@ -0,0 +1,309 @@
+"""
+Состояние идущих PvP игр в Redis
+Ход — один вызов Lua-скрипта (проверка, занятость клетки по битовой карте, журнал ходов);
+в Postgres игра записывается периодически и один раз по завершении
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update
+from datetime import datetime, timezone
+from typing import Optional, List
+import json
+import time
+
+from app.models.game import GameSession, GameStatus
+from app.core.database import AsyncSessionLocal
+from app.core.redis import get_redis, get_script
+from app.services.game_cache_service import GameCacheService
+
+
+# Ход в PvP игре.
+# KEYS: 1 hash состояния, 2-3 битовые карты занятых клеток игроков 1 и 2,
+#       4-5 журналы ходов игроков 1 и 2, 6 sorted set идущих игр
+# ARGV: 1 user_id, 2 x, 3 y, 4 запись хода (JSON), 5 время хода (мс), 6 TTL состояния, 7 game_id
+# Возвращает {номер игрока, поставлено им, поставлено игроком 1, игроком 2, завершена, победитель, лимит}
+# или {код ошибки}: -1 нет состояния, -2 игра не активна, -3 не участник,
+# -4 вне поля, -5 лимит пикселей, -6 клетка занята
+PVP_MOVE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {-1}
+end
+local state = redis.call('HMGET', KEYS[1],
+    'status', 'player1', 'player2', 'grid_size', 'pixels_to_place', 'count1', 'count2')
+if state[1] ~= 'in_progress' then
+    return {-2}
+end
+
+local player
+if state[2] == ARGV[1] then
+    player = 1
+elseif state[3] == ARGV[1] then
+    player = 2
+else
+    return {-3}
+end
+
+local grid = tonumber(state[4])
+local x = tonumber(ARGV[2])
+local y = tonumber(ARGV[3])
+if x < 0 or x >= grid or y < 0 or y >= grid then
+    return {-4}
+end
+
+local limit = tonumber(state[5])
+local counts = {tonumber(state[6]), tonumber(state[7])}
+if counts[player] >= limit then
+    return {-5}
+end
+if redis.call('SETBIT', KEYS[1 + player], y * grid + x, 1) == 1 then
+    return {-6}
+end
+
+counts[player] = counts[player] + 1
+redis.call('RPUSH', KEYS[3 + player], ARGV[4])
+redis.call('HSET', KEYS[1], 'count' .. player, counts[player], 'last' .. player, ARGV[5])
+redis.call('HINCRBY', KEYS[1], 'version', 1)
+
+-- Оба игрока поставили все пиксели: побеждает тот, кто закончил раньше
+local finished = 0
+local winner = 0
+if counts[1] >= limit and counts[2] >= limit then
+    finished = 1
+    local last = redis.call('HMGET', KEYS[1], 'last1', 'last2')
+    local last1 = tonumber(last[1])
+    local last2 = tonumber(last[2])
+    if last1 < last2 then
+        winner = tonumber(state[2])
+    elseif last2 < last1 then
+        winner = tonumber(state[3])
+    end
+    redis.call('HSET', KEYS[1], 'status', 'finished', 'winner', winner)
+end
+
+for k = 1, 5 do
+    redis.call('EXPIRE', KEYS[k], ARGV[6])
+end
+redis.call('ZADD', KEYS[6], math.floor(tonumber(ARGV[5]) / 1000), ARGV[7])
+return {player, counts[player], counts[1], counts[2], finished, winner, limit}
+"""
+
+# Загрузка состояния игры (если его ещё нет).
+# KEYS как у PVP_MOVE_LUA
+# ARGV: 1 status, 2 player1, 3 player2, 4 grid_size, 5 pixels_to_place, 6 TTL,
+#       7 count1, 8 count2, 9 last1, 10 last2, 11 время (с), 12 game_id,
+#       далее тройки (номер игрока, индекс клетки, запись хода)
+PVP_INIT_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('DEL', KEYS[2], KEYS[3], KEYS[4], KEYS[5])
+redis.call('HSET', KEYS[1],
+    'status', ARGV[1], 'player1', ARGV[2], 'player2', ARGV[3],
+    'grid_size', ARGV[4], 'pixels_to_place', ARGV[5],
+    'count1', ARGV[7], 'count2', ARGV[8], 'last1', ARGV[9], 'last2', ARGV[10],
+    'version', 0, 'flushed', 0)
+for i = 13, #ARGV, 3 do
+    local player = tonumber(ARGV[i])
+    redis.call('SETBIT', KEYS[1 + player], tonumber(ARGV[i + 1]), 1)
+    redis.call('RPUSH', KEYS[3 + player], ARGV[i + 2])
+end
+for k = 1, 5 do
+    redis.call('EXPIRE', KEYS[k], ARGV[6])
+end
+redis.call('ZADD', KEYS[6], ARGV[11], ARGV[12])
+return 1
+"""
+
+
+class PvpStateService:
+    """Сервис для состояния идущих PvP игр"""
+
+    KEY_PREFIX = "pvp:game:"
+    LIVE_KEY = "pvp:live"  # Идущие игры: game_id -> время последнего хода
+    STATE_TTL = 60 * 60  # 1 час без ходов
+
+    MOVE_ERRORS = {
+        -1: "Игра не найдена",
+        -2: "Игра не активна",
+        -3: "Вы не участвуете в этой игре",
+        -5: "Достигнут лимит пикселей для этого уровня",
+        -6: "Эта клетка уже занята",
+    }
+
+    @staticmethod
+    def keys(game_id: int) -> List[str]:
+        """Ключи состояния игры в порядке KEYS скриптов"""
+        base = f"{PvpStateService.KEY_PREFIX}{game_id}"
+        return [
+            base,
+            f"{base}:occupied:1",
+            f"{base}:occupied:2",
+            f"{base}:moves:1",
+            f"{base}:moves:2",
+            PvpStateService.LIVE_KEY,
+        ]
+
+    @staticmethod
+    async def load(game: GameSession) -> bool:
+        """Загрузить состояние игры из БД в Redis (если его там нет)"""
+        args = [
+            game.status.value,
+            game.player1_id,
+            game.player2_id or 0,
+            game.grid_size,
+            game.pixels_to_place,
+            PvpStateService.STATE_TTL,
+        ]
+        moves = []
+        last = []
+        for player, pixels in ((1, game.player1_pixels or []), (2, game.player2_pixels or [])):
+            for pixel in pixels:
+                moves.extend([player, pixel["y"] * game.grid_size + pixel["x"], json.dumps(pixel)])
+            last.append(int(pixels[-1]["timestamp"] * 1000) if pixels else 0)
+        args += [
+            len(game.player1_pixels or []),
+            len(game.player2_pixels or []),
+            last[0],
+            last[1],
+            int(time.time()),
+            game.id,
+        ] + moves
+
+        script = await get_script(PVP_INIT_LUA)
+        return bool(await script(keys=PvpStateService.keys(game.id), args=args))
+
+    @staticmethod
+    async def place_pixel(
+        game_id: int,
+        user_id: int,
+        x: int,
+        y: int,
+        color: str
+    ) -> Optional[dict]:
+        """
+        Применить ход атомарно.
+        Возвращает None, если состояния игры нет в Redis.
+        """
+        now = time.time()
+        move = json.dumps({"x": x, "y": y, "color": color, "timestamp": now})
+        script = await get_script(PVP_MOVE_LUA)
+        result = await script(
+            keys=PvpStateService.keys(game_id),
+            args=[user_id, x, y, move, int(now * 1000), PvpStateService.STATE_TTL, game_id]
+        )
+
+        code = result[0]
+        if code == -1:
+            return None
+        if code == -4:
+            grid_size = await (await get_redis()).hget(PvpStateService.keys(game_id)[0], "grid_size")
+            raise ValueError(f"Координаты вне границ поля (0-{int(grid_size) - 1})")
+        if code < 0:
+            raise ValueError(PvpStateService.MOVE_ERRORS[code])
+
+        _, placed, player1_count, player2_count, finished, winner, limit = result
+        return {
+            "player": code,
+            "pixels_placed": placed,
+            "pixels_remaining": limit - placed,
+            "player1_pixels_count": player1_count,
+            "player2_pixels_count": player2_count,
+            "game_finished": bool(finished),
+            "winner_id": winner or None,
+            "timestamp": now
+        }
+
+    @staticmethod
+    async def get_state(game_id: int) -> Optional[dict]:
+        """Текущее состояние игры из Redis (None, если его нет)"""
+        keys = PvpStateService.keys(game_id)
+        redis = await get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(keys[0])
+            pipe.lrange(keys[3], 0, -1)
+            pipe.lrange(keys[4], 0, -1)
+            state, moves1, moves2 = await pipe.execute()
+        if not state:
+            return None
+        return {
+            "status": state["status"],
+            "winner_id": int(state.get("winner") or 0) or None,
+            "version": int(state["version"]),
+            "flushed": int(state["flushed"]),
+            "player1_pixels": [json.loads(move) for move in moves1],
+            "player2_pixels": [json.loads(move) for move in moves2],
+        }
+
+    @staticmethod
+    async def persist(db: AsyncSession, game_id: int) -> bool:
+        """
+        Записать игру в БД одним UPDATE.
+        Состояние законченной игры после записи удаляется из Redis.
+        """
+        state = await PvpStateService.get_state(game_id)
+        if state is None:
+            return False
+
+        values = {
+            "player1_pixels": state["player1_pixels"],
+            "player2_pixels": state["player2_pixels"],
+        }
+        finished = state["status"] == GameStatus.FINISHED.value
+        if finished:
+            values["status"] = GameStatus.FINISHED
+            values["winner_id"] = state["winner_id"]
+            values["finished_at"] = datetime.now(timezone.utc)
+
+        await db.execute(
+            update(GameSession).where(GameSession.id == game_id).values(**values)
+        )
+        await db.commit()
+
+        keys = PvpStateService.keys(game_id)
+        redis = await get_redis()
+        if finished:
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.delete(*keys[:5])
+                pipe.zrem(PvpStateService.LIVE_KEY, game_id)
+                await pipe.execute()
+            await GameCacheService.invalidate(game_id)
+        else:
+            await redis.hset(keys[0], "flushed", state["version"])
+        return True
+
+    @staticmethod
+    async def drop(*game_ids: int):
+        """Удалить состояние игр из Redis (игры отменены)"""
+        if not game_ids:
+            return
+        redis = await get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            for game_id in game_ids:
+                pipe.delete(*PvpStateService.keys(game_id)[:5])
+            pipe.zrem(PvpStateService.LIVE_KEY, *game_ids)
+            await pipe.execute()
+
+    @staticmethod
+    async def flush(db: AsyncSession) -> int:
+        """Записать в БД идущие игры, изменившиеся с прошлой записи"""
+        redis = await get_redis()
+        game_ids = await redis.zrange(PvpStateService.LIVE_KEY, 0, -1)
+        flushed = 0
+        for game_id in game_ids:
+            key = PvpStateService.keys(game_id)[0]
+            version, last_flushed = await redis.hmget(key, "version", "flushed")
+            if version is None:
+                # Состояние истекло или вытеснено
+                await redis.zrem(PvpStateService.LIVE_KEY, game_id)
+                continue
+            if int(version) > int(last_flushed or 0):
+                if await PvpStateService.persist(db, int(game_id)):
+                    flushed += 1
+        return flushed
+
+    @staticmethod
+    async def run_flush():
+        """Периодическая запись идущих игр (для планировщика)"""
+        async with AsyncSessionLocal() as db:
+            flushed = await PvpStateService.flush(db)
+        if flushed:
+            print(f"[PVP] Записано игр: {flushed}")
@@ -0,0 +1,264 @@
+"""
+Сервис статистики: инкрементальные счётчики в Redis и их сверка с PostgreSQL
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, tuple_
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict
+
+from app.models.pixel import Pixel
+from app.models.user import User
+from app.models.team import Team, team_members
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis import get_redis
+from app.services.canvas_store import CanvasStore
+from app.services.leaderboard_service import LeaderboardService
+
+
+class StatsService:
+    """Сервис для работы со статистикой"""
+
+    USERS_KEY = "stats:users"
+    TEAMS_KEY = "stats:teams"
+    TEAM_MEMBERS_KEY = "stats:team_members"
+    FILLED_MISMATCH_KEY = "stats:filled_mismatch"  # Прошлая сверка нашла расхождение счётчика клеток
+
+    # Сколько дней назад засевать HyperLogLog активных пользователей при сверке
+    ACTIVE_SEED_DAYS = 30
+
+    @staticmethod
+    async def record_placement(
+        x: int,
+        y: int,
+        color: str,
+        user_id: int,
+        team_id: Optional[int] = None
+    ):
+        """Учесть размещение пикселя в массивах холста и счётчиках"""
+        await CanvasStore.apply_placements([(x, y, color, user_id, team_id or 0)])
+
+    @staticmethod
+    async def incr_users(amount: int = 1):
+        """Изменить счётчик пользователей"""
+        redis = await get_redis()
+        await redis.incrby(StatsService.USERS_KEY, amount)
+
+    @staticmethod
+    async def incr_teams(amount: int = 1):
+        """Изменить счётчик команд"""
+        redis = await get_redis()
+        await redis.incrby(StatsService.TEAMS_KEY, amount)
+
+    @staticmethod
+    async def incr_team_members(amount: int = 1):
+        """Изменить счётчик участников команд"""
+        redis = await get_redis()
+        await redis.incrby(StatsService.TEAM_MEMBERS_KEY, amount)
+
+    @staticmethod
+    async def get_filled_count() -> Optional[int]:
+        """Количество заполненных клеток (None, если счётчик ещё не заполнен)"""
+        redis = await get_redis()
+        value = await redis.get(CanvasStore.FILLED_KEY)
+        return int(value) if value is not None else None
+
+    @staticmethod
+    async def get_active_users_count(days: int) -> int:
+        """Оценка количества пользователей, ставивших пиксели за последние N дней"""
+        now = datetime.now(timezone.utc)
+        keys = [
+            CanvasStore.active_day_key(now - timedelta(days=offset))
+            for offset in range(days)
+        ]
+        redis = await get_redis()
+        return await redis.pfcount(*keys)
+
+    @staticmethod
+    async def get_user_pixels(user_id: int) -> int:
+        """Количество пикселей, поставленных пользователем"""
+        redis = await get_redis()
+        value = await redis.zscore(LeaderboardService.PIXELS_KEY, str(user_id))
+        return int(value or 0)
+
+    @staticmethod
+    async def get_team_pixels() -> Dict[int, int]:
+        """Количество пикселей по командам"""
+        redis = await get_redis()
+        totals = await redis.zrange(LeaderboardService.TEAMS_KEY, 0, -1, withscores=True)
+        return {int(team_id): int(count) for team_id, count in totals}
+
+    @staticmethod
+    async def get_user_stats(user_id: int, team_id: Optional[int] = None) -> dict:
+        """
+        Личная статистика игрока из инкрементальных счётчиков Redis:
+        пиксели и место, клетки во владении и место по ним, место команды,
+        серии дней и любимый цвет. Один round trip, без запросов к таблице pixels.
+        """
+        member = str(user_id)
+        redis = await get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.zscore(LeaderboardService.PIXELS_KEY, member)
+            pipe.zrevrank(LeaderboardService.PIXELS_KEY, member)
+            pipe.zcard(LeaderboardService.PIXELS_KEY)
+            pipe.zscore(CanvasStore.OWNED_KEY, member)
+            pipe.zrevrank(CanvasStore.OWNED_KEY, member)
+            pipe.hgetall(f"{CanvasStore.USER_STATS_PREFIX}{user_id}")
+            if team_id:
+                pipe.zrevrank(LeaderboardService.TEAMS_KEY, str(team_id))
+                pipe.zscore(CanvasStore.TERRITORY_KEY, str(team_id))
+            results = await pipe.execute()
+
+        pixels, rank, players, owned, owned_rank, personal = results[:6]
+        team_rank, team_cells = results[6:] if team_id else (None, None)
+
+        # Серия прервана, если вчера и сегодня размещений не было
+        streak = int(personal.get("streak") or 0)
+        if int(personal.get("last_day") or -1) < CanvasStore.day_number() - 1:
+            streak = 0
+
+        return {
+            "pixels_placed": int(pixels or 0),
+            "rank": rank + 1 if rank is not None else None,
+            "players": players,
+            "cells_owned": int(owned or 0),
+            "cells_rank": owned_rank + 1 if owned_rank is not None else None,
+            "team_rank": team_rank + 1 if team_rank is not None else None,
+            "team_cells": int(team_cells or 0),
+            "streak_days": streak,
+            "best_streak_days": int(personal.get("best_streak") or 0),
+            "favorite_color": personal.get("fav_color"),
+            "favorite_color_count": int(personal.get("fav_count") or 0),
+        }
+
+    @staticmethod
+    async def get_canvas_stats() -> dict:
+        """
+        Статистика холста и пользователей.
+        Все значения читаются из Redis за один round trip.
+        """
+        now = datetime.now(timezone.utc)
+        redis = await get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.get(CanvasStore.FILLED_KEY)
+            pipe.get(CanvasStore.minute_key(now))
+            pipe.get(CanvasStore.minute_key(now - timedelta(minutes=1)))
+            pipe.hgetall(CanvasStore.COLORS_HISTOGRAM_KEY)
+            pipe.get(StatsService.USERS_KEY)
+            pipe.get(StatsService.TEAMS_KEY)
+            pipe.get(StatsService.TEAM_MEMBERS_KEY)
+            pipe.pfcount(*[
+                CanvasStore.active_day_key(now - timedelta(days=offset))
+                for offset in range(7)
+            ])
+            pipe.pfcount(*[
+                CanvasStore.active_day_key(now - timedelta(days=offset))
+                for offset in range(30)
+            ])
+            (
+                filled, current_minute, last_minute, colors,
+                users, teams, members, active_7d, active_30d
+            ) = await pipe.execute()
+
+        total_pixels = int(filled or 0)
+        canvas_size = CanvasStore.cells_count()
+
+        return {
+            "total_pixels": total_pixels,
+            "canvas_width": settings.CANVAS_WIDTH,
+            "canvas_height": settings.CANVAS_HEIGHT,
+            "canvas_size": canvas_size,
+            "coverage_percent": round((total_pixels / canvas_size) * 100, 2) if total_pixels > 0 else 0,
+            "placements_per_minute": int(last_minute or 0),
+            "placements_current_minute": int(current_minute or 0),
+            "colors": {color: int(count) for color, count in colors.items()},
+            "total_users": int(users or 0),
+            "active_users_7d": active_7d,
+            "active_users_30d": active_30d,
+            "total_teams": int(teams or 0),
+            "total_team_members": int(members or 0),
+        }
+
+    @staticmethod
+    async def reconcile(db: AsyncSession):
+        """
+        Сверить счётчики Redis с PostgreSQL.
+        Скалярные счётчики перезаписываются значениями из БД, массивы холста
+        и гистограмма пересобираются, если их нет или число заполненных клеток
+        разошлось с БД две сверки подряд: под нагрузкой счётчик ненадолго отстаёт
+        от БД, а пересборка затирает размещения, пришедшие во время неё.
+        """
+        redis = await get_redis()
+
+        total_pixels = (await db.execute(
+            select(func.count(func.distinct(tuple_(Pixel.x, Pixel.y))))
+        )).scalar() or 0
+        filled = await StatsService.get_filled_count()
+
+        missing = (
+            not await CanvasStore.is_loaded()
+            or (total_pixels and not await redis.exists(CanvasStore.OWNED_KEY))
+        )
+        drifted = False
+        if filled != total_pixels:
+            # Расхождение запоминается до следующей сверки (с запасом на её задержку)
+            drifted = bool(await redis.exists(StatsService.FILLED_MISMATCH_KEY))
+            await redis.set(
+                StatsService.FILLED_MISMATCH_KEY, 1,
+                ex=settings.STATS_RECONCILE_INTERVAL_SECONDS * 3
+            )
+        else:
+            await redis.delete(StatsService.FILLED_MISMATCH_KEY)
+
+        if missing or drifted:
+            print(f"[STATS] Пересборка холста: счётчик={filled}, БД={total_pixels}")
+            filled, histogram = await CanvasStore.rebuild_from_db(db)
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.delete(StatsService.FILLED_MISMATCH_KEY)
+                pipe.set(CanvasStore.FILLED_KEY, filled)
+                pipe.delete(CanvasStore.COLORS_HISTOGRAM_KEY)
+                if histogram:
+                    pipe.hset(CanvasStore.COLORS_HISTOGRAM_KEY, mapping=histogram)
+                await pipe.execute()
+
+        users = (await db.execute(select(func.count(User.id)))).scalar() or 0
+        teams = (await db.execute(select(func.count(Team.id)))).scalar() or 0
+        members = (await db.execute(
+            select(func.count(team_members.c.user_id))
+        )).scalar() or 0
+
+        # Пиксели по игрокам (лидерборд за всё время) берём из users.pixels_placed
+        user_pixels = (await db.execute(
+            select(User.id, User.pixels_placed).where(User.pixels_placed > 0)
+        )).all()
+
+        # Пользователь активен в день своего последнего размещения —
+        # объединение таких дней за окно совпадает с выборкой по last_pixel_at
+        cutoff = datetime.now(timezone.utc) - timedelta(days=StatsService.ACTIVE_SEED_DAYS)
+        active = (await db.execute(
+            select(User.id, User.last_pixel_at).where(User.last_pixel_at >= cutoff)
+        )).all()
+
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.set(StatsService.USERS_KEY, users)
+            pipe.set(StatsService.TEAMS_KEY, teams)
+            pipe.set(StatsService.TEAM_MEMBERS_KEY, members)
+            if user_pixels:
+                pipe.zadd(
+                    LeaderboardService.PIXELS_KEY,
+                    {str(user_id): count for user_id, count in user_pixels}
+                )
+            for user_id, last_pixel_at in active:
+                day_key = CanvasStore.active_day_key(last_pixel_at)
+                pipe.pfadd(day_key, str(user_id))
+                pipe.expire(day_key, CanvasStore.ACTIVE_DAY_KEY_TTL)
+            await pipe.execute()
+        
+        if not await redis.exists(LeaderboardService.MEMORY_KEY):
+            await LeaderboardService.rebuild_memory(db)
+
+    @staticmethod
+    async def run_reconciliation():
+        """Задача планировщика: сверка в отдельной сессии БД"""
+        async with AsyncSessionLocal() as db:
+            await StatsService.reconcile(db)
@@ -2,27 +2,32 @@
 Сервис для работы с командами
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
-from sqlalchemy.orm import selectinload
-from typing import Optional, List
-import string
-import secrets
+from sqlalchemy import select, and_, func
+from sqlalchemy.orm import selectinload, aliased
+from typing import Optional, List, Dict
+import json
 
 from app.models.team import Team, team_members
 from app.models.user import User
+from app.core.redis import get_redis
+from app.core.database import mark_user_write
+from app.core import queries
+from app.services.stats_service import StatsService
+from app.services.territory_service import TerritoryService
+from app.services.code_service import CodeService
 
 
 class TeamService:
     """Сервис для работы с командами"""
     
-    @staticmethod
-    def generate_team_code(length: int = 6) -> str:
-        """Генерация уникального кода команды"""
-        # Используем только заглавные буквы и цифры для читаемости
-        alphabet = string.ascii_uppercase + string.digits
-        # Исключаем похожие символы: 0, O, I, 1
-        alphabet = alphabet.replace('0', '').replace('O', '').replace('I', '').replace('1', '')
-        return ''.join(secrets.choice(alphabet) for _ in range(length))
+    # Кеш основной команды игрока (та, в которую он вступил первой)
+    PRIMARY_TEAM_CACHE_PREFIX = "user_team:"
+    PRIMARY_TEAM_CACHE_TTL = 300  # 5 минут
+    
+    # Кеш сводки команды для бота: код -> team_id, team_id -> JSON сводки
+    TEAM_CODE_CACHE_PREFIX = "team:code:"
+    TEAM_SUMMARY_CACHE_PREFIX = "team:summary:"
+    TEAM_SUMMARY_CACHE_TTL = 300  # 5 минут
     
     @staticmethod
     async def create_team(
@@ -32,22 +37,9 @@ class TeamService:
         description: Optional[str] = None
     ) -> Team:
         """Создать новую команду"""
-        # Генерируем уникальный код
-        max_attempts = 10
-        for _ in range(max_attempts):
-            code = TeamService.generate_team_code()
-            # Проверяем уникальность
-            result = await db.execute(
-                select(Team).where(Team.code == code)
-            )
-            if result.scalar_one_or_none() is None:
-                break
-        else:
-            raise ValueError("Не удалось сгенерировать уникальный код команды")
-        
         team = Team(
             name=name,
-            code=code,
+            code=CodeService.next_code("team"),  # Уникален по построению, вычисляется в INSERT
             owner_id=owner_id,
             description=description
         )
@@ -66,6 +58,11 @@ class TeamService:
         
         await db.commit()
         await db.refresh(team)
+        
+        await StatsService.incr_teams()
+        await StatsService.incr_team_members()
+        await TeamService.invalidate_primary_team(owner_id)
+        await mark_user_write(owner_id)
         return team
     
     @staticmethod
@@ -104,6 +101,180 @@ class TeamService:
         )
         return list(result.scalars().all())
     
+    @staticmethod
+    async def get_primary_team_id(
+        db: AsyncSession,
+        user_id: int
+    ) -> Optional[int]:
+        """
+        Получить основную команду пользователя (первую, в которую он вступил).
+        Результат кешируется в Redis, кеш сбрасывается при изменении состава команд.
+        """
+        redis = await get_redis()
+        cache_key = f"{TeamService.PRIMARY_TEAM_CACHE_PREFIX}{user_id}"
+        cached = await redis.get(cache_key)
+        if cached is not None:
+            return int(cached) or None
+        
+        team_id = await queries.fetch_scalar(db, queries.PRIMARY_TEAM_ID, user_id=user_id)
+        await redis.setex(cache_key, TeamService.PRIMARY_TEAM_CACHE_TTL, team_id or 0)
+        return team_id
+    
+    @staticmethod
+    async def get_primary_team_ids(
+        db: AsyncSession,
+        user_ids: List[int]
+    ) -> Dict[int, int]:
+        """Основные команды для набора пользователей одним запросом (без команды — не в словаре)"""
+        if not user_ids:
+            return {}
+        result = await db.execute(
+            select(team_members.c.user_id, team_members.c.team_id)
+            .where(team_members.c.user_id.in_(user_ids))
+            .order_by(team_members.c.joined_at, team_members.c.team_id)
+        )
+        primary_teams: Dict[int, int] = {}
+        for user_id, team_id in result.all():
+            primary_teams.setdefault(user_id, team_id)
+        return primary_teams
+    
+    @staticmethod
+    async def invalidate_primary_team(*user_ids: int):
+        """Сбросить кеш основной команды пользователей"""
+        if not user_ids:
+            return
+        redis = await get_redis()
+        await redis.delete(*[
+            f"{TeamService.PRIMARY_TEAM_CACHE_PREFIX}{user_id}" for user_id in user_ids
+        ])
+    
+    @staticmethod
+    def _members_count_subquery():
+        """Коррелированный подзапрос: число участников команды Team.id"""
+        members = team_members.alias("members")
+        return (
+            select(func.count())
+            .where(members.c.team_id == Team.id)
+            .scalar_subquery()
+        )
+    
+    @staticmethod
+    async def get_user_team_summaries(
+        db: AsyncSession,
+        user_id: int
+    ) -> List[dict]:
+        """
+        Команды пользователя одним запросом:
+        код, название, владеет ли пользователь командой и число участников
+        """
+        result = await db.execute(
+            select(
+                Team.id,
+                Team.name,
+                Team.code,
+                team_members.c.is_owner,
+                TeamService._members_count_subquery().label("members_count")
+            )
+            .join(team_members, team_members.c.team_id == Team.id)
+            .where(team_members.c.user_id == user_id)
+            .order_by(team_members.c.joined_at, Team.id)
+        )
+        return [
+            {
+                "id": row.id,
+                "name": row.name,
+                "code": row.code,
+                "is_owner": bool(row.is_owner),
+                "members_count": row.members_count
+            }
+            for row in result
+        ]
+    
+    @staticmethod
+    async def get_team_summary(
+        db: AsyncSession,
+        code: str
+    ) -> Optional[dict]:
+        """
+        Сводка команды по коду: данные команды, имя владельца и число участников.
+        Читается из кеша Redis, при промахе — одним запросом к БД.
+        """
+        code = code.upper()
+        redis = await get_redis()
+        team_id = await redis.get(f"{TeamService.TEAM_CODE_CACHE_PREFIX}{code}")
+        if team_id:
+            cached = await redis.get(f"{TeamService.TEAM_SUMMARY_CACHE_PREFIX}{team_id}")
+            if cached:
+                return json.loads(cached)
+        
+        owner = aliased(User)
+        result = await db.execute(
+            select(
+                Team,
+                owner.first_name,
+                owner.username,
+                TeamService._members_count_subquery().label("members_count")
+            )
+            .join(owner, owner.id == Team.owner_id)
+            .where(Team.code == code)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        
+        team = row.Team
+        summary = {
+            "id": team.id,
+            "name": team.name,
+            "code": team.code,
+            "description": team.description,
+            "owner_id": team.owner_id,
+            "owner_name": row.first_name or row.username or "Неизвестно",
+            "owner_username": row.username,
+            "members_count": row.members_count,
+            "created_at": team.created_at.isoformat() if team.created_at else None
+        }
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.setex(f"{TeamService.TEAM_CODE_CACHE_PREFIX}{code}", TeamService.TEAM_SUMMARY_CACHE_TTL, team.id)
+            pipe.setex(
+                f"{TeamService.TEAM_SUMMARY_CACHE_PREFIX}{team.id}",
+                TeamService.TEAM_SUMMARY_CACHE_TTL,
+                json.dumps(summary)
+            )
+            await pipe.execute()
+        return summary
+    
+    @staticmethod
+    async def invalidate_team_summary(*team_ids: int):
+        """Сбросить кеш сводки команд после изменения состава"""
+        if not team_ids:
+            return
+        redis = await get_redis()
+        await redis.delete(*[
+            f"{TeamService.TEAM_SUMMARY_CACHE_PREFIX}{team_id}" for team_id in team_ids
+        ])
+    
+    @staticmethod
+    async def get_team_roster(
+        db: AsyncSession,
+        team_id: int
+    ) -> List[dict]:
+        """Участники команды (только имена и флаг владельца), владелец первым"""
+        result = await db.execute(
+            select(User.first_name, User.username, team_members.c.is_owner)
+            .join(team_members, team_members.c.user_id == User.id)
+            .where(team_members.c.team_id == team_id)
+            .order_by(team_members.c.is_owner.desc(), team_members.c.joined_at)
+        )
+        return [
+            {
+                "name": row.first_name or row.username or "Неизвестно",
+                "username": row.username,
+                "is_owner": bool(row.is_owner)
+            }
+            for row in result
+        ]
+    
     @staticmethod
     async def is_user_in_team(
         db: AsyncSession,
@@ -111,15 +282,8 @@ class TeamService:
         team_id: int
     ) -> bool:
         """Проверить, является ли пользователь участником команды"""
-        result = await db.execute(
-            select(team_members).where(
-                and_(
-                    team_members.c.user_id == user_id,
-                    team_members.c.team_id == team_id
-                )
-            )
-        )
-        return result.first() is not None
+        row = await queries.fetch_one(db, queries.TEAM_MEMBERSHIP, user_id=user_id, team_id=team_id)
+        return row is not None
     
     @staticmethod
     async def add_user_to_team(
@@ -141,6 +305,11 @@ class TeamService:
             )
         )
         await db.commit()
+        
+        await StatsService.incr_team_members()
+        await TeamService.invalidate_primary_team(user_id)
+        await TeamService.invalidate_team_summary(team_id)
+        await mark_user_write(user_id)
         return True
     
     @staticmethod
@@ -173,6 +342,11 @@ class TeamService:
             )
         )
         await db.commit()
+        
+        await StatsService.incr_team_members(-1)
+        await TeamService.invalidate_primary_team(user_id)
+        await TeamService.invalidate_team_summary(team_id)
+        await mark_user_write(user_id)
         return True
     
     @staticmethod
@@ -186,8 +360,18 @@ class TeamService:
         if not team or team.owner_id != owner_id:
             return False
         
+        member_ids = list((await db.execute(
+            select(team_members.c.user_id).where(team_members.c.team_id == team_id)
+        )).scalars().all())
+        
         await db.delete(team)
         await db.commit()
+        
+        await StatsService.incr_teams(-1)
+        await StatsService.incr_team_members(-len(member_ids))
+        await TeamService.invalidate_primary_team(*member_ids)
+        await TeamService.invalidate_team_summary(team_id)
+        await TerritoryService.remove_team(team_id)
         return True
     
     @staticmethod
@@ -210,16 +394,8 @@ class TeamService:
         team_id: int
     ) -> bool:
         """Проверить, является ли пользователь владельцем команды"""
-        result = await db.execute(
-            select(team_members).where(
-                and_(
-                    team_members.c.user_id == user_id,
-                    team_members.c.team_id == team_id,
-                    team_members.c.is_owner == True
-                )
-            )
-        )
-        return result.first() is not None
+        row = await queries.fetch_one(db, queries.TEAM_MEMBERSHIP, user_id=user_id, team_id=team_id)
+        return row is not None and bool(row.is_owner)
     
     @staticmethod
     async def get_all_teams(
@@ -0,0 +1,118 @@
+"""
+Сервис территорий команд: кому принадлежат клетки холста
+Считается по массивам холста в Redis, без запросов к таблице pixels
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from array import array
+from collections import Counter
+from typing import List
+import asyncio
+import json
+import sys
+
+from app.models.team import Team
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.services.canvas_store import CanvasStore
+
+
+class TerritoryService:
+    """Сервис для работы с территориями команд"""
+
+    HEATMAP_CACHE_PREFIX = "territory:heatmap:"
+    HEATMAP_CACHE_TTL = 5  # секунды
+    MIN_BLOCK_SIZE = 5
+
+    @staticmethod
+    async def get_standings(
+        db: AsyncSession,
+        limit: int = 10
+    ) -> List[dict]:
+        """Команды по количеству принадлежащих им клеток"""
+        redis = await get_redis()
+        top = await redis.zrevrange(CanvasStore.TERRITORY_KEY, 0, limit - 1, withscores=True)
+        team_ids = [int(team_id) for team_id, _ in top]
+        if not team_ids:
+            return []
+
+        result = await db.execute(
+            select(Team.id, Team.name, Team.code).where(Team.id.in_(team_ids))
+        )
+        teams = {row.id: row for row in result.all()}
+        canvas_size = CanvasStore.cells_count()
+
+        standings = []
+        for team_id, cells in top:
+            team = teams.get(int(team_id))
+            if team is None:
+                continue  # Команда удалена
+            standings.append({
+                "rank": len(standings) + 1,
+                "team_id": team.id,
+                "name": team.name,
+                "code": team.code,
+                "cells": int(cells),
+                "percent": round(cells / canvas_size * 100, 2)
+            })
+        return standings
+
+    @staticmethod
+    def build_heatmap(teams_bytes: bytes, block_size: int) -> dict:
+        """Посчитать карту территорий по массиву команд-владельцев (синхронно, CPU)"""
+        teams = array("I")
+        teams.frombytes(teams_bytes)
+        if sys.byteorder == "little":
+            teams.byteswap()  # BITFIELD хранит значения в big-endian
+
+        width = settings.CANVAS_WIDTH
+        height = settings.CANVAS_HEIGHT
+        columns = (width + block_size - 1) // block_size
+        rows = []
+        for block_y in range(0, height, block_size):
+            counters = [Counter() for _ in range(columns)]
+            for y in range(block_y, min(block_y + block_size, height)):
+                row_start = y * width
+                for column, block_x in enumerate(range(0, width, block_size)):
+                    counters[column].update(
+                        teams[row_start + block_x:row_start + min(block_x + block_size, width)]
+                    )
+            row = []
+            for counter in counters:
+                counter.pop(0, None)
+                row.append(counter.most_common(1)[0][0] if counter else 0)
+            rows.append(row)
+
+        return {
+            "block_size": block_size,
+            "width": columns,
+            "height": len(rows),
+            "teams": rows
+        }
+
+    @staticmethod
+    async def get_heatmap(block_size: int) -> dict:
+        """
+        Уменьшенная карта территорий: для каждого блока block_size x block_size
+        клеток — команда, которой принадлежит больше всего клеток блока (0 — никто).
+        Результат кешируется на несколько секунд.
+        """
+        block_size = max(block_size, TerritoryService.MIN_BLOCK_SIZE)
+        cache_key = f"{TerritoryService.HEATMAP_CACHE_PREFIX}{block_size}"
+        redis = await get_redis()
+        cached = await redis.get(cache_key)
+        if cached:
+            return json.loads(cached)
+
+        # Подсчёт по всему холсту (~1M клеток) — в отдельном потоке,
+        # чтобы не останавливать цикл событий (WebSocket и HTTP этого воркера)
+        teams_bytes = await CanvasStore.read_teams()
+        heatmap = await asyncio.to_thread(TerritoryService.build_heatmap, teams_bytes, block_size)
+        await redis.setex(cache_key, TerritoryService.HEATMAP_CACHE_TTL, json.dumps(heatmap))
+        return heatmap
+
+    @staticmethod
+    async def remove_team(team_id: int):
+        """Убрать удалённую команду из таблицы территорий"""
+        redis = await get_redis()
+        await redis.zrem(CanvasStore.TERRITORY_KEY, str(team_id))
@@ -3,36 +3,55 @@
 """
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import Optional
+from sqlalchemy.engine import Row
+from typing import Optional, Union
 
 from app.models.user import User
 from app.schemas.user import UserCreate
+from app.core.redis import get_redis
+from app.core.database import mark_user_write
+from app.core import queries
+from app.services.stats_service import StatsService
 
 
 class UserService:
     """Сервис для работы с пользователями"""
     
+    TELEGRAM_ID_CACHE_PREFIX = "user_tg:"
+    TELEGRAM_ID_CACHE_TTL = 24 * 60 * 60  # 1 день
+    
     @staticmethod
     async def get_user_by_telegram_id(
         db: AsyncSession,
         telegram_id: int
-    ) -> Optional[User]:
-        """Получить пользователя по Telegram ID"""
-        result = await db.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        return result.scalar_one_or_none()
+    ) -> Optional[Row]:
+        """Получить пользователя по Telegram ID (строка с полями User, только для чтения)"""
+        return await queries.fetch_one(db, queries.USER_BY_TELEGRAM_ID, telegram_id=telegram_id)
+    
+    @staticmethod
+    async def get_user_id_by_telegram_id(
+        db: AsyncSession,
+        telegram_id: int
+    ) -> Optional[int]:
+        """ID пользователя по Telegram ID (соответствие не меняется, кешируется в Redis)"""
+        redis = await get_redis()
+        cache_key = f"{UserService.TELEGRAM_ID_CACHE_PREFIX}{telegram_id}"
+        cached = await redis.get(cache_key)
+        if cached:
+            return int(cached)
+        
+        user_id = await queries.fetch_scalar(db, queries.USER_ID_BY_TELEGRAM_ID, telegram_id=telegram_id)
+        if user_id is not None:
+            await redis.setex(cache_key, UserService.TELEGRAM_ID_CACHE_TTL, user_id)
+        return user_id
     
     @staticmethod
     async def get_user_by_id(
         db: AsyncSession,
         user_id: int
-    ) -> Optional[User]:
-        """Получить пользователя по ID"""
-        result = await db.execute(
-            select(User).where(User.id == user_id)
-        )
-        return result.scalar_one_or_none()
+    ) -> Optional[Row]:
+        """Получить пользователя по ID (строка с полями User, только для чтения)"""
+        return await queries.fetch_one(db, queries.USER_BY_ID, user_id=user_id)
     
     @staticmethod
     async def create_user(
@@ -49,13 +68,15 @@ class UserService:
         db.add(user)
         await db.commit()
         await db.refresh(user)
+        await StatsService.incr_users()
+        await mark_user_write(user.id)
         return user
     
     @staticmethod
     async def get_or_create_user(
         db: AsyncSession,
         user_data: UserCreate
-    ) -> User:
+    ) -> Union[Row, User]:
         """Получить существующего или создать нового пользователя"""
         user = await UserService.get_user_by_telegram_id(
             db, user_data.telegram_id
@@ -66,6 +87,17 @@ class UserService:
         
         return user
     
+    @staticmethod
+    async def get_or_create_user_id(
+        db: AsyncSession,
+        user_data: UserCreate
+    ) -> int:
+        """ID пользователя по Telegram ID (из кеша), новый пользователь создаётся"""
+        user_id = await UserService.get_user_id_by_telegram_id(db, user_data.telegram_id)
+        if user_id is None:
+            user_id = (await UserService.create_user(db, user_data)).id
+        return user_id
+    
     @staticmethod
     async def get_all_users(
         db: AsyncSession
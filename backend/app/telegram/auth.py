@@ -1,7 +1,7 @@
 """
 Авторизация через Telegram
 """
-from fastapi import Depends, HTTPException, status, Header
+from fastapi import Depends, HTTPException, status, Header, WebSocket
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 import hmac
@@ -9,7 +9,7 @@ import hashlib
 import json
 import time
 
-from app.core.database import get_db
+from app.core.database import get_db, get_db_read_for_user
 from app.core.config import settings
 from app.services.user_service import UserService
 from app.schemas.user import UserCreate
@@ -86,8 +86,7 @@ async def get_current_user(
             first_name="Test",
             last_name="User"
         )
-        user = await UserService.get_or_create_user(db, test_user_create)
-        return user.id
+        return await UserService.get_or_create_user_id(db, test_user_create)
     
     # Если нет Telegram токена, но есть initData - это ошибка конфигурации
     if not settings.TELEGRAM_BOT_TOKEN:
@@ -98,8 +97,7 @@ async def get_current_user(
             first_name="Test",
             last_name="User"
         )
-        user = await UserService.get_or_create_user(db, test_user_create)
-        return user.id
+        return await UserService.get_or_create_user_id(db, test_user_create)
     
     # Проверяем авторизацию через Telegram
     try:
@@ -112,8 +110,7 @@ async def get_current_user(
             first_name="Test",
             last_name="User"
         )
-        user = await UserService.get_or_create_user(db, test_user_create)
-        return user.id
+        return await UserService.get_or_create_user_id(db, test_user_create)
     
     # Получаем или создаем пользователя из Telegram данных
     user_create = UserCreate(
@@ -123,5 +120,66 @@ async def get_current_user(
         last_name=user_data.get("last_name")
     )
     
-    user = await UserService.get_or_create_user(db, user_create)
-    return user.id
+    return await UserService.get_or_create_user_id(db, user_create)
+
+
+async def get_websocket_user_id(db: AsyncSession, websocket: WebSocket) -> Optional[int]:
+    """
+    Пользователь WebSocket подключения по initData из query параметра init_data
+    (браузер не передаёт свои заголовки при подключении WebSocket).
+    None — initData нет или подпись не прошла проверку.
+    """
+    # Без токена бота (разработка) — тестовый пользователь, как в get_current_user
+    if not settings.TELEGRAM_BOT_TOKEN:
+        test_user_create = UserCreate(
+            telegram_id=999999999,
+            username="test_user",
+            first_name="Test",
+            last_name="User"
+        )
+        return await UserService.get_or_create_user_id(db, test_user_create)
+    
+    init_data = websocket.query_params.get("init_data")
+    if not init_data:
+        return None
+    try:
+        user_data = verify_telegram_auth(init_data)
+    except HTTPException:
+        return None
+    if not user_data.get("id"):
+        return None
+    
+    user_create = UserCreate(
+        telegram_id=user_data.get("id"),
+        username=user_data.get("username"),
+        first_name=user_data.get("first_name"),
+        last_name=user_data.get("last_name")
+    )
+    return await UserService.get_or_create_user_id(db, user_create)
+
+
+async def get_current_admin(
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user)
+) -> int:
+    """
+    Dependency для админских эндпоинтов
+    """
+    user = await UserService.get_user_by_id(db, current_user_id)
+    if not user or user.telegram_id != settings.ADMIN_TELEGRAM_ID:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Недостаточно прав"
+        )
+    return current_user_id
+
+
+async def get_user_db_read(
+    current_user_id: int = Depends(get_current_user)
+):
+    """
+    Dependency: сессия для чтения данных текущего пользователя.
+    Реплика, если пользователь недавно не писал в БД, иначе основная БД.
+    """
+    async for session in get_db_read_for_user(current_user_id):
+        yield session
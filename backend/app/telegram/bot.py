@@ -4,14 +4,16 @@ Telegram Bot для авторизации, уведомлений и работ
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from sqlalchemy.ext.asyncio import AsyncSession
-import asyncio
+from datetime import datetime
 
 from app.core.config import settings
 from app.core.database import AsyncSessionLocal
 from app.services.user_service import UserService
 from app.schemas.user import UserCreate
 from app.services.team_service import TeamService
-from app.services.pixel_service import PixelService
+from app.services.stats_service import StatsService
+from app.services.leaderboard_service import LeaderboardService
+from app.services.broadcast_service import BroadcastService
 
 
 async def get_db():
@@ -174,7 +176,8 @@ async def my_teams(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Пользователь не найден. Используй /start для регистрации")
             return
         
-        teams = await TeamService.get_user_teams(db, db_user.id)
+        # Одним запросом: команды, флаг владельца и число участников
+        teams = await TeamService.get_user_team_summaries(db, db_user.id)
         
         if not teams:
             await update.message.reply_text(
@@ -186,12 +189,10 @@ async def my_teams(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         message = "📋 Твои команды:\n\n"
         for team in teams:
-            is_owner = await TeamService.is_owner(db, db_user.id, team.id)
-            owner_mark = "👑" if is_owner else "👤"
-            members_count = len(await TeamService.get_team_members(db, team.id))
-            message += f"{owner_mark} <b>{team.name}</b>\n"
-            message += f"   Код: <code>{team.code}</code>\n"
-            message += f"   Участников: {members_count}\n\n"
+            owner_mark = "👑" if team["is_owner"] else "👤"
+            message += f"{owner_mark} <b>{team['name']}</b>\n"
+            message += f"   Код: <code>{team['code']}</code>\n"
+            message += f"   Участников: {team['members_count']}\n\n"
         
         await update.message.reply_text(message, parse_mode="HTML")
         break
@@ -209,22 +210,22 @@ async def team_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     team_code = context.args[0].upper().strip()
     
     async for db in get_db():
-        team = await TeamService.get_team_by_code(db, team_code)
+        # Сводка из кеша (при промахе — один запрос с владельцем и числом участников)
+        team = await TeamService.get_team_summary(db, team_code)
         if not team:
             await update.message.reply_text(f"❌ Команда с кодом '{team_code}' не найдена")
             return
         
-        members = await TeamService.get_team_members(db, team.id)
-        owner = await UserService.get_user_by_id(db, team.owner_id)
-        
         message = f"📊 Информация о команде:\n\n"
-        message += f"<b>{team.name}</b>\n"
-        message += f"Код: <code>{team.code}</code>\n"
-        if team.description:
-            message += f"Описание: {team.description}\n"
-        message += f"Владелец: {owner.first_name or owner.username or 'Неизвестно'}\n"
-        message += f"Участников: {len(members)}\n"
-        message += f"Создана: {team.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+        message += f"<b>{team['name']}</b>\n"
+        message += f"Код: <code>{team['code']}</code>\n"
+        if team["description"]:
+            message += f"Описание: {team['description']}\n"
+        message += f"Владелец: {team['owner_name']}\n"
+        message += f"Участников: {team['members_count']}\n"
+        if team["created_at"]:
+            created_at = datetime.fromisoformat(team["created_at"])
+            message += f"Создана: {created_at.strftime('%d.%m.%Y %H:%M')}\n"
         
         await update.message.reply_text(message, parse_mode="HTML")
         break
@@ -242,29 +243,23 @@ async def team_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
     team_code = context.args[0].upper().strip()
     
     async for db in get_db():
-        team = await TeamService.get_team_by_code(db, team_code)
+        team = await TeamService.get_team_summary(db, team_code)
         if not team:
             await update.message.reply_text(f"❌ Команда с кодом '{team_code}' не найдена")
             return
         
-        members = await TeamService.get_team_members(db, team.id)
-        owner = await UserService.get_user_by_id(db, team.owner_id)
-        
-        message = f"👥 Участники команды '{team.name}':\n\n"
+        # Имена участников без загрузки полных строк User, владелец первым
+        members = await TeamService.get_team_roster(db, team["id"])
         
-        # Владелец
-        message += f"👑 {owner.first_name or owner.username or 'Неизвестно'}"
-        if owner.username:
-            message += f" (@{owner.username})"
-        message += " - Владелец\n"
+        message = f"👥 Участники команды '{team['name']}':\n\n"
         
-        # Остальные участники
         for member in members:
-            if member.id != owner.id:
-                message += f"👤 {member.first_name or member.username or 'Неизвестно'}"
-                if member.username:
-                    message += f" (@{member.username})"
-                message += "\n"
+            message += f"{'👑' if member['is_owner'] else '👤'} {member['name']}"
+            if member["username"]:
+                message += f" (@{member['username']})"
+            if member["is_owner"]:
+                message += " - Владелец"
+            message += "\n"
         
         if len(members) == 1:
             message += "\n(Только владелец)"
@@ -395,17 +390,41 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Пользователь не найден. Используй /start для регистрации")
             return
         
-        await update.message.reply_text(
-            f"📊 <b>Твоя статистика:</b>\n\n"
-            f"Пикселей размещено: {db_user.pixels_placed}\n"
-            f"Дата регистрации: {db_user.created_at.strftime('%d.%m.%Y %H:%M')}",
-            parse_mode="HTML"
+        # Всё, кроме даты регистрации, — из счётчиков Redis
+        team_id = await TeamService.get_primary_team_id(db, db_user.id)
+        user_stats = await StatsService.get_user_stats(db_user.id, team_id)
+        
+        message = "📊 <b>Твоя статистика:</b>\n\n"
+        message += f"🎨 Пикселей размещено: {user_stats['pixels_placed']}"
+        if user_stats["rank"]:
+            message += f" (место {user_stats['rank']} из {user_stats['players']})"
+        message += "\n"
+        message += f"🗺 Клеток сейчас твоих: {user_stats['cells_owned']}"
+        if user_stats["cells_rank"]:
+            message += f" (место {user_stats['cells_rank']})"
+        message += "\n"
+        if user_stats["team_rank"]:
+            message += (
+                f"👥 Команда: место {user_stats['team_rank']}, "
+                f"клеток {user_stats['team_cells']}\n"
+            )
+        message += (
+            f"🔥 Серия: {user_stats['streak_days']} дн. подряд "
+            f"(рекорд {user_stats['best_streak_days']})\n"
         )
+        if user_stats["favorite_color"]:
+            message += (
+                f"❤️ Любимый цвет: <code>{user_stats['favorite_color']}</code> "
+                f"({user_stats['favorite_color_count']} пикс.)\n"
+            )
+        message += f"\n📅 Дата регистрации: {db_user.created_at.strftime('%d.%m.%Y %H:%M')}"
+        
+        await update.message.reply_text(message, parse_mode="HTML")
         break
 
 
 # ID админа
-ADMIN_TELEGRAM_ID = 922109605
+ADMIN_TELEGRAM_ID = settings.ADMIN_TELEGRAM_ID
 
 
 def is_admin(telegram_id: int) -> bool:
@@ -427,27 +446,24 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     async for db in get_db():
         try:
-            # Статистика пользователей
-            total_users = await UserService.get_users_count(db)
-            active_users_30d = await UserService.get_active_users_count(db, days=30)
-            active_users_7d = await UserService.get_active_users_count(db, days=7)
+            # Статистика из счётчиков Redis (без COUNT по таблицам)
+            canvas_stats = await StatsService.get_canvas_stats()
+            total_users = canvas_stats["total_users"]
+            active_users_30d = canvas_stats["active_users_30d"]
+            active_users_7d = canvas_stats["active_users_7d"]
+            total_teams = canvas_stats["total_teams"]
+            total_members = canvas_stats["total_team_members"]
+            total_pixels = canvas_stats["total_pixels"]
             
-            # Статистика команд
-            total_teams = await TeamService.get_teams_count(db)
-            total_members = await TeamService.get_total_members_count(db)
-            
-            # Статистика пикселей
-            total_pixels = await PixelService.get_pixels_count(db)
-            
-            # Получаем топ пользователей по пикселям
-            from sqlalchemy import select, desc
-            from app.models.user import User
-            top_users_result = await db.execute(
-                select(User)
-                .order_by(desc(User.pixels_placed))
-                .limit(5)
+            # Топ пользователей по пикселям из лидерборда Redis
+            top = await LeaderboardService.get_top("pixels", "all", 5)
+            names = await LeaderboardService.get_names(
+                db, "pixels", [user_id for _, user_id, _ in top]
             )
-            top_users = list(top_users_result.scalars().all())
+            top_users = [
+                (names.get(user_id, "Неизвестно"), int(score))
+                for _, user_id, score in top
+            ]
             
             # Формируем сообщение
             message = "📊 <b>Статистика Pixel Battle</b>\n\n"
@@ -469,13 +485,13 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message += f"   Всего пикселей: {total_pixels}\n"
             canvas_size = settings.CANVAS_WIDTH * settings.CANVAS_HEIGHT
             coverage = (total_pixels / canvas_size * 100) if canvas_size > 0 else 0
-            message += f"   Заполнено: {coverage:.2f}%\n\n"
+            message += f"   Заполнено: {coverage:.2f}%\n"
+            message += f"   Пикселей за минуту: {canvas_stats['placements_per_minute']}\n\n"
             
             if top_users:
                 message += "🏆 <b>Топ-5 пользователей:</b>\n"
-                for i, top_user in enumerate(top_users, 1):
-                    name = top_user.first_name or top_user.username or "Неизвестно"
-                    message += f"   {i}. {name}: {top_user.pixels_placed} пикселей\n"
+                for i, (name, pixels_placed) in enumerate(top_users, 1):
+                    message += f"   {i}. {name}: {pixels_placed} пикселей\n"
             
             await update.message.reply_text(message, parse_mode="HTML")
         except Exception as e:
@@ -530,44 +546,66 @@ async def confirm_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Нет сообщения для рассылки. Используй /broadcast сначала.")
         return
     
-    await update.message.reply_text("📤 Начинаю рассылку...")
+    try:
+        job_id = await BroadcastService.create(message_text, update.effective_chat.id)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {str(e)}. Используй /broadcast_status")
+        return
+    
+    # Удаляем pending сообщение
+    context.user_data.pop('pending_broadcast', None)
     
-    async for db in get_db():
-        try:
-            # Получаем всех пользователей
-            all_users = await UserService.get_all_users(db)
-            total = len(all_users)
-            sent = 0
-            failed = 0
-            
-            for db_user in all_users:
-                try:
-                    # Отправляем сообщение через бота
-                    await context.bot.send_message(
-                        chat_id=db_user.telegram_id,
-                        text=message_text
-                    )
-                    sent += 1
-                except Exception as e:
-                    failed += 1
-                    print(f"Failed to send to {db_user.telegram_id}: {e}")
-                    # Небольшая задержка между сообщениями, чтобы не превысить лимиты
-                    await asyncio.sleep(0.05)
-            
-            # Удаляем pending сообщение
-            context.user_data.pop('pending_broadcast', None)
-            
-            await update.message.reply_text(
-                f"✅ <b>Рассылка завершена!</b>\n\n"
-                f"Всего пользователей: {total}\n"
-                f"Отправлено: {sent}\n"
-                f"Ошибок: {failed}",
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            await update.message.reply_text(f"❌ Ошибка при рассылке: {str(e)}")
-            print(f"Broadcast error: {e}")
-        break
+    # Рассылка идёт в фоне, прогресс приходит отдельным сообщением
+    BroadcastService.start(context.bot, job_id)
+    await update.message.reply_text(
+        f"📤 Рассылка #{job_id} запущена.\n"
+        f"/broadcast_status - прогресс, /stop_broadcast - остановить"
+    )
+
+
+async def broadcast_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Прогресс текущей рассылки"""
+    user = update.effective_user
+    if not user or not is_admin(user.id):
+        await update.message.reply_text("❌ У тебя нет прав для выполнения этой команды")
+        return
+    
+    job = await BroadcastService.get_active()
+    if not job:
+        await update.message.reply_text("📭 Сейчас рассылок нет")
+        return
+    
+    await update.message.reply_text(BroadcastService.format_progress(job))
+
+
+async def stop_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Остановить текущую рассылку"""
+    user = update.effective_user
+    if not user or not is_admin(user.id):
+        await update.message.reply_text("❌ У тебя нет прав для выполнения этой команды")
+        return
+    
+    job = await BroadcastService.get_active()
+    if not job or not await BroadcastService.cancel(job["id"]):
+        await update.message.reply_text("📭 Сейчас рассылок нет")
+        return
+    
+    await update.message.reply_text(f"⏹ Рассылка #{job['id']} останавливается...")
+
+
+async def resume_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Продолжить прерванную рассылку с сохранённой позиции"""
+    user = update.effective_user
+    if not user or not is_admin(user.id):
+        await update.message.reply_text("❌ У тебя нет прав для выполнения этой команды")
+        return
+    
+    job_id = await BroadcastService.resume(context.bot)
+    if not job_id:
+        await update.message.reply_text("📭 Нет прерванных рассылок")
+        return
+    
+    await update.message.reply_text(f"📤 Рассылка #{job_id} продолжена")
 
 
 async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -581,12 +619,21 @@ async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 def setup_bot():
-    """Настройка и запуск бота"""
+    """Настройка бота (запуск — app.telegram.runner)"""
     if not settings.TELEGRAM_BOT_TOKEN:
         print("⚠️  TELEGRAM_BOT_TOKEN не установлен, бот не будет запущен")
         return None
     
-    application = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).build()
+    # Обновления обрабатываются параллельно, но не больше заданного числа сразу
+    builder = (
+        Application.builder()
+        .token(settings.TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(settings.TELEGRAM_BOT_CONCURRENT_UPDATES)
+    )
+    if settings.TELEGRAM_BOT_WEBHOOK_URL:
+        # В режиме webhook обновления кладёт в очередь HTTP endpoint, Updater не нужен
+        builder = builder.updater(None)
+    application = builder.build()
     
     # Основные команды
     application.add_handler(CommandHandler("start", start))
@@ -606,6 +653,9 @@ def setup_bot():
     application.add_handler(CommandHandler("admin", admin_stats))
     application.add_handler(CommandHandler("broadcast", broadcast))
     application.add_handler(CommandHandler("confirm_broadcast", confirm_broadcast))
+    application.add_handler(CommandHandler("broadcast_status", broadcast_status))
+    application.add_handler(CommandHandler("stop_broadcast", stop_broadcast))
+    application.add_handler(CommandHandler("resume_broadcast", resume_broadcast))
     application.add_handler(CommandHandler("cancel", cancel_broadcast))
     
     return application
@@ -0,0 +1,123 @@
+"""
+Запуск Telegram бота отдельно от API
+Бот работает через webhook (если задан TELEGRAM_BOT_WEBHOOK_URL) или через polling.
+Отдельный процесс: python -m app.telegram.runner (или uvicorn app.telegram.runner:app)
+"""
+from fastapi import FastAPI, APIRouter, Request, HTTPException
+from telegram import Update
+from telegram.ext import Application
+from contextlib import asynccontextmanager
+from typing import Optional
+import hmac
+
+from app.core.config import settings
+from app.core.redis import init_redis, close_redis
+from app.services.broadcast_service import BroadcastService
+from app.telegram.bot import setup_bot
+
+router = APIRouter()
+
+# Путь, на который Telegram присылает обновления в режиме webhook
+WEBHOOK_PATH = "/telegram/webhook"
+
+# Запущенный в этом процессе бот
+bot_application: Optional[Application] = None
+
+
+async def start_bot() -> Optional[Application]:
+    """Запустить бота в текущем процессе (webhook или polling)"""
+    global bot_application
+
+    # Без секрета любой, кто знает адрес, мог бы присылать поддельные обновления
+    if settings.TELEGRAM_BOT_WEBHOOK_URL and not settings.TELEGRAM_BOT_WEBHOOK_SECRET:
+        print("❌ TELEGRAM_BOT_WEBHOOK_SECRET не задан: режим webhook без секрета не запускается")
+        return None
+
+    application = setup_bot()
+    if application is None:
+        return None
+
+    await application.initialize()
+    await application.start()
+
+    if settings.TELEGRAM_BOT_WEBHOOK_URL:
+        await application.bot.set_webhook(
+            url=settings.TELEGRAM_BOT_WEBHOOK_URL,
+            secret_token=settings.TELEGRAM_BOT_WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+        print(f"✅ Telegram бот запущен (webhook: {settings.TELEGRAM_BOT_WEBHOOK_URL})")
+    else:
+        await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        print("✅ Telegram бот запущен (polling)")
+
+    bot_application = application
+
+    # Продолжаем рассылку, прерванную перезапуском
+    job_id = await BroadcastService.resume(application.bot)
+    if job_id:
+        print(f"📤 Рассылка #{job_id} продолжена")
+
+    return application
+
+
+async def stop_bot():
+    """Остановить бота текущего процесса"""
+    global bot_application
+
+    if bot_application is None:
+        return
+
+    if bot_application.updater and bot_application.updater.running:
+        await bot_application.updater.stop()
+    await bot_application.stop()
+    await bot_application.shutdown()
+    bot_application = None
+    print("🛑 Telegram бот остановлен")
+
+
+@router.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    """
+    Приём обновлений от Telegram.
+    Обновление только ставится в очередь бота и обрабатывается в фоне
+    (не больше TELEGRAM_BOT_CONCURRENT_UPDATES одновременно), поэтому ответ мгновенный.
+    В режиме polling маршрут недоступен.
+    """
+    if bot_application is None or not settings.TELEGRAM_BOT_WEBHOOK_URL:
+        raise HTTPException(status_code=404, detail="Бот не принимает webhook в этом процессе")
+
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret.encode(), settings.TELEGRAM_BOT_WEBHOOK_SECRET.encode()):
+        raise HTTPException(status_code=403, detail="Неверный секрет webhook")
+
+    update = Update.de_json(await request.json(), bot_application.bot)
+    await bot_application.update_queue.put(update)
+    return {"ok": True}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Жизненный цикл отдельного процесса бота"""
+    await init_redis()
+    await start_bot()
+
+    yield
+
+    await stop_bot()
+    await close_redis()
+
+
+app = FastAPI(title="Pixel Battle Bot", lifespan=lifespan)
+app.include_router(router)
+
+
+@app.get("/health")
+async def health_check():
+    return {"status": "ok", "bot": bot_application is not None}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=settings.TELEGRAM_BOT_PORT)
@@ -0,0 +1,119 @@
+"""
+Бенчмарк горячих запросов: ORM select() против готовых операторов Core (app.core.queries)
+Нужна база с данными (DATABASE_URL). Запуск из каталога backend:
+    python -m benchmarks.bench_hot_queries --iterations 2000
+Для каждого запроса печатается задержка одного вызова (мкс): среднее, p50, p95, p99.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import select, and_
+
+from app.core import queries
+from app.core.database import AsyncSessionLocal, engine
+from app.models.user import User
+from app.models.pixel import Pixel
+from app.models.game import GameSession
+from app.models.team import team_members
+
+
+def percentile(samples: List[float], share: float) -> float:
+    """Перцентиль отсортированной выборки"""
+    index = min(len(samples) - 1, int(len(samples) * share))
+    return samples[index]
+
+
+async def measure(call: Callable[[], Awaitable], iterations: int, warmup: int) -> Dict[str, float]:
+    """Задержки одного вызова в микросекундах"""
+    for _ in range(warmup):
+        await call()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    samples.sort()
+    return {
+        "mean": statistics.fmean(samples),
+        "p50": percentile(samples, 0.50),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+    }
+
+
+async def main(iterations: int, warmup: int):
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User.id, User.telegram_id).limit(1))).first()
+        pixel = (await db.execute(select(Pixel.x, Pixel.y).limit(1))).first()
+        game = (await db.execute(select(GameSession.id, GameSession.code).limit(1))).first()
+        if user is None:
+            print("В базе нет пользователей — нечего измерять")
+            return
+
+        # Старый вариант (ORM: select() на каждый вызов и объекты в identity map)
+        # и новый (готовый оператор Core и строки) для каждого запроса
+        cases = {
+            "user_by_id": (
+                lambda: db.execute(select(User).where(User.id == user.id)),
+                lambda: queries.fetch_one(db, queries.USER_BY_ID, user_id=user.id),
+            ),
+            "user_by_telegram_id": (
+                lambda: db.execute(select(User).where(User.telegram_id == user.telegram_id)),
+                lambda: queries.fetch_one(db, queries.USER_BY_TELEGRAM_ID, telegram_id=user.telegram_id),
+            ),
+            "user_id_by_telegram_id": (
+                lambda: db.execute(select(User.id).where(User.telegram_id == user.telegram_id)),
+                lambda: queries.fetch_scalar(db, queries.USER_ID_BY_TELEGRAM_ID, telegram_id=user.telegram_id),
+            ),
+            "primary_team_id": (
+                lambda: db.execute(
+                    select(team_members.c.team_id)
+                    .where(team_members.c.user_id == user.id)
+                    .order_by(team_members.c.joined_at, team_members.c.team_id)
+                    .limit(1)
+                ),
+                lambda: queries.fetch_scalar(db, queries.PRIMARY_TEAM_ID, user_id=user.id),
+            ),
+        }
+        if pixel is not None:
+            cases["pixel_at"] = (
+                lambda: db.execute(select(Pixel).where(and_(Pixel.x == pixel.x, Pixel.y == pixel.y))),
+                lambda: queries.fetch_one(db, queries.PIXEL_AT, x=pixel.x, y=pixel.y),
+            )
+        if game is not None:
+            cases["game_by_id"] = (
+                lambda: db.execute(select(GameSession).where(GameSession.id == game.id)),
+                lambda: queries.fetch_one(db, queries.GAME_META_BY_ID, game_id=game.id),
+            )
+            cases["game_by_code"] = (
+                lambda: db.execute(select(GameSession).where(GameSession.code == game.code)),
+                lambda: queries.fetch_one(db, queries.GAME_META_BY_CODE, code=game.code),
+            )
+
+        async def orm_call(statement_factory):
+            result = await statement_factory()
+            result.scalars().all()
+            # Объекты ORM остаются в identity map сессии — как в обычном запросе API
+            db.expunge_all()
+
+        print(f"{'запрос':<24}{'вариант':<8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for name, (orm, core) in cases.items():
+            for label, call in (("orm", lambda: orm_call(orm)), ("core", core)):
+                stats = await measure(call, iterations, warmup)
+                print(
+                    f"{name:<24}{label:<8}"
+                    f"{stats['mean']:>10.1f}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}"
+                )
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Задержка горячих запросов: ORM против Core")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.warmup))
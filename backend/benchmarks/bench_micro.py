@@ -0,0 +1,371 @@
+"""
+Микробенчмарки горячих путей Python (без БД, Redis и сети)
+Redis и WebSocket заменены объектами в памяти процесса, поэтому измеряется только код приложения.
+Запуск из каталога backend:
+    python -m benchmarks.bench_micro                      # все замеры
+    python -m benchmarks.bench_micro -k broadcast         # только замеры с подстрокой в имени
+    python -m benchmarks.bench_micro --compare HEAD~1     # сравнить с результатом другого коммита
+Результат сохраняется в benchmarks/results/<коммит>.json (для незакоммиченных
+изменений — <коммит>-dirty.json); --compare принимает коммит или путь к файлу.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import inspect
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from array import array
+from collections import namedtuple
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Зарегистрированные замеры: имя -> функция, возвращающая замеряемый вызов
+CASES: Dict[str, Callable[[argparse.Namespace], Callable]] = {}
+
+
+def case(name: str):
+    """Зарегистрировать замер. Функция готовит данные и возвращает вызов (обычный или async)."""
+    def register(factory):
+        CASES[name] = factory
+        return factory
+    return register
+
+
+# --- Заменители внешних сервисов ---
+
+class FakeRedis:
+    """Redis в памяти процесса (только команды, нужные замеряемому коду)"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def flushall(self):
+        self.data.clear()
+
+
+class FakeWebSocket:
+    """WebSocket клиента: сериализует сообщение так же, как Starlette, но никуда не отправляет"""
+
+    def __init__(self):
+        self.sent_bytes = 0
+
+    async def send_json(self, data):
+        self.sent_bytes += len(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+
+def random_pixels(count: int) -> List[List]:
+    """Пакет [[x, y, "#RRGGBB"], ...] со случайными клетками холста"""
+    return [
+        [random.randrange(settings.CANVAS_WIDTH), random.randrange(settings.CANVAS_HEIGHT),
+         f"#{random.randrange(0x1000000):06X}"]
+        for _ in range(count)
+    ]
+
+
+# --- Замеры ---
+
+@case("auth.verify_telegram_auth")
+def bench_verify_telegram_auth(args):
+    from app.telegram.auth import verify_telegram_auth
+
+    settings.TELEGRAM_BOT_TOKEN = "123456:bench"
+    params = {
+        "auth_date": str(int(time.time())),
+        "query_id": "bench",
+        "user": json.dumps({"id": 123456789, "first_name": "Bench", "username": "bench"}),
+    }
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(params.items()))
+    secret_key = hmac.new(b"WebAppData", settings.TELEGRAM_BOT_TOKEN.encode(), hashlib.sha256).digest()
+    params["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    init_data = "&".join(f"{k}={v}" for k, v in params.items())
+
+    return lambda: verify_telegram_auth(init_data)
+
+
+@case("schemas.pixel_create")
+def bench_pixel_create(args):
+    from app.schemas.pixel import PixelCreate
+
+    body = {"x": 500, "y": 400, "color": "#FF00AA"}
+    return lambda: PixelCreate.model_validate(body)
+
+
+@case("batch.decode_json")
+def bench_batch_decode_json(args):
+    from app.schemas.pixel import PixelBatchCreate
+
+    body = json.dumps({"pixels": random_pixels(args.batch_size)}).encode()
+    return lambda: PixelBatchCreate.model_validate_json(body)
+
+
+@case("batch.decode_binary")
+def bench_batch_decode_binary(args):
+    from app.schemas.pixel import PIXEL_BATCH_RECORD, parse_pixel_batch_binary
+
+    body = b"".join(
+        PIXEL_BATCH_RECORD.pack(x, y, bytes.fromhex(color[1:]))
+        for x, y, color in random_pixels(args.batch_size)
+    )
+    return lambda: parse_pixel_batch_binary(body)
+
+
+@case("delta.encode_json_per_pixel")
+def bench_delta_json_per_pixel(args):
+    # Сообщение publish_pixel_update на каждый пиксель
+    pixels = random_pixels(args.batch_size)
+    timestamp = datetime.utcnow().isoformat()
+    return lambda: [
+        json.dumps({"x": x, "y": y, "color": color, "user_id": 1, "timestamp": timestamp})
+        for x, y, color in pixels
+    ]
+
+
+@case("delta.encode_json_batch")
+def bench_delta_json_batch(args):
+    # Одно сообщение publish_pixel_batch
+    pixels = random_pixels(args.batch_size)
+    timestamp = datetime.utcnow().isoformat()
+    return lambda: json.dumps(
+        {"type": "pixels_batch", "pixels": pixels, "user_id": 1, "timestamp": timestamp},
+        separators=(",", ":")
+    )
+
+
+@case("delta.encode_binary")
+def bench_delta_binary(args):
+    # Формат PIXEL_BATCH_RECORD (7 байт на пиксель)
+    from app.schemas.pixel import PIXEL_BATCH_RECORD
+
+    pixels = random_pixels(args.batch_size)
+    pack = PIXEL_BATCH_RECORD.pack
+    return lambda: b"".join(pack(x, y, bytes.fromhex(color[1:])) for x, y, color in pixels)
+
+
+@case("websocket.broadcast_pixel_update")
+def bench_broadcast(args):
+    from app.api import websocket
+
+    websocket.active_connections.clear()
+    websocket.active_connections.update(FakeWebSocket() for _ in range(args.sockets))
+    message = {"x": 10, "y": 20, "color": "#00FF00", "user_id": 1, "timestamp": datetime.utcnow().isoformat()}
+
+    async def call():
+        await websocket.broadcast_pixel_update(message)
+
+    return call
+
+
+@case("game.validate_sequence")
+def bench_validate_sequence(args):
+    from app.services.game_service import GameService
+
+    correct = GameService.generate_sequence(1, args.level)
+    answer = [dict(cell) for cell in correct]
+    return lambda: GameService.validate_sequence(answer, correct)
+
+
+@case("game.generate_sequence")
+def bench_generate_sequence(args):
+    from app.services.game_service import GameService
+
+    return lambda: GameService.generate_sequence(1, args.level)
+
+
+@case("raster.render_canvas_area")
+def bench_render_canvas_area(args):
+    from app.services.ai_service import AIService
+
+    Row = namedtuple("Row", "x y color")
+    side = args.area
+    pixels = [Row(x, y, f"#{random.randrange(0x1000000):06X}") for x in range(side) for y in range(side)]
+    return lambda: AIService.render_canvas_area(pixels, 0, 0, side, side, 200)
+
+
+@case("raster.territory_heatmap")
+def bench_territory_heatmap(args):
+    from app.services import territory_service
+    from app.services.canvas_store import CanvasStore
+
+    teams = array("I", (random.choice((0, 0, 1, 2, 3)) for _ in range(CanvasStore.cells_count())))
+    if sys.byteorder == "little":
+        teams.byteswap()  # Как в Redis: big-endian
+    teams_bytes = teams.tobytes()
+    redis = FakeRedis()
+
+    async def fake_get_redis():
+        return redis
+
+    async def fake_read_teams():
+        return teams_bytes
+
+    territory_service.get_redis = fake_get_redis
+    CanvasStore.read_teams = staticmethod(fake_read_teams)
+
+    async def call():
+        redis.flushall()  # Каждый вызов считает карту заново (без кеша)
+        await territory_service.TerritoryService.get_heatmap(10)
+
+    return call
+
+
+# --- Измерение ---
+
+async def _time_async(call, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await call()
+    return time.perf_counter() - started
+
+
+def _time_sync(call, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call()
+    return time.perf_counter() - started
+
+
+def measure(call: Callable, rounds: int, min_round_seconds: float) -> dict:
+    """
+    Время одного вызова (мкс) по rounds раундам.
+    Число вызовов в раунде подбирается так, чтобы раунд длился не меньше min_round_seconds.
+    """
+    is_async = inspect.iscoroutinefunction(call)
+    loop = asyncio.new_event_loop()
+
+    def timed(iterations: int) -> float:
+        if is_async:
+            return loop.run_until_complete(_time_async(call, iterations))
+        return _time_sync(call, iterations)
+
+    try:
+        timed(1)  # Прогрев
+        iterations = 1
+        while True:
+            elapsed = timed(iterations)
+            if elapsed >= min_round_seconds or iterations >= 1_000_000:
+                break
+            iterations *= 10 if elapsed < min_round_seconds / 10 else 2
+
+        samples = [timed(iterations) / iterations * 1_000_000 for _ in range(rounds)]
+    finally:
+        loop.close()
+
+    return {
+        "iterations": iterations,
+        "rounds": rounds,
+        "min_us": round(min(samples), 3),
+        "median_us": round(statistics.median(samples), 3),
+        "mean_us": round(statistics.fmean(samples), 3),
+        "stdev_us": round(statistics.stdev(samples), 3) if rounds > 1 else 0.0,
+    }
+
+
+# --- Хранение и сравнение результатов ---
+
+def git_revision() -> str:
+    """Короткий хеш текущего коммита (с пометкой -dirty при незакоммиченных изменениях)"""
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD", "--", "."]).returncode != 0
+        return f"{revision}-dirty" if dirty else revision
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_baseline(reference: str) -> Optional[dict]:
+    """Результат для сравнения: путь к файлу или коммит"""
+    if os.path.isfile(reference):
+        path = reference
+    else:
+        try:
+            revision = subprocess.check_output(
+                ["git", "rev-parse", "--short", reference], text=True, stderr=subprocess.DEVNULL
+            ).strip()
+        except (OSError, subprocess.CalledProcessError):
+            revision = reference
+        path = os.path.join(RESULTS_DIR, f"{revision}.json")
+    if not os.path.isfile(path):
+        print(f"Нет сохранённого результата для {reference} ({path})")
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих путей (без внешних сервисов)")
+    parser.add_argument("-k", "--filter", default="", help="Только замеры, в имени которых есть подстрока")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-round-seconds", type=float, default=0.2)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Пикселей в пакете (batch.*, delta.*)")
+    parser.add_argument("--sockets", type=int, default=1000, help="WebSocket клиентов при рассылке")
+    parser.add_argument("--level", type=int, default=20, help="Уровень для game.*")
+    parser.add_argument("--area", type=int, default=100, help="Сторона области для raster.render_canvas_area")
+    parser.add_argument("--compare", default=None, help="Коммит или файл результата для сравнения")
+    parser.add_argument("--no-save", action="store_true", help="Не сохранять результат")
+    args = parser.parse_args()
+
+    random.seed(0)
+    baseline = load_baseline(args.compare) if args.compare else None
+    baseline_cases = baseline["cases"] if baseline else {}
+
+    results = {}
+    print(f"{'замер':<36}{'median, мкс':>14}{'min, мкс':>12}{'±stdev':>10}{'изменение':>12}")
+    for name, factory in CASES.items():
+        if args.filter not in name:
+            continue
+        results[name] = measure(factory(args), args.rounds, args.min_round_seconds)
+        change = ""
+        if name in baseline_cases:
+            before = baseline_cases[name]["median_us"]
+            change = f"{(results[name]['median_us'] - before) / before * 100:+.1f}%"
+        print(
+            f"{name:<36}{results[name]['median_us']:>14.2f}{results[name]['min_us']:>12.2f}"
+            f"{results[name]['stdev_us']:>10.2f}{change:>12}"
+        )
+
+    if args.no_save:
+        return
+
+    revision = git_revision()
+    path = os.path.join(RESULTS_DIR, f"{revision}.json")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    # Замеры, не выбранные фильтром, сохраняются из прежнего результата этого коммита
+    if os.path.isfile(path):
+        with open(path) as f:
+            results = {**json.load(f)["cases"], **results}
+    with open(path, "w") as f:
+        json.dump({
+            "revision": revision,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}",
+            "params": {
+                "batch_size": args.batch_size,
+                "sockets": args.sockets,
+                "level": args.level,
+                "area": args.area,
+            },
+            "cases": results,
+        }, f, indent=2, ensure_ascii=False)
+    print(f"Результат: {path}")
+
+
+if __name__ == "__main__":
+    main()
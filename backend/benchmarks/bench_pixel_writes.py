@@ -0,0 +1,181 @@
+"""
+Бенчмарк записи в таблицу пикселей: старая схема (serial id + индексы id, x, y, user_id
+и уникальный (x, y)) против новой (первичный ключ (x, y), fillfactor, без лишних индексов)
+Нужна база (DATABASE_URL); создаются и в конце удаляются таблицы bench_pixels_*.
+Запуск из каталога backend:
+    python -m benchmarks.bench_pixel_writes --cells 250000 --writes 50000 --concurrency 8
+Печатается пропускная способность одиночных и пакетных upsert, доля HOT-обновлений
+и размер таблицы с индексами после прогона.
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+
+COLORS = ["#FFFFFF", "#000000", "#FF0000", "#00FF00", "#0000FF", "#FFFF00", "#FF00FF", "#00FFFF"]
+
+# Схема каждого варианта: операторы создания таблицы
+LAYOUTS = {
+    "legacy": [
+        """
+        CREATE TABLE bench_pixels_legacy (
+            id serial PRIMARY KEY,
+            x integer NOT NULL,
+            y integer NOT NULL,
+            color varchar(7) NOT NULL,
+            user_id integer NOT NULL,
+            created_at timestamptz DEFAULT now()
+        )
+        """,
+        "CREATE INDEX ix_bench_pixels_legacy_id ON bench_pixels_legacy (id)",
+        "CREATE INDEX ix_bench_pixels_legacy_x ON bench_pixels_legacy (x)",
+        "CREATE INDEX ix_bench_pixels_legacy_y ON bench_pixels_legacy (y)",
+        "CREATE INDEX ix_bench_pixels_legacy_user_id ON bench_pixels_legacy (user_id)",
+        "CREATE UNIQUE INDEX idx_bench_pixels_legacy_coords ON bench_pixels_legacy (x, y)",
+    ],
+    "keyed": [
+        """
+        CREATE TABLE bench_pixels_keyed (
+            x integer NOT NULL,
+            y integer NOT NULL,
+            color varchar(7) NOT NULL,
+            user_id integer NOT NULL,
+            created_at timestamptz DEFAULT now(),
+            PRIMARY KEY (x, y)
+        ) WITH (fillfactor = {fillfactor})
+        """,
+    ],
+}
+
+# Запись в pixels — та же, что в PixelService (PIXEL_UPSERT_SQL и BATCH_UPSERT_SQL).
+# Запись в pixel_history одинакова для обеих схем и здесь не измеряется
+UPSERT_SQL = """
+    INSERT INTO {table} (x, y, color, user_id, created_at)
+    VALUES (:x, :y, :color, :user_id, now())
+    ON CONFLICT (x, y) DO UPDATE
+    SET color = EXCLUDED.color, user_id = EXCLUDED.user_id, created_at = EXCLUDED.created_at
+"""
+
+BATCH_UPSERT_SQL = """
+    INSERT INTO {table} (x, y, color, user_id, created_at)
+    SELECT x, y, color, user_id, now()
+    FROM unnest(
+        CAST(:xs AS integer[]),
+        CAST(:ys AS integer[]),
+        CAST(:colors AS varchar[]),
+        CAST(:user_ids AS integer[])
+    ) AS batch(x, y, color, user_id)
+    ON CONFLICT (x, y) DO UPDATE
+    SET color = EXCLUDED.color, user_id = EXCLUDED.user_id, created_at = EXCLUDED.created_at
+"""
+
+STATS_SQL = """
+    SELECT n_tup_upd, n_tup_hot_upd, pg_total_relation_size(relid)
+    FROM pg_stat_user_tables WHERE relname = :table
+"""
+
+
+def random_cells(count: int, cells: int) -> List[Tuple[int, int]]:
+    """Случайные клетки из первых cells клеток холста"""
+    width = settings.CANVAS_WIDTH
+    return [divmod(random.randrange(cells), width)[::-1] for _ in range(count)]
+
+
+async def prepare(engine: AsyncEngine, layout: str, cells: int, fillfactor: int):
+    """Создать таблицу варианта и заполнить cells клеток (холст после первых часов игры)"""
+    table = f"bench_pixels_{layout}"
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        for statement in LAYOUTS[layout]:
+            await conn.execute(text(statement.format(fillfactor=fillfactor)))
+        await conn.execute(text(f"""
+            INSERT INTO {table} (x, y, color, user_id)
+            SELECT n % {settings.CANVAS_WIDTH}, n / {settings.CANVAS_WIDTH}, '#FFFFFF', 1 + n % 1000
+            FROM generate_series(0, {cells - 1}) AS n
+        """))
+        await conn.execute(text(f"ANALYZE {table}"))
+
+
+async def single_writes(engine: AsyncEngine, table: str, cells: int, writes: int, concurrency: int) -> float:
+    """Одиночные upsert в отдельных транзакциях (как размещение пикселя игроком). Строк в секунду."""
+    statement = text(UPSERT_SQL.format(table=table))
+
+    async def writer(count: int):
+        async with engine.connect() as conn:
+            for x, y in random_cells(count, cells):
+                await conn.execute(statement, {
+                    "x": x, "y": y, "color": random.choice(COLORS), "user_id": random.randint(1, 1000)
+                })
+                await conn.commit()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(writes // concurrency) for _ in range(concurrency)))
+    return (writes // concurrency) * concurrency / (time.perf_counter() - started)
+
+
+async def batch_writes(engine: AsyncEngine, table: str, cells: int, writes: int, batch_size: int) -> float:
+    """Пакетные upsert через unnest (трафареты, восстановление). Строк в секунду."""
+    statement = text(BATCH_UPSERT_SQL.format(table=table))
+    batches = max(1, writes // batch_size)
+
+    written = 0
+    started = time.perf_counter()
+    async with engine.connect() as conn:
+        for _ in range(batches):
+            # Внутри пакета клетки не повторяются (ON CONFLICT не обновляет строку дважды)
+            batch = dict.fromkeys(random_cells(batch_size, cells))
+            await conn.execute(statement, {
+                "xs": [x for x, _ in batch],
+                "ys": [y for _, y in batch],
+                "colors": [random.choice(COLORS) for _ in batch],
+                "user_ids": [random.randint(1, 1000) for _ in batch],
+            })
+            await conn.commit()
+            written += len(batch)
+    return written / (time.perf_counter() - started)
+
+
+async def main(cells: int, writes: int, concurrency: int, batch_size: int, fillfactor: int):
+    # Без пула: соединения закрываются после прогона и сбрасывают статистику в pg_stat
+    engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+    cells = min(cells, settings.CANVAS_WIDTH * settings.CANVAS_HEIGHT)
+    results = {}
+    try:
+        for layout in LAYOUTS:
+            table = f"bench_pixels_{layout}"
+            await prepare(engine, layout, cells, fillfactor)
+            single = await single_writes(engine, table, cells, writes, concurrency)
+            batch = await batch_writes(engine, table, cells, writes, batch_size)
+            results[layout] = (single, batch)
+
+        await asyncio.sleep(1)
+        print(f"{'схема':<10}{'одиночные/с':>14}{'пакетные/с':>14}{'HOT, %':>10}{'размер, МБ':>14}")
+        async with engine.connect() as conn:
+            for layout, (single, batch) in results.items():
+                table = f"bench_pixels_{layout}"
+                updated, hot, size = (await conn.execute(text(STATS_SQL), {"table": table})).one()
+                hot_share = hot / updated * 100 if updated else 0
+                print(f"{layout:<10}{single:>14.0f}{batch:>14.0f}{hot_share:>10.1f}{size / 1024 / 1024:>14.1f}")
+    finally:
+        async with engine.begin() as conn:
+            for layout in LAYOUTS:
+                await conn.execute(text(f"DROP TABLE IF EXISTS bench_pixels_{layout}"))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пропускная способность записи: старая и новая схема pixels")
+    parser.add_argument("--cells", type=int, default=250_000, help="Сколько клеток заполнено до прогона")
+    parser.add_argument("--writes", type=int, default=50_000, help="Сколько строк записать в каждом режиме")
+    parser.add_argument("--concurrency", type=int, default=8, help="Параллельных соединений для одиночных записей")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--fillfactor", type=int, default=70)
+    args = parser.parse_args()
+    asyncio.run(main(args.cells, args.writes, args.concurrency, args.batch_size, args.fillfactor))
@@ -0,0 +1,52 @@
+"""
+Рассылки: остановка рассылки, которую никто не выполняет
+Redis заменён fakeredis (Lua-скрипты выполняются через lupa).
+"""
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.core import redis as redis_module
+from app.services.broadcast_service import BroadcastService
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(redis_module, "redis_client", client)
+    monkeypatch.setattr(redis_module, "_scripts", {})
+    return client
+
+
+def test_cancel_without_runner_allows_new_broadcast(fake_redis):
+    async def scenario():
+        job_id = await BroadcastService.create("первая", admin_chat_id=1)
+        with pytest.raises(ValueError):
+            await BroadcastService.create("вторая", admin_chat_id=1)
+
+        # Выполнявший рассылку бот упал: блокировки нет
+        assert await BroadcastService.cancel(job_id)
+        assert await BroadcastService.get_active() is None
+        assert (await BroadcastService.get(job_id))["status"] == "cancelled"
+        assert await fake_redis.ttl(f"{BroadcastService.KEY_PREFIX}{job_id}") > 0
+
+        new_job_id = await BroadcastService.create("вторая", admin_chat_id=1)
+        assert (await BroadcastService.get_active())["id"] == new_job_id
+
+    asyncio.run(scenario())
+
+
+def test_cancel_with_runner_leaves_finishing_to_it(fake_redis):
+    async def scenario():
+        job_id = await BroadcastService.create("первая", admin_chat_id=1)
+        await fake_redis.set(f"{BroadcastService.LOCK_PREFIX}{job_id}", "other-node", ex=60)
+
+        assert await BroadcastService.cancel(job_id)
+        assert (await BroadcastService.get(job_id))["status"] == "cancelled"
+        # ACTIVE_KEY снимет выполняющий узел после текущей страницы
+        assert (await BroadcastService.get_active())["id"] == job_id
+        assert not await BroadcastService.cancel(job_id)
+
+    asyncio.run(scenario())
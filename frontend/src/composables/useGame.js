@@ -6,6 +6,7 @@ const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8002'
 export function useGame() {
   const game = ref(null)
   const gameWs = ref(null)
+  const matchmakingWs = ref(null)
   const isConnected = ref(false)
   const currentLevel = ref(1)
   const gridSize = ref(3)
@@ -26,13 +27,19 @@ export function useGame() {
   
   const wsListeners = []
   
-  function connectGameWebSocket(gameId, telegramId) {
+  // Ходы, ожидающие ответа сервера: move_id -> { resolve, reject }
+  const pendingMoves = new Map()
+  let lastMoveId = 0
+  
+  function connectGameWebSocket(gameId) {
     if (gameWs.value?.readyState === WebSocket.OPEN) {
       return
     }
     
     const wsUrl = API_URL.replace('http://', 'ws://').replace('https://', 'wss://')
-    const url = `${wsUrl}/ws/game/${gameId}?telegram_id=${telegramId}`
+    // Браузер не передаёт заголовки при подключении WebSocket — initData идёт в query
+    const initData = encodeURIComponent(window.Telegram?.WebApp?.initData || '')
+    const url = `${wsUrl}/ws/game/${gameId}?init_data=${initData}`
     
     try {
       gameWs.value = new WebSocket(url)
@@ -45,6 +52,9 @@ export function useGame() {
       gameWs.value.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data)
+          if ((data.type === 'pixel_placed' || data.type === 'move_rejected') && data.move_id != null) {
+            handleMoveResult(data)
+          }
           wsListeners.forEach(listener => listener(data))
         } catch (error) {
           console.error('Ошибка парсинга WebSocket сообщения:', error)
@@ -59,6 +69,8 @@ export function useGame() {
       gameWs.value.onclose = () => {
         console.log('Game WebSocket disconnected')
         isConnected.value = false
+        pendingMoves.forEach(pending => pending.reject(new Error('Соединение с игрой потеряно')))
+        pendingMoves.clear()
       }
     } catch (error) {
       console.error('Ошибка подключения Game WebSocket:', error)
@@ -184,8 +196,7 @@ export function useGame() {
         gameStatus.value = 'playing'
         
         // Подключаемся к WebSocket
-        const telegramId = window.Telegram?.WebApp?.initDataUnsafe?.user?.id || 1
-        connectGameWebSocket(response.data.id, telegramId)
+        connectGameWebSocket(response.data.id)
       } else {
         currentLevel.value = response.data.current_level
         gridSize.value = response.data.grid_size
@@ -313,57 +324,86 @@ export function useGame() {
     userSequence.value.push({ x, y })
   }
   
-  async function joinQueue() {
-    try {
-      const initData = window.Telegram?.WebApp?.initData || ''
-      const headers = {}
-      if (initData) {
-        headers['X-Telegram-Init-Data'] = initData
-      }
+  function applyMatchedGame(matchedGame, currentUserId) {
+    game.value = matchedGame
+    gridSize.value = matchedGame.grid_size || 10
+    pixelsToPlace.value = matchedGame.pixels_to_place || 5
+    
+    // Определяем, кто мы (player1 или player2) по current_user_id
+    const isPlayer1 = matchedGame.player1_id === currentUserId
+    
+    if (isPlayer1) {
+      myPixels.value = matchedGame.player1_pixels || []
+      opponentPixels.value = matchedGame.player2_pixels || []
+    } else {
+      myPixels.value = matchedGame.player2_pixels || []
+      opponentPixels.value = matchedGame.player1_pixels || []
+    }
+    
+    pixelsPlaced.value = myPixels.value.length
+    gameStatus.value = 'playing'
+    isInQueue.value = false
+    
+    // Подключаемся к WebSocket игры
+    connectGameWebSocket(matchedGame.id)
+  }
+  
+  function joinQueue() {
+    // Подключаемся к каналу подбора один раз: сервер ставит нас в очередь
+    // и сам присылает match_found, когда пара найдена (без опроса)
+    return new Promise((resolve, reject) => {
+      const wsUrl = API_URL.replace('http://', 'ws://').replace('https://', 'wss://')
+      const initData = encodeURIComponent(window.Telegram?.WebApp?.initData || '')
+      let settled = false
       
-      const response = await axios.post(
-        `${API_URL}/api/games/queue`,
-        {},
-        { headers }
-      )
+      try {
+        matchmakingWs.value = new WebSocket(`${wsUrl}/ws/matchmaking?init_data=${initData}`)
+      } catch (err) {
+        error.value = err.message
+        reject(err)
+        return
+      }
       
-      if (response.data.status === 'matched') {
-        // Нашли пару, игра создана
-        game.value = response.data.game
-        gridSize.value = response.data.game.grid_size || 10
-        pixelsToPlace.value = response.data.game.pixels_to_place || 5
-        
-        // Определяем, кто мы (player1 или player2) по current_user_id из ответа
-        const currentUserId = response.data.current_user_id
-        const isPlayer1 = response.data.game.player1_id === currentUserId
-        
-        if (isPlayer1) {
-          myPixels.value = response.data.game.player1_pixels || []
-          opponentPixels.value = response.data.game.player2_pixels || []
-        } else {
-          myPixels.value = response.data.game.player2_pixels || []
-          opponentPixels.value = response.data.game.player1_pixels || []
-        }
-        
-        pixelsPlaced.value = myPixels.value.length
-        gameStatus.value = 'playing'
-        isInQueue.value = false
-        
-        // Подключаемся к WebSocket
-        const telegramId = window.Telegram?.WebApp?.initDataUnsafe?.user?.id || 1
-        connectGameWebSocket(response.data.game.id, telegramId)
-        
-        return { matched: true, game: response.data.game, current_user_id: currentUserId }
-      } else {
-        // В очереди, ждём пару
+      matchmakingWs.value.onopen = () => {
         isInQueue.value = true
         gameStatus.value = 'waiting_queue'
-        return { matched: false, waiting: true }
       }
-    } catch (err) {
-      error.value = err.response?.data?.detail || err.message
-      throw err
-    }
+      
+      matchmakingWs.value.onmessage = (event) => {
+        try {
+          const data = JSON.parse(event.data)
+          if (data.type === 'match_found') {
+            settled = true
+            applyMatchedGame(data.game, data.current_user_id)
+            resolve({ matched: true, game: data.game, current_user_id: data.current_user_id })
+          } else if (data.type === 'queue_timeout') {
+            settled = true
+            isInQueue.value = false
+            gameStatus.value = 'idle'
+            resolve({ matched: false, timeout: true })
+          }
+        } catch (err) {
+          console.error('Ошибка парсинга сообщения подбора:', err)
+        }
+      }
+      
+      matchmakingWs.value.onerror = (err) => {
+        console.error('Matchmaking WebSocket error:', err)
+      }
+      
+      matchmakingWs.value.onclose = () => {
+        matchmakingWs.value = null
+        if (!settled) {
+          // Канал закрыт до подбора пары (выход из очереди или ошибка)
+          settled = true
+          isInQueue.value = false
+          if (gameStatus.value === 'waiting_queue') {
+            gameStatus.value = 'idle'
+          }
+          resolve({ matched: false, waiting: false })
+        }
+      }
+    })
   }
   
   async function leaveQueue() {
@@ -374,6 +414,12 @@ export function useGame() {
         headers['X-Telegram-Init-Data'] = initData
       }
       
+      // Закрытие канала подбора само снимает игрока с очереди
+      if (matchmakingWs.value) {
+        matchmakingWs.value.close()
+        matchmakingWs.value = null
+      }
+      
       await axios.post(
         `${API_URL}/api/games/queue/leave`,
         {},
@@ -388,58 +434,41 @@ export function useGame() {
     }
   }
   
-  async function placePixel(x, y, color) {
+  function handleMoveResult(data) {
+    // Ответ сервера на наш ход: подтверждение или отказ
+    const pending = pendingMoves.get(data.move_id)
+    if (!pending) {
+      return
+    }
+    pendingMoves.delete(data.move_id)
+    
+    if (data.type === 'move_rejected') {
+      error.value = data.error
+      pending.reject(new Error(data.error))
+      return
+    }
+    
+    pixelsPlaced.value = data.pixels_placed
+    myPixels.value.push({ x: data.x, y: data.y, color: data.color, timestamp: data.timestamp })
+    pending.resolve(data)
+  }
+  
+  function placePixel(x, y, color) {
     if (!game.value) {
       throw new Error('Игра не создана')
     }
     
-    try {
-      const initData = window.Telegram?.WebApp?.initData || ''
-      const headers = {}
-      if (initData) {
-        headers['X-Telegram-Init-Data'] = initData
-      }
-      
-      const response = await axios.post(
-        `${API_URL}/api/games/${game.value.id}/place-pixel`,
-        { x, y, color },
-        { headers }
-      )
-      
-      // Обновляем состояние
-      pixelsPlaced.value = response.data.pixels_placed
-      
-      // Добавляем пиксель в список
-      myPixels.value.push({ x, y, color, timestamp: Date.now() })
-      
-      // Отправляем через WebSocket оппоненту
-      sendGameMessage({
-        type: 'pixel_placed',
-        x,
-        y,
-        color,
-        timestamp: Date.now(),
-        pixels_placed: response.data.pixels_placed,
-        pixels_remaining: response.data.pixels_remaining
-      })
-      
-      // Проверяем, завершена ли игра
-      if (response.data.game_finished) {
-        gameStatus.value = 'finished'
-        winnerId.value = response.data.winner_id
-        
-        // Уведомляем оппонента
-        sendGameMessage({
-          type: 'game_finished',
-          winner_id: response.data.winner_id
-        })
-      }
-      
-      return response.data
-    } catch (err) {
-      error.value = err.response?.data?.detail || err.message
-      throw err
+    if (gameWs.value?.readyState !== WebSocket.OPEN) {
+      return Promise.reject(new Error('Нет соединения с игрой'))
     }
+    
+    // Ход отправляется через WebSocket игры; сервер проверяет его
+    // и рассылает обоим игрокам авторитетный pixel_placed
+    const moveId = ++lastMoveId
+    return new Promise((resolve, reject) => {
+      pendingMoves.set(moveId, { resolve, reject })
+      sendGameMessage({ type: 'place_pixel', move_id: moveId, x, y, color })
+    })
   }
   
   function resetGame() {
@@ -458,6 +487,10 @@ export function useGame() {
     myPixels.value = []
     isInQueue.value = false
     winnerId.value = null
+    if (matchmakingWs.value) {
+      matchmakingWs.value.close()
+      matchmakingWs.value = null
+    }
     disconnectGameWebSocket()
   }
   
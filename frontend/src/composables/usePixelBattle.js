@@ -73,6 +73,14 @@ export function usePixelBattle(canvasRef, containerRef) {
   function drawPixel(x, y, color) {
     if (!ctx.value) return
     
+    // Пустой цвет — клетка очищена (откат модератором)
+    if (!color) {
+      ctx.value.fillStyle = '#FFFFFF'
+      ctx.value.fillRect(x, y, 1, 1)
+      pixels.value.delete(`${x},${y}`)
+      return
+    }
+    
     ctx.value.fillStyle = color
     ctx.value.fillRect(x, y, 1, 1)
     
@@ -0,0 +1,397 @@
+"""
+Нагрузочный тест размещения пикселей и доставки обновлений по WebSocket
+Сценарий:
+1. Проверка, что сервер принимает подписанные initData (иначе он молча подставляет
+   тестового пользователя и тест мерил бы не то).
+2. Подключение --ws-clients клиентов к /ws в --ws-processes процессах.
+3. Размещение пикселей POST /api/pixels/ с постоянной частотой --rate (открытая модель:
+   запрос i отправляется в момент t0 + i / rate независимо от ответов сервера),
+   от имени --users игроков с подписанными initData.
+4. Каждый WebSocket клиент считает задержку размещение → доставка: запрос i ставит
+   пиксель в i-ю клетку области, поэтому по координатам из сообщения известно
+   запланированное время отправки. Задержки считаются от запланированного времени —
+   отставание генератора нагрузки тоже попадает в результат.
+Результат — JSON (--output) с перцентилями задержек HTTP и доставки.
+
+Запуск (стек из docker-compose.loadtest.yml):
+    python loadtest/run_loadtest.py --rate 200 --duration 60 --ws-clients 2000
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+COLORS = ["#FF0000", "#00FF00", "#0000FF", "#FFFF00", "#FF00FF", "#00FFFF", "#000000", "#FFFFFF"]
+
+# Telegram ID фиктивных игроков (большой сдвиг, чтобы не совпасть с настоящими)
+FAKE_TELEGRAM_ID_BASE = 7_000_000_000
+
+# Гистограмма задержек: корзины по 0.1 мс
+BUCKET_MS = 0.1
+
+
+def sign_init_data(bot_token: str, telegram_id: int, auth_date: Optional[int] = None) -> str:
+    """
+    Подписанные initData Telegram Mini App для фиктивного игрока.
+    Подпись считается так же, как её проверяет verify_telegram_auth на сервере
+    (по значениям в том виде, в каком они передаются в заголовке).
+    """
+    user = json.dumps(
+        {"id": telegram_id, "first_name": f"Load{telegram_id % 100000}", "username": f"load_{telegram_id}"},
+        separators=(",", ":")
+    )
+    params = {
+        "auth_date": str(auth_date or int(time.time())),
+        "query_id": f"loadtest{telegram_id}",
+        "user": user,
+    }
+    data_check_string = "\n".join(f"{key}={value}" for key, value in sorted(params.items()))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    params["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return "&".join(f"{key}={value}" for key, value in params.items())
+
+
+def record(histogram: Counter, latency_seconds: float):
+    """Добавить задержку в гистограмму"""
+    histogram[max(0, int(latency_seconds * 1000 / BUCKET_MS))] += 1
+
+
+def summarize(histogram: Counter) -> Dict[str, float]:
+    """Перцентили задержки (мс) по гистограмме"""
+    total = sum(histogram.values())
+    if not total:
+        return {"count": 0}
+
+    buckets = sorted(histogram.items())
+    summary = {
+        "count": total,
+        "mean": round(sum(bucket * count for bucket, count in buckets) * BUCKET_MS / total, 2),
+        "max": round(buckets[-1][0] * BUCKET_MS, 2),
+    }
+    targets = [("p50", 0.50), ("p90", 0.90), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999)]
+    seen = 0
+    for bucket, count in buckets:
+        seen += count
+        while targets and seen >= total * targets[0][1]:
+            summary[targets.pop(0)[0]] = round(bucket * BUCKET_MS, 2)
+    return summary
+
+
+class Region:
+    """Область холста: запрос i ставит пиксель в i-ю клетку (построчно)"""
+
+    def __init__(self, x: int, y: int, width: int, height: int):
+        self.x, self.y, self.width, self.height = x, y, width, height
+
+    @property
+    def size(self) -> int:
+        return self.width * self.height
+
+    def cell(self, index: int):
+        return self.x + index % self.width, self.y + index // self.width
+
+    def index(self, x: int, y: int) -> Optional[int]:
+        if not (self.x <= x < self.x + self.width and self.y <= y < self.y + self.height):
+            return None
+        return (y - self.y) * self.width + (x - self.x)
+
+
+# --- WebSocket клиенты (отдельные процессы) ---
+
+async def ws_process_main(args: dict, clients: int, ready, start_time, stop, results):
+    """Клиенты одного процесса: подключение, приём обновлений, гистограмма задержек доставки"""
+    region = Region(args["region_x"], args["region_y"], args["region_width"], args["region_height"])
+    rate = args["rate"]
+    delivery = Counter()
+    connect = Counter()
+    stats = {"connected": 0, "connect_failed": 0, "received": 0, "disconnected": 0}
+    connections = []
+
+    async def open_client():
+        started = time.perf_counter()
+        try:
+            connection = await websockets.connect(
+                args["ws_url"], open_timeout=30, ping_interval=None, max_size=2 ** 20
+            )
+        except Exception:
+            stats["connect_failed"] += 1
+            return
+        record(connect, time.perf_counter() - started)
+        stats["connected"] += 1
+        connections.append(connection)
+
+    # Подключение с ограниченной скоростью, чтобы не мерить шторм подключений
+    for offset in range(0, clients, args["ws_connect_batch"]):
+        await asyncio.gather(*(open_client() for _ in range(min(args["ws_connect_batch"], clients - offset))))
+
+    async def listen(connection):
+        try:
+            async for raw in connection:
+                received_at = time.time()
+                t0 = start_time.value
+                if not t0:
+                    continue
+                try:
+                    message = json.loads(raw)
+                    index = region.index(message["x"], message["y"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if index is None:
+                    continue
+                stats["received"] += 1
+                record(delivery, received_at - (t0 + index / rate))
+        except websockets.ConnectionClosed:
+            stats["disconnected"] += 1
+
+    listeners = [asyncio.create_task(listen(connection)) for connection in connections]
+    ready.put(stats["connected"])
+
+    while not stop.is_set():
+        await asyncio.sleep(0.2)
+
+    for task in listeners:
+        task.cancel()
+    await asyncio.gather(*listeners, return_exceptions=True)
+    await asyncio.gather(*(connection.close() for connection in connections), return_exceptions=True)
+    results.put({"stats": stats, "delivery": dict(delivery), "connect": dict(connect)})
+
+
+def ws_process(args: dict, clients: int, ready, start_time, stop, results):
+    asyncio.run(ws_process_main(args, clients, ready, start_time, stop, results))
+
+
+# --- Генератор размещений ---
+
+async def check_auth(client: httpx.AsyncClient, init_data: str, telegram_id: int):
+    """Сервер должен принять подпись (иначе он подставляет тестового пользователя)"""
+    response = await client.get("/api/users/me", headers={"X-Telegram-Init-Data": init_data})
+    response.raise_for_status()
+    if response.json().get("telegram_id") != telegram_id:
+        raise SystemExit(
+            "Сервер не принял initData: TELEGRAM_BOT_TOKEN стенда и --bot-token должны совпадать"
+        )
+
+
+async def warm_up_users(client: httpx.AsyncClient, init_data: List[str], concurrency: int):
+    """Создать игроков заранее, чтобы первая регистрация не попала в замер"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def touch(value: str):
+        async with semaphore:
+            await client.get("/api/users/me", headers={"X-Telegram-Init-Data": value})
+
+    await asyncio.gather(*(touch(value) for value in init_data))
+
+
+async def drive_placements(client: httpx.AsyncClient, args: dict, init_data: List[str], t0: float) -> dict:
+    """Размещения с постоянной частотой; возвращает статистику HTTP"""
+    region = Region(args["region_x"], args["region_y"], args["region_width"], args["region_height"])
+    total = int(args["rate"] * args["duration"])
+    in_flight = asyncio.Semaphore(args["max_in_flight"])
+    latency = Counter()  # От запланированного момента до ответа
+    service = Counter()  # От фактической отправки до ответа
+    statuses = Counter()
+    skipped = 0
+    tasks = []
+
+    async def place(index: int, scheduled: float):
+        x, y = region.cell(index)
+        started = time.time()
+        try:
+            response = await client.post(
+                "/api/pixels/",
+                json={"x": x, "y": y, "color": random.choice(COLORS)},
+                headers={"X-Telegram-Init-Data": init_data[index % len(init_data)]},
+            )
+            statuses[str(response.status_code)] += 1
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+        finally:
+            finished = time.time()
+            record(latency, finished - scheduled)
+            record(service, finished - started)
+            in_flight.release()
+
+    for index in range(total):
+        scheduled = t0 + index / args["rate"]
+        delay = scheduled - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if in_flight.locked():
+            # Сервер не успевает: запрос не отправляется, клетка не будет доставлена
+            skipped += 1
+            continue
+        await in_flight.acquire()
+        tasks.append(asyncio.create_task(place(index, scheduled)))
+
+    await asyncio.gather(*tasks)
+    elapsed = time.time() - t0
+    ok = statuses.get("201", 0)
+    return {
+        "planned": total,
+        "sent": total - skipped,
+        "skipped_over_max_in_flight": skipped,
+        "ok": ok,
+        "statuses": dict(statuses),
+        "achieved_rps": round(ok / elapsed, 1) if elapsed else 0,
+        "latency_ms": summarize(latency),
+        "service_time_ms": summarize(service),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    config = {key: value for key, value in vars(args).items() if key != "bot_token"}
+    total = int(args.rate * args.duration)
+    region = Region(args.region_x, args.region_y, args.region_width, args.region_height)
+    if total > region.size:
+        raise SystemExit(f"rate * duration = {total} больше числа клеток области ({region.size})")
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        timeout=args.http_timeout,
+        limits=httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight),
+    ) as client:
+        # Стенд поднят
+        for _ in range(60):
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(1)
+        else:
+            raise SystemExit(f"{args.base_url}/health не отвечает")
+
+        telegram_ids = [FAKE_TELEGRAM_ID_BASE + index for index in range(args.users)]
+        init_data = [sign_init_data(args.bot_token, telegram_id) for telegram_id in telegram_ids]
+        await check_auth(client, init_data[0], telegram_ids[0])
+        print(f"Подготовка {args.users} игроков...")
+        await warm_up_users(client, init_data, min(args.max_in_flight, 50))
+
+        # WebSocket клиенты в отдельных процессах (один процесс не успевает разбирать рассылку)
+        context = multiprocessing.get_context("spawn")
+        ready, results = context.Queue(), context.Queue()
+        start_time = context.Value("d", 0.0)
+        stop = context.Event()
+        shared = dict(config)
+        processes = []
+        per_process = [
+            args.ws_clients // args.ws_processes + (1 if index < args.ws_clients % args.ws_processes else 0)
+            for index in range(args.ws_processes)
+        ]
+        for clients in per_process:
+            if clients:
+                process = context.Process(
+                    target=ws_process, args=(shared, clients, ready, start_time, stop, results)
+                )
+                process.start()
+                processes.append(process)
+
+        connected = 0
+        for _ in processes:
+            connected += await asyncio.to_thread(ready.get)
+        print(f"WebSocket клиентов подключено: {connected} из {args.ws_clients}")
+
+        print(f"Размещение: {args.rate}/с в течение {args.duration} с...")
+        t0 = time.time() + 1
+        start_time.value = t0
+        http = await drive_placements(client, config, init_data, t0)
+
+        # Последние обновления ещё в пути
+        await asyncio.sleep(args.drain)
+        stop.set()
+
+        delivery, connect = Counter(), Counter()
+        ws_stats = Counter()
+        for _ in processes:
+            part = await asyncio.to_thread(results.get)
+            ws_stats.update(part["stats"])
+            delivery.update({int(bucket): count for bucket, count in part["delivery"].items()})
+            connect.update({int(bucket): count for bucket, count in part["connect"].items()})
+        for process in processes:
+            process.join()
+
+    expected = http["ok"] * ws_stats["connected"]
+    return {
+        "started_at": datetime.fromtimestamp(t0, timezone.utc).isoformat(),
+        "config": config,
+        "http": http,
+        "websocket": {
+            "clients": args.ws_clients,
+            "connected": ws_stats["connected"],
+            "connect_failed": ws_stats["connect_failed"],
+            "disconnected": ws_stats["disconnected"],
+            "connect_ms": summarize(connect),
+            "expected_deliveries": expected,
+            "received": ws_stats["received"],
+            "delivery_ratio": round(ws_stats["received"] / expected, 4) if expected else 0,
+            "delivery_latency_ms": summarize(delivery),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест размещения пикселей и WebSocket рассылки")
+    parser.add_argument("--base-url", default=os.getenv("LOADTEST_BASE_URL", "http://localhost:8001"))
+    parser.add_argument("--ws-url", default=os.getenv("LOADTEST_WS_URL", "ws://localhost:8001/ws"))
+    parser.add_argument("--bot-token", default=os.getenv("LOADTEST_BOT_TOKEN", "123456:loadtest"),
+                        help="TELEGRAM_BOT_TOKEN стенда (им подписываются initData)")
+    parser.add_argument("--rate", type=float, default=100, help="Размещений в секунду")
+    parser.add_argument("--duration", type=float, default=60, help="Длительность, секунд")
+    parser.add_argument("--users", type=int, default=500, help="Фиктивных игроков")
+    parser.add_argument("--ws-clients", type=int, default=1000)
+    parser.add_argument("--ws-processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--ws-connect-batch", type=int, default=100, help="Одновременных подключений при старте")
+    parser.add_argument("--max-in-flight", type=int, default=500, help="Максимум незавершённых HTTP запросов")
+    parser.add_argument("--http-timeout", type=float, default=30)
+    parser.add_argument("--drain", type=float, default=5, help="Ожидание доставки после последнего запроса, секунд")
+    parser.add_argument("--region-x", type=int, default=0)
+    parser.add_argument("--region-y", type=int, default=0)
+    parser.add_argument("--region-width", type=int, default=1000)
+    parser.add_argument("--region-height", type=int, default=1000)
+    parser.add_argument("--output", default=None, help="Файл JSON с результатами (по умолчанию loadtest/results/)")
+    parser.add_argument("--fail-p99-ms", type=float, default=None,
+                        help="Код выхода 1, если p99 задержки доставки больше порога")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        f"loadtest-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    http, ws = result["http"], result["websocket"]
+    print(json.dumps({
+        "achieved_rps": http["achieved_rps"],
+        "http_ok": f"{http['ok']}/{http['planned']}",
+        "http_p99_ms": http["latency_ms"].get("p99"),
+        "ws_connected": ws["connected"],
+        "delivery_ratio": ws["delivery_ratio"],
+        "delivery_p50_ms": ws["delivery_latency_ms"].get("p50"),
+        "delivery_p99_ms": ws["delivery_latency_ms"].get("p99"),
+    }, indent=2))
+    print(f"Результаты: {output}")
+
+    p99 = ws["delivery_latency_ms"].get("p99")
+    if args.fail_p99_ms is not None and (p99 is None or p99 > args.fail_p99_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()